@@ -0,0 +1,195 @@
+"""In-memory audio extraction shared by all ASR backends.
+
+`extract_audio_ffmpeg` writes a WAV that every backend then re-opens and re-decodes.
+`extract_audio_pcm` instead pipes mono 16-bit PCM from ffmpeg (audio stream only) into a
+read-only `AudioBuffer`. Backends read that buffer directly: float32 samples for
+Whisper / wav2vec2 / Silero, zero-copy byte slices for Vosk. A WAV is only written when
+something actually needs a file (`ensure_wav`).
+
+Buffers can be handed to worker processes through shared memory (`share` / `attach`).
+"""
+from pathlib import Path
+from typing import Any, Dict, Optional
+import os
+import subprocess
+import tempfile
+import uuid
+import wave
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+try:
+    from multiprocessing import shared_memory
+except Exception:
+    shared_memory = None
+
+
+class AudioBuffer:
+    """Read-only mono int16 PCM.
+
+    `data` is any buffer-protocol object (bytes, a shared memory block, ...); it is never
+    copied. Slicing with `slice()` returns views over the same memory.
+    """
+
+    def __init__(self, data, sample_rate: int = 16000, wav_dir: Optional[Path] = None, name: str = 'audio',
+                 offset: int = 0, num_samples: Optional[int] = None):
+        self._data = data
+        self.sample_rate = sample_rate
+        self.wav_dir = Path(wav_dir) if wav_dir else None
+        self.name = name
+        self.offset = offset
+        total = len(memoryview(data)) // 2
+        self.num_samples = (total - offset) if num_samples is None else num_samples
+        self._float32 = None
+        self._wav_path: Optional[Path] = None
+        self._wav_is_temp = False
+        self._shm = None
+
+    @property
+    def duration(self) -> float:
+        return self.num_samples / float(self.sample_rate)
+
+    def pcm_bytes(self, start: int = 0, end: Optional[int] = None) -> memoryview:
+        """Zero-copy view of samples `[start, end)` as little-endian int16 bytes."""
+        end = self.num_samples if end is None else min(end, self.num_samples)
+        start = max(0, min(start, end))
+        view = memoryview(self._data).cast('B')
+        return view[(self.offset + start) * 2:(self.offset + end) * 2]
+
+    def samples(self):
+        """Read-only int16 numpy view of the buffer."""
+        if np is None:
+            raise RuntimeError('numpy is required for in-memory audio')
+        arr = np.frombuffer(self._data, dtype='<i2', count=self.num_samples, offset=self.offset * 2)
+        arr.flags.writeable = False
+        return arr
+
+    def as_float32(self):
+        """Samples scaled to [-1, 1] as float32, computed once and cached read-only."""
+        if self._float32 is None:
+            arr = self.samples().astype(np.float32) / 32768.0
+            arr.flags.writeable = False
+            self._float32 = arr
+        return self._float32
+
+    def slice(self, start_s: float, end_s: Optional[float] = None) -> 'AudioBuffer':
+        """View of the time range `[start_s, end_s)` without copying samples."""
+        start = max(0, int(round(start_s * self.sample_rate)))
+        end = self.num_samples if end_s is None else min(self.num_samples, int(round(end_s * self.sample_rate)))
+        end = max(start, end)
+        # a slice is never the editor's audio, so any WAV it needs goes to a temp file
+        return AudioBuffer(self._data, self.sample_rate, wav_dir=None, name=self.name,
+                           offset=self.offset + start, num_samples=end - start)
+
+    def write_wav(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with wave.open(str(path), 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(self.sample_rate)
+            wf.writeframes(self.pcm_bytes())
+        return path
+
+    def ensure_wav(self) -> Path:
+        """Materialize the buffer as a WAV (once), for consumers that only accept files.
+
+        Without a `wav_dir` the file is temporary; `discard_wav()` removes it.
+        """
+        if self._wav_path is None or not self._wav_path.exists():
+            if self.wav_dir is not None:
+                self._wav_path = self.write_wav(self.wav_dir / f'{self.name}_{uuid.uuid4().hex[:8]}.wav')
+            else:
+                fd, tmp = tempfile.mkstemp(prefix=f'{self.name}_', suffix='.wav')
+                os.close(fd)
+                self._wav_path = self.write_wav(Path(tmp))
+                self._wav_is_temp = True
+        return self._wav_path
+
+    def discard_wav(self) -> None:
+        if self._wav_is_temp and self._wav_path is not None:
+            try:
+                self._wav_path.unlink()
+            except OSError:
+                pass
+            self._wav_path = None
+            self._wav_is_temp = False
+
+    # -- sharing across processes ---------------------------------------
+
+    def share(self) -> Dict[str, Any]:
+        """Copy the PCM once into shared memory and return a picklable descriptor for `attach`."""
+        if shared_memory is None:
+            raise RuntimeError('multiprocessing.shared_memory is unavailable')
+        if self._shm is None:
+            pcm = self.pcm_bytes()
+            shm = shared_memory.SharedMemory(create=True, size=max(len(pcm), 1))
+            shm.buf[:len(pcm)] = pcm
+            self._shm = shm
+        return {
+            'shm': self._shm.name,
+            'sample_rate': self.sample_rate,
+            'offset': 0,
+            'num_samples': self.num_samples,
+            'wav_dir': str(self.wav_dir) if self.wav_dir else None,
+            'name': self.name,
+        }
+
+    def share_slice(self, start_s: float, end_s: float) -> Dict[str, Any]:
+        """Descriptor for the time range `[start_s, end_s)` of the shared block (see `share`)."""
+        descriptor = self.share()
+        start = max(0, int(round(start_s * self.sample_rate)))
+        end = min(self.num_samples, int(round(end_s * self.sample_rate)))
+        descriptor.update(offset=start, num_samples=max(0, end - start), wav_dir=None)
+        return descriptor
+
+    def release(self) -> None:
+        """Free the shared memory block created by `share` (owner side)."""
+        if self._shm is not None:
+            try:
+                self._shm.close()
+                self._shm.unlink()
+            except Exception:
+                pass
+            self._shm = None
+
+    @classmethod
+    def attach(cls, descriptor: Dict[str, Any]) -> 'AudioBuffer':
+        """Open a buffer shared by another process. Call `detach()` when done."""
+        # spawned workers share the parent's resource tracker, which already tracks the
+        # block; the creating process unlinks it in `release()`
+        shm = shared_memory.SharedMemory(name=descriptor['shm'])
+        buf = cls(shm.buf, descriptor['sample_rate'], wav_dir=descriptor.get('wav_dir'),
+                  name=descriptor.get('name', 'audio'), offset=descriptor.get('offset', 0),
+                  num_samples=descriptor['num_samples'])
+        buf._attached = shm
+        return buf
+
+    def detach(self) -> None:
+        shm = getattr(self, '_attached', None)
+        if shm is None:
+            return
+        self.discard_wav()
+        self._float32 = None
+        self._data = None
+        try:
+            shm.close()
+        except BufferError:
+            # a numpy view is still alive somewhere; the mapping goes away with the process
+            pass
+        self._attached = None
+
+
+def extract_audio_pcm(video_path: Path, sample_rate: int = 16000, wav_dir: Optional[Path] = None) -> AudioBuffer:
+    """Decode the audio stream of `video_path` to mono int16 PCM in memory."""
+    command = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-i', str(video_path),
+        '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1'
+    ]
+    completed = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.decode('utf-8', errors='ignore'))
+    return AudioBuffer(completed.stdout, sample_rate, wav_dir=wav_dir, name=Path(video_path).stem)
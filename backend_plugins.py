@@ -0,0 +1,170 @@
+"""Backend plugins: cheap discovery and lazy imports of the heavy ML packages.
+
+`generate_subtitles` used to import torch, whisper, transformers and NeMo at module load.
+`web/app.py` imports it, and so does every CLI and every spawned backend worker, so each of
+them paid tens of seconds and hundreds of MB even for a Vosk-only job. Each ASR and
+translation backend is now a `BackendPlugin` that names the packages it needs.
+`available()` asks `importlib.util.find_spec` (the check the index page already did),
+which locates a package without importing it. The packages themselves are `LazyModule`
+proxies that import on first attribute access, i.e. when a model is loaded or run.
+
+Extra backends can live outside this repository: list their modules in
+`SUBTITLE_BACKEND_PLUGINS` (comma-separated) and have each call `register_backend()` at
+import time. They are then offered next to the built-in ones.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+
+# packages that must not be imported just by loading the app (see `pipeline_bench.py --stages startup`)
+HEAVY_MODULES = ('torch', 'whisper', 'transformers', 'nemo', 'vosk', 'tensorflow')
+
+_spec_cache: Dict[str, bool] = {}
+
+
+def module_available(name: str) -> bool:
+    """Whether the top-level package of `name` is installed, without importing it."""
+    # find_spec('a.b') imports `a`; only the top-level lookup is free
+    top = name.partition('.')[0]
+    if top not in _spec_cache:
+        try:
+            _spec_cache[top] = importlib.util.find_spec(top) is not None
+        except (ImportError, ValueError):
+            _spec_cache[top] = False
+    return _spec_cache[top]
+
+
+def imported(name: str) -> bool:
+    """Whether `name` has already been imported by someone in this process."""
+    return sys.modules.get(name) is not None
+
+
+def heavy_modules_loaded() -> List[str]:
+    return [name for name in HEAVY_MODULES if imported(name)]
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    A failed import is remembered: `available()` turns False and every later access raises
+    the original `ImportError` instead of retrying the (slow) import. Its own attributes are
+    private (bar `available`) so they cannot hide the module's, e.g. `torch.load`.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._error: Optional[ImportError] = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None and self._error is None:
+                    try:
+                        self._module = importlib.import_module(self._name)
+                    except Exception as exc:
+                        self._error = exc if isinstance(exc, ImportError) else ImportError(f'{self._name}: {exc}')
+                if self._error is not None:
+                    raise self._error
+        return self._module
+
+    def available(self) -> bool:
+        if self._module is not None:
+            return True
+        return self._error is None and module_available(self._name)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'failed' if self._error else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+_lazy: Dict[str, LazyModule] = {}
+
+
+def lazy_module(name: str) -> LazyModule:
+    """The shared `LazyModule` for `name`."""
+    module = _lazy.get(name)
+    if module is None:
+        module = _lazy.setdefault(name, LazyModule(name))
+    return module
+
+
+class BackendPlugin:
+    """One ASR (`kind='asr'`) or translation (`kind='translation'`) backend.
+
+    `transcribe(audio, audio_duration, check_cancelled=None, on_segments=None)` returns a
+    `SegmentStore`; `loader(**params)` builds the model kept warm by `model_registry`.
+    `shardable` backends may be split into silence-bounded shards. A composite backend
+    (e.g. `cascade`) has no model of its own; `uses()` names the backends it runs, which
+    must be available too and are what gets prewarmed.
+    """
+
+    def __init__(self, name: str, kind: str, requires: Tuple[str, ...] = (), label: Optional[str] = None,
+                 transcribe: Optional[Callable] = None, loader: Optional[Callable[..., Any]] = None,
+                 sizer: Optional[Callable[[Any], int]] = None, shardable: bool = False,
+                 start_message: Optional[str] = None, uses: Optional[Callable[[], List[str]]] = None):
+        self.name = name
+        self.kind = kind
+        self.requires = tuple(requires)
+        self.label = label or name
+        self.transcribe = transcribe
+        self.loader = loader
+        self.sizer = sizer
+        self.shardable = shardable
+        self.start_message = start_message
+        self.uses = uses
+
+    def available(self) -> bool:
+        if not all(module_available(name) for name in self.requires):
+            return False
+        if self.uses is None:
+            return True
+        return all(_plugins.get(name) is not None and _plugins[name].available() for name in self.uses())
+
+    def __repr__(self) -> str:
+        return f'<{self.kind} backend {self.name!r}>'
+
+
+_plugins: Dict[str, BackendPlugin] = {}
+_plugins_lock = threading.Lock()
+
+
+def register_backend(name: str, kind: str = 'asr', requires: Tuple[str, ...] = (), **options) -> BackendPlugin:
+    """Declare a backend (replacing one of the same name) and register its model loader."""
+    plugin = BackendPlugin(name, kind, requires, **options)
+    with _plugins_lock:
+        _plugins[name] = plugin
+    if plugin.loader is not None:
+        from model_registry import registry as model_registry
+        model_registry.register(name, plugin.loader, plugin.sizer)
+    return plugin
+
+
+def get_backend(name: str) -> Optional[BackendPlugin]:
+    return _plugins.get(name)
+
+
+def backends(kind: Optional[str] = None) -> List[BackendPlugin]:
+    """Registered backends in registration order, optionally only those of `kind`."""
+    with _plugins_lock:
+        return [p for p in _plugins.values() if kind is None or p.kind == kind]
+
+
+def load_external_plugins() -> Dict[str, str]:
+    """Import the modules listed in `SUBTITLE_BACKEND_PLUGINS`. Returns `{module: 'ok' | error}`."""
+    results = {}
+    for module in [m.strip() for m in os.environ.get('SUBTITLE_BACKEND_PLUGINS', '').split(',') if m.strip()]:
+        try:
+            importlib.import_module(module)
+            results[module] = 'ok'
+        except Exception as exc:
+            results[module] = f'{type(exc).__name__}: {exc}'
+            print(f'Backend plugin {module} failed to load: {results[module]}')
+    return results
@@ -0,0 +1,351 @@
+"""Batch transcription of whole directories with pipelined stages.
+
+    python batch_subtitles.py videos/ --model whisper --lang de --lang fr
+    python batch_subtitles.py videos/ --extract-workers 2 --asr-workers 1 --translate-workers 2 --prefetch 3
+    python batch_subtitles.py videos/subtitles_batch.json     # resume an interrupted batch
+
+Every file goes through `generate_subtitles` in this one process, so the models loaded by the
+first file stay warm in `model_registry` for the rest. Files are started in order and pass
+through three gated stages, `extract` (hashing and ffmpeg decoding), `asr` and `translate`
+(translation and writing the outputs). Each stage has its own concurrency limit
+(`StageGates`). While one file is being transcribed, the next `--prefetch` files are being
+decoded and the previous one is being translated. Decoded audio waits in memory for its
+`asr` slot, about 115 MB per hour of audio.
+
+Progress is kept in a JSON manifest (default `<directory>/subtitles_batch.json`), rewritten
+after every file. Running the command again, with the directory or the manifest itself,
+skips finished files and retries the others. A file whose size or modification time changed
+is transcribed again, and so is everything when the model, languages or preset change. Outputs
+go to `output/<video>/` under the current directory, as from the web app. Two inputs with
+the same file name would overwrite each other's outputs, so the later one is marked as a
+`conflict` instead.
+
+At the end (or on Ctrl-C) a throughput report is printed: audio seconds per wall second,
+files per hour, and for every stage its busy time, its utilization and how long files
+waited for it (a stage that others wait on is the bottleneck).
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import quantization
+from subtitle_catalog import VIDEO_EXTS
+
+MEDIA_EXTS = VIDEO_EXTS + ('.wav', '.mp3', '.m4a', '.flac', '.ogg', '.opus')
+STAGES = ('extract', 'asr', 'translate')
+MANIFEST_NAME = 'subtitles_batch.json'
+MANIFEST_VERSION = 1
+
+
+class StageGates:
+    """Concurrency limit per pipeline stage, shared by all the jobs of a batch.
+
+    Passed to `generate_subtitles` as `stage_gate`. Also measures how long jobs held and
+    waited for each stage. Once `stop` is set, jobs waiting for a slot raise `JobCancelled`.
+    """
+
+    def __init__(self, limits: Dict[str, int], stop: Optional[threading.Event] = None):
+        self.limits = {stage: max(1, int(n)) for stage, n in limits.items()}
+        self.stop = stop or threading.Event()
+        self._sems = {stage: threading.Semaphore(n) for stage, n in self.limits.items()}
+        self._lock = threading.Lock()
+        self._since: Dict[Any, float] = {}
+        self.busy_s = {stage: 0.0 for stage in self.limits}
+        self.wait_s = {stage: 0.0 for stage in self.limits}
+
+    def acquire(self, stage: str) -> None:
+        sem = self._sems.get(stage)
+        if sem is None:
+            return
+        began = time.perf_counter()
+        while not sem.acquire(timeout=0.5):
+            if self.stop.is_set():
+                from generate_subtitles import JobCancelled
+                raise JobCancelled('batch stopped')
+        now = time.perf_counter()
+        with self._lock:
+            self.wait_s[stage] += now - began
+            self._since[(threading.get_ident(), stage)] = now
+
+    def release(self, stage: str) -> None:
+        sem = self._sems.get(stage)
+        if sem is None:
+            return
+        with self._lock:
+            since = self._since.pop((threading.get_ident(), stage), None)
+            if since is not None:
+                self.busy_s[stage] += time.perf_counter() - since
+        sem.release()
+
+
+def discover(directory: Path, recursive: bool = True) -> List[Path]:
+    """Media files under `directory`, sorted by path."""
+    pattern = '**/*' if recursive else '*'
+    return sorted(p for p in Path(directory).glob(pattern) if p.is_file() and p.suffix.lower() in MEDIA_EXTS)
+
+
+def _signature(path: Path) -> Dict[str, Any]:
+    st = path.stat()
+    return {'size': st.st_size, 'mtime': int(st.st_mtime)}
+
+
+class BatchManifest:
+    """Per-file state of a batch, saved atomically as JSON after every change."""
+
+    def __init__(self, path: Path, settings: Optional[Dict[str, Any]] = None,
+                 entries: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.path = Path(path)
+        self.settings = settings or {}
+        self.entries: Dict[str, Dict[str, Any]] = entries or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> 'BatchManifest':
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        data = json.loads(path.read_text(encoding='utf-8'))
+        return cls(path, data.get('settings'), {e['path']: e for e in data.get('files', [])})
+
+    def save(self) -> None:
+        with self._lock:
+            data = {'version': MANIFEST_VERSION, 'settings': self.settings,
+                    'files': list(self.entries.values())}
+            tmp = self.path.with_name(self.path.name + '.tmp')
+            tmp.write_text(json.dumps(data, indent=1), encoding='utf-8')
+            os.replace(tmp, self.path)
+
+    def configure(self, settings: Dict[str, Any]) -> bool:
+        """Adopt `settings`; True (and every file reset to pending) if they differ from the saved ones."""
+        changed = bool(self.settings) and self.settings != settings
+        with self._lock:
+            self.settings = dict(settings)
+            if changed:
+                for entry in self.entries.values():
+                    if entry['state'] != 'conflict':
+                        entry['state'] = 'pending'
+        return changed
+
+    def add(self, paths: Iterable[Path]) -> int:
+        """Add files not listed yet; returns how many were new."""
+        added = 0
+        with self._lock:
+            stems = {Path(e['path']).stem: e['path'] for e in self.entries.values() if e['state'] != 'conflict'}
+            for path in paths:
+                key = str(Path(path).resolve())
+                if key in self.entries:
+                    continue
+                entry = {'path': key, 'state': 'pending', 'srt_paths': [], 'errors': []}
+                owner = stems.setdefault(Path(key).stem, key)
+                if owner != key:
+                    entry.update(state='conflict', errors=[f'output name clashes with {owner}'])
+                self.entries[key] = entry
+                added += 1
+        return added
+
+    def update(self, key: str, **fields) -> None:
+        with self._lock:
+            self.entries[key].update(fields)
+        self.save()
+
+    def todo(self, retry_failed: bool = True) -> List[Dict[str, Any]]:
+        """Entries still to transcribe, in manifest order."""
+        out = []
+        with self._lock:
+            for entry in self.entries.values():
+                path = Path(entry['path'])
+                if entry['state'] == 'conflict':
+                    continue
+                if not path.exists():
+                    entry.update(state='error', errors=['file not found'])
+                    continue
+                changed = {k: entry.get(k) for k in ('size', 'mtime')} != _signature(path)
+                if entry['state'] == 'done' and not changed:
+                    continue
+                if entry['state'] == 'error' and not retry_failed and not changed:
+                    continue
+                out.append(entry)
+        return out
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for entry in self.entries.values():
+                counts[entry['state']] = counts.get(entry['state'], 0) + 1
+        return counts
+
+
+def run_batch(manifest: BatchManifest, model: str = 'whisper', target_langs: Optional[List[str]] = None,
+              extract_workers: int = 1, asr_workers: int = 1, translate_workers: int = 1, prefetch: int = 2,
+              retry_failed: bool = True, stop: Optional[threading.Event] = None,
+              log: Optional[Callable[[str], None]] = None, **options) -> Dict[str, Any]:
+    """Transcribe the pending files of `manifest`; returns the throughput report.
+
+    `options` are passed on to `generate_subtitles` (e.g. `preset`, `use_cache`, `audio_mode`).
+    """
+    import generate_subtitles as gs
+    from model_registry import registry as model_registry
+
+    log = log or (lambda message: None)
+    target_langs = list(target_langs or [])
+    stop = stop or threading.Event()
+    gates = StageGates({'extract': extract_workers, 'asr': asr_workers, 'translate': translate_workers}, stop)
+    todo = manifest.todo(retry_failed)
+    skipped = len(manifest.entries) - len(todo)
+    # files held at once: one per asr and translate slot plus those decoded (or decoding) ahead
+    in_flight = gates.limits['asr'] + gates.limits['translate'] + max(prefetch, gates.limits['extract'])
+    totals = {'done': 0, 'failed': 0, 'cancelled': 0, 'audio_s': 0.0}
+    spans: Dict[str, float] = {}
+    totals_lock = threading.Lock()
+    loads_before = model_registry.stats()['loads']
+
+    backends = gs.selected_backends(model)
+    if todo and backends:
+        # the first model load overlaps the first file's extraction
+        threading.Thread(target=gs.prewarm_models, args=(backends,), daemon=True).start()
+
+    def _process(position: int, entry: Dict[str, Any]) -> str:
+        key = entry['path']
+        name = Path(key).name
+        if stop.is_set():
+            return 'cancelled'
+        manifest.update(key, state='running', **_signature(Path(key)))
+        began = time.perf_counter()
+        try:
+            result = gs.generate_subtitles(key, model, target_langs, cancel_event=stop, stage_gate=gates,
+                                           progress_callback=lambda msg: None if isinstance(msg, dict) else log(f'  {name}: {msg}'),
+                                           **options)
+        except gs.JobCancelled:
+            manifest.update(key, state='pending')
+            return 'cancelled'
+        except Exception as exc:
+            manifest.update(key, state='error', errors=[str(exc)], seconds=round(time.perf_counter() - began, 2))
+            log(f'[{position}/{len(todo)}] {name} failed: {exc}')
+            return 'failed'
+        seconds = time.perf_counter() - began
+        summary = result['metrics'].get('spans') or {}
+        audio_s = summary.get('audio_s') or 0.0
+        state = 'done' if result['srt_paths'] or not result['errors'] else 'error'
+        manifest.update(key, state=state, srt_paths=result['srt_paths'], errors=result['errors'],
+                        seconds=round(seconds, 2), audio_s=round(audio_s, 2),
+                        finished=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        with totals_lock:
+            totals['audio_s'] += audio_s
+            for stage, row in (summary.get('stages') or {}).items():
+                spans[stage] = spans.get(stage, 0.0) + row.get('wall_s', 0.0)
+        speed = f', {audio_s / seconds:.1f}x' if audio_s and seconds else ''
+        log(f'[{position}/{len(todo)}] {name} {state} in {seconds:.1f}s ({audio_s:.0f}s audio{speed})'
+            + (f', {len(result["errors"])} errors' if result['errors'] else ''))
+        return 'done' if state == 'done' else 'failed'
+
+    started = time.perf_counter()
+    interrupted = False
+    pool = ThreadPoolExecutor(max_workers=max(1, in_flight), thread_name_prefix='batch')
+    try:
+        futures = [pool.submit(_process, i, entry) for i, entry in enumerate(todo, 1)]
+        for future in as_completed(futures):
+            outcome = future.result()
+            with totals_lock:
+                totals[outcome] += 1
+    except KeyboardInterrupt:
+        interrupted = True
+        log('Stopping: running files are cancelled and stay pending in the manifest')
+        stop.set()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    wall = time.perf_counter() - started
+    if interrupted:
+        totals['cancelled'] = len(todo) - totals['done'] - totals['failed']
+
+    stages = {}
+    for stage in STAGES:
+        limit = gates.limits[stage]
+        stages[stage] = {'workers': limit, 'busy_s': round(gates.busy_s[stage], 2),
+                         'wait_s': round(gates.wait_s[stage], 2),
+                         'utilization': round(gates.busy_s[stage] / (wall * limit), 3) if wall > 0 else 0.0}
+    finished = totals['done'] + totals['failed']
+    return {
+        'files': {'done': totals['done'], 'failed': totals['failed'], 'cancelled': totals['cancelled'],
+                  'skipped': skipped},
+        'manifest': manifest.counts(),
+        'wall_s': round(wall, 2),
+        'audio_s': round(totals['audio_s'], 2),
+        'x_realtime': round(totals['audio_s'] / wall, 2) if wall > 0 else None,
+        'files_per_hour': round(3600.0 * finished / wall, 1) if wall > 0 else None,
+        'stages': stages,
+        'span_seconds': {stage: round(seconds, 2) for stage, seconds in sorted(spans.items())},
+        'model_loads': model_registry.stats()['loads'] - loads_before,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Transcribe a directory of videos with pipelined extraction, ASR and translation.')
+    parser.add_argument('source', help=f'directory of media files, a manifest ({MANIFEST_NAME}) to resume, or a text file with one path per line')
+    parser.add_argument('--manifest', help=f'manifest path (default: <directory>/{MANIFEST_NAME})')
+    parser.add_argument('--model', help="ASR backend or 'all' (default: the manifest's, else whisper)")
+    parser.add_argument('--lang', action='append', help='target language for translation (repeatable)')
+    parser.add_argument('--preset', choices=('accuracy', 'balanced', 'speed'),
+                        help="fp32 or int8 CPU models, see quantization.py (default: the manifest's, else SUBTITLE_PRESET)")
+    parser.add_argument('--no-recursive', action='store_true', help='only look at the top level of the directory')
+    parser.add_argument('--extract-workers', type=int, default=1, help='files decoded at once (default: %(default)s)')
+    parser.add_argument('--asr-workers', type=int, default=1, help='files transcribed at once (default: %(default)s)')
+    parser.add_argument('--translate-workers', type=int, default=1, help='files translated at once (default: %(default)s)')
+    parser.add_argument('--prefetch', type=int, default=2, help='files decoded ahead of transcription (default: %(default)s)')
+    parser.add_argument('--skip-failed', action='store_true', help='do not retry files that failed in an earlier run')
+    parser.add_argument('--no-cache', action='store_true', help='ignore the result cache')
+    parser.add_argument('--audio-mode', choices=('memory', 'wav'), help='how decoded audio is handed to the backends')
+    parser.add_argument('--report', help='also write the throughput report JSON here')
+    parser.add_argument('--verbose', '-v', action='store_true', help='print every progress message')
+    args = parser.parse_args(argv)
+
+    source = Path(args.source)
+    files: List[Path] = []
+    if source.is_dir():
+        manifest_path = Path(args.manifest) if args.manifest else source / MANIFEST_NAME
+        files = discover(source, recursive=not args.no_recursive)
+    elif source.suffix == '.json':
+        if not source.exists():
+            parser.error(f'{source} not found')
+        manifest_path = Path(args.manifest) if args.manifest else source
+    elif source.is_file():
+        manifest_path = Path(args.manifest) if args.manifest else source.with_name(MANIFEST_NAME)
+        lines = source.read_text(encoding='utf-8').splitlines()
+        files = [(source.parent / line.strip()) for line in lines if line.strip() and not line.startswith('#')]
+    else:
+        parser.error(f'{source} not found')
+    manifest = BatchManifest.load(manifest_path)
+    settings = {'model': (args.model or manifest.settings.get('model') or 'whisper').lower(),
+                'languages': args.lang if args.lang is not None else manifest.settings.get('languages', []),
+                'preset': quantization.resolve_preset(args.preset or manifest.settings.get('preset'))}
+    if manifest.configure(settings):
+        print('Model, languages or preset changed since the last run; every file will be redone')
+    added = manifest.add(files)
+    manifest.save()
+    print(f'{len(manifest.entries)} files in {manifest_path} ({added} new)')
+
+    def log(message: str) -> None:
+        if args.verbose or not message.startswith('  '):
+            print(message, flush=True)
+
+    options = {'preset': settings['preset']}
+    if args.no_cache:
+        options['use_cache'] = False
+    if args.audio_mode:
+        options['audio_mode'] = args.audio_mode
+    report = run_batch(manifest, settings['model'], settings['languages'], extract_workers=args.extract_workers,
+                       asr_workers=args.asr_workers, translate_workers=args.translate_workers,
+                       prefetch=args.prefetch, retry_failed=not args.skip_failed, log=log, **options)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.report:
+        Path(args.report).write_text(text + '\n', encoding='utf-8')
+    return 0 if not report['files']['failed'] and not report['files']['cancelled'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,213 @@
+"""Cascaded transcription: a fast Vosk pass, with Whisper or NeMo only where Vosk is unsure.
+
+`model_choice='all'` runs every heavy model over the whole file, even though on clean audio
+Vosk already gets most of it right. Vosk reports a confidence (`conf`) for every word when
+`SetWords(True)` is on. The `cascade` backend keeps the Vosk words it trusts. It sends two
+kinds of time range to the escalation backend (Whisper, else NeMo, or
+`SUBTITLE_CASCADE_BACKEND`):
+
+    low confidence   runs of words with `conf` below `SUBTITLE_CASCADE_MIN_CONF` (default 0.7)
+    missed speech    gaps of at least 1.5 s between Vosk words that the energy detector from
+                     `sharding` still marks as voiced
+
+Nearby ranges are merged and padded to at least `min_region_s`, so the escalation model gets
+some context. Their edges are then moved into the pauses around the Vosk words they
+overlap. Each range is transcribed as an `AudioBuffer.slice` view. The result replaces the
+Vosk words whose midpoint falls inside it, and `splice` rebuilds one segment list in time
+order.
+
+If more than `SUBTITLE_CASCADE_MAX_SHARE` (default 0.6) of the audio would be escalated,
+one pass over the whole file is cheaper than many small ones and gives better context, so
+the escalation backend transcribes everything instead.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import os
+
+from segment_store import SegmentStore, aggregate_words
+from sharding import voiced_frames
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+ESCALATION_BACKENDS = ('whisper', 'nemo')
+FRAME_S = 0.03
+# Vosk word edges are approximate: ignore this much of a gap next to a word
+EDGE_S = 0.15
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def min_confidence() -> float:
+    return _env_float('SUBTITLE_CASCADE_MIN_CONF', 0.7)
+
+
+def max_share() -> float:
+    return _env_float('SUBTITLE_CASCADE_MAX_SHARE', 0.6)
+
+
+def configured_backend() -> Optional[str]:
+    return os.environ.get('SUBTITLE_CASCADE_BACKEND', '').strip().lower() or None
+
+
+def _spoken(words: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    spoken = [w for w in words if (w.get('word') or '').strip()]
+    return sorted(spoken, key=lambda w: float(w.get('start', 0.0)))
+
+
+def _voiced_span(voiced, start: float, end: float, min_voiced_s: float) -> Optional[Tuple[float, float]]:
+    """First to last voiced frame in `start`..`end`, if it holds at least `min_voiced_s` of speech."""
+    lo, hi = int(start / FRAME_S), int(end / FRAME_S)
+    frames = np.flatnonzero(voiced[lo:hi])
+    if len(frames) * FRAME_S < min_voiced_s:
+        return None
+    return float((lo + frames[0]) * FRAME_S), float((lo + frames[-1] + 1) * FRAME_S)
+
+
+def flagged_ranges(words: Sequence[Dict[str, Any]], duration: float, voiced=None, min_conf: float = 0.7,
+                   min_gap_s: float = 1.5, min_voiced_s: float = 0.5) -> List[Tuple[float, float]]:
+    """Low-confidence words and voiced gaps without words, unmerged and in time order."""
+    words = _spoken(words)
+    ranges = []
+    for w in words:
+        conf = w.get('conf')
+        if conf is not None and float(conf) < min_conf:
+            ranges.append((float(w['start']), float(w.get('end', w['start']))))
+    if voiced is not None:
+        edges = [(0.0, 0.0)] + [(float(w['start']), float(w.get('end', w['start']))) for w in words] + [(duration, duration)]
+        covered = 0.0
+        for start, end in edges:
+            if start - covered >= min_gap_s:
+                found = _voiced_span(voiced, covered + EDGE_S, start - EDGE_S, min_voiced_s)
+                if found:
+                    ranges.append(found)
+            covered = max(covered, end)
+    elif not words and duration > 0:
+        # no energy detector (numpy missing) and nothing recognized: give the whole file a chance
+        ranges.append((0.0, duration))
+    return sorted(ranges)
+
+
+def _merge(ranges: Sequence[Tuple[float, float]], merge_s: float) -> List[Tuple[float, float]]:
+    merged: List[Tuple[float, float]] = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] < merge_s:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def weak_regions(words: Sequence[Dict[str, Any]], duration: float, voiced=None, min_conf: float = 0.7,
+                 min_gap_s: float = 1.5, min_voiced_s: float = 0.5, merge_s: float = 1.0,
+                 min_region_s: float = 2.0, pad_s: float = 0.2) -> List[Tuple[float, float]]:
+    """Time ranges to re-transcribe, merged, widened to `min_region_s` and snapped to pauses.
+
+    A range never ends inside a Vosk word. It is stretched to the edges of any word it cuts,
+    plus up to `pad_s` of the pause beyond them.
+    """
+    ranges = []
+    for start, end in _merge(flagged_ranges(words, duration, voiced, min_conf, min_gap_s, min_voiced_s), merge_s):
+        if end - start < min_region_s:
+            grow = (min_region_s - (end - start)) / 2.0
+            start, end = max(0.0, start - grow), min(duration, end + grow)
+        ranges.append((start, end))
+    words = _spoken(words)
+    starts = [float(w['start']) for w in words]
+    ends = [float(w.get('end', w['start'])) for w in words]
+    # reach[i]: latest end among the first i words
+    reach = [0.0]
+    for end in ends:
+        reach.append(max(reach[-1], end))
+    # one walk over words and regions together; `first` only moves forward
+    snapped, first = [], 0
+    for start, end in sorted(ranges):
+        while first < len(words) and starts[first] < start:
+            first += 1
+        prev_end = reach[first]
+        if first and ends[first - 1] > start:
+            # the range starts inside a word: take all of it
+            start, prev_end = starts[first - 1], reach[first - 1]
+        last = first
+        while last < len(words) and starts[last] < end:
+            last += 1
+        if last and ends[last - 1] > end:
+            end = ends[last - 1]
+        next_start = starts[last] if last < len(words) else duration
+        snapped.append((max(prev_end, start - pad_s), min(next_start, end + pad_s)))
+    return _merge(snapped, merge_s)
+
+
+def splice(words: Sequence[Dict[str, Any]], regions: Sequence[Tuple[float, float]], refined: Sequence[Any],
+           max_words: int = 10) -> SegmentStore:
+    """Vosk words outside `regions` plus each region's `refined` segments (times relative to it)."""
+    out: List[Dict[str, Any]] = []
+    run: List[Dict[str, Any]] = []
+
+    def flush():
+        if run:
+            out.extend(aggregate_words(run, max_words).to_records())
+            run.clear()
+
+    def emit(index: int):
+        start, end = regions[index]
+        for seg in refined[index]:
+            text = (seg.get('text') or '').strip()
+            if not text:
+                continue
+            seg_start = min(end, start + float(seg.get('start', 0.0)))
+            seg_end = min(end, start + float(seg.get('end', seg.get('start', 0.0))))
+            out.append({'start': seg_start, 'end': max(seg_start, seg_end), 'text': text})
+
+    index = 0
+    for w in _spoken(words):
+        mid = (float(w['start']) + float(w.get('end', w['start']))) / 2.0
+        while index < len(regions) and mid >= regions[index][1]:
+            flush()
+            emit(index)
+            index += 1
+        if index < len(regions) and mid >= regions[index][0]:
+            continue
+        run.append(w)
+    flush()
+    while index < len(regions):
+        emit(index)
+        index += 1
+    return SegmentStore.from_records(out)
+
+
+def run_cascade(audio, words: Sequence[Dict[str, Any]], transcribe: Callable, check_cancelled=None,
+                min_conf: Optional[float] = None, share_limit: Optional[float] = None) -> Tuple[SegmentStore, Dict[str, Any]]:
+    """Escalate the weak parts of the Vosk `words` for `audio` with `transcribe`.
+
+    `transcribe(audio, audio_duration, check_cancelled=...)` is the escalation backend's
+    transcriber. Returns the spliced segments and what was escalated.
+    """
+    duration = audio.duration
+    min_conf = min_confidence() if min_conf is None else min_conf
+    share_limit = max_share() if share_limit is None else share_limit
+    voiced = voiced_frames(audio, FRAME_S) if np is not None else None
+    regions = weak_regions(words, duration, voiced, min_conf=min_conf)
+    escalated = sum(end - start for start, end in regions)
+    stats: Dict[str, Any] = {'words': len(_spoken(words)), 'regions': len(regions), 'escalated_s': round(escalated, 2),
+                             'share': round(escalated / duration, 3) if duration else 0.0, 'whole_file': False}
+    if duration and escalated / duration > share_limit:
+        stats['whole_file'] = True
+        return SegmentStore.coerce(transcribe(audio, duration, check_cancelled=check_cancelled)), stats
+    refined = []
+    for start, end in regions:
+        if check_cancelled:
+            check_cancelled()
+        piece = audio.slice(start, end)
+        try:
+            refined.append(SegmentStore.coerce(transcribe(piece, piece.duration, check_cancelled=check_cancelled)))
+        finally:
+            # file-only backends (NeMo) get a temp WAV per region
+            piece.discard_wav()
+    return splice(words, regions, refined), stats
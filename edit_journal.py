@@ -0,0 +1,458 @@
+"""Append-only edit history for subtitle files.
+
+Saving from the editor used to POST every segment. The server then rewrote the SRT and
+kept a full `.bak.<timestamp>` copy per save. Now every SRT gets a journal next to it
+(`<name>.srt.journal`, one JSON record per line). Cues carry stable ids. A save is a patch
+of only the updated, inserted and deleted cues against the revision the editor loaded:
+
+    {"op": "update", "id": 7, "text": "..."}             # only the fields that changed
+    {"op": "insert", "after": 7, "tmp": "t0", "start": 1.5, "end": 3.0, "text": "..."}
+    {"op": "delete", "id": 9}
+
+If the file moved on since that revision, the patch is still applied when it only touches
+cues nobody else changed; otherwise `EditConflict` names the cues in question. Restores
+append a snapshot, so history only ever grows. Once `SUBTITLE_JOURNAL_COMPACT_EVERY`
+patches follow the last snapshot, the journal is rewritten to a snapshot plus the newest
+`SUBTITLE_JOURNAL_KEEP` revisions.
+
+The SRT itself stays the source of truth for everything else (downloads, exports). If it
+changes behind the journal's back, e.g. a new transcription run, the next access records
+it as an `external` snapshot.
+"""
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import os
+import threading
+import time
+import uuid
+
+from segment_store import SegmentStore, parse_timestamp
+from subtitle_io import read_srt, write_srt
+
+JOURNAL_SUFFIX = '.journal'
+COMPACT_EVERY = max(1, int(os.environ.get('SUBTITLE_JOURNAL_COMPACT_EVERY', '200')))
+KEEP_REVISIONS = max(0, int(os.environ.get('SUBTITLE_JOURNAL_KEEP', '50')))
+
+Cue = Tuple[float, float, str]
+
+
+class EditConflict(Exception):
+    """The patch was made against an older revision and touches cues changed since."""
+
+    def __init__(self, rev: int, ids: Iterable[Any] = ()):
+        self.rev = rev
+        self.ids = sorted(set(ids), key=str)
+        super().__init__(f'conflicting edits; the file is now at revision {rev}')
+
+
+def _clean_time(value) -> float:
+    return round(max(parse_timestamp(value), 0.0), 3)
+
+
+def _clean_text(value) -> str:
+    # the same normalization an SRT round trip applies: stripped lines, no blank lines inside a cue
+    return '\n'.join(line.strip() for line in str(value or '').splitlines() if line.strip())
+
+
+class _Cues:
+    """Cue ids in display order plus `{id: (start, end, text)}`."""
+
+    __slots__ = ('order', 'cues', 'next_id')
+
+    def __init__(self, order: List[int], cues: Dict[int, Cue], next_id: int):
+        self.order = order
+        self.cues = cues
+        self.next_id = next_id
+
+    @classmethod
+    def from_store(cls, store: SegmentStore, first_id: int = 1) -> '_Cues':
+        order = list(range(first_id, first_id + len(store)))
+        cues = {cid: (round(seg['start'], 3), round(seg['end'], 3), _clean_text(seg['text']))
+                for cid, seg in zip(order, store)}
+        return cls(order, cues, first_id + len(order))
+
+    @classmethod
+    def from_snapshot(cls, record: Dict[str, Any]) -> '_Cues':
+        order, cues = [], {}
+        for cid, start, end, text in record['cues']:
+            order.append(cid)
+            cues[cid] = (start, end, text)
+        return cls(order, cues, record['next_id'])
+
+    def snapshot(self) -> List[list]:
+        cues = self.cues
+        return [[cid, *cues[cid]] for cid in self.order]
+
+    def copy(self) -> '_Cues':
+        return _Cues(list(self.order), dict(self.cues), self.next_id)
+
+    def store(self) -> SegmentStore:
+        rows = [self.cues[cid] for cid in self.order]
+        return SegmentStore.from_columns([r[0] for r in rows], [r[1] for r in rows], (r[2] for r in rows))
+
+    def records(self) -> List[Dict[str, Any]]:
+        cues = self.cues
+        return [{'id': cid, 'start': cues[cid][0], 'end': cues[cid][1], 'text': cues[cid][2]} for cid in self.order]
+
+    def apply(self, ops: Iterable[Dict[str, Any]], replay: bool = False) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """Apply editor ops in order; returns (ops as journaled, `{tmp: assigned id}`).
+
+        Journaled ops carry final ids and only the fields that actually changed. With
+        `replay` the ops come from the journal and already have their ids.
+        """
+        journaled: List[Dict[str, Any]] = []
+        assigned: Dict[str, int] = {}
+        for op in ops:
+            kind = op.get('op')
+            if kind == 'insert':
+                after = op.get('after')
+                after = assigned.get(after, after) if isinstance(after, str) else after
+                if after is not None and after not in self.cues:
+                    raise KeyError(after)
+                if replay:
+                    cid = op['id']
+                    self.next_id = max(self.next_id, cid + 1)
+                else:
+                    cid = self.next_id
+                    self.next_id += 1
+                    if op.get('tmp') is not None:
+                        assigned[str(op['tmp'])] = cid
+                start = _clean_time(op.get('start', 0.0))
+                self.cues[cid] = (start, max(_clean_time(op.get('end', start)), start), _clean_text(op.get('text')))
+                self.order.insert(0 if after is None else self.order.index(after) + 1, cid)
+                journaled.append({'op': 'insert', 'id': cid, 'after': after, 'start': self.cues[cid][0],
+                                  'end': self.cues[cid][1], 'text': self.cues[cid][2]})
+            elif kind == 'update':
+                cid = op.get('id')
+                if cid not in self.cues:
+                    raise KeyError(cid)
+                start, end, text = old = self.cues[cid]
+                if 'start' in op:
+                    start = _clean_time(op['start'])
+                if 'end' in op:
+                    end = _clean_time(op['end'])
+                if 'text' in op:
+                    text = _clean_text(op['text'])
+                new = (start, max(end, start), text)
+                if new == old:
+                    continue
+                self.cues[cid] = new
+                entry = {'op': 'update', 'id': cid}
+                entry.update({field: value for field, value, before in zip(('start', 'end', 'text'), new, old)
+                              if value != before})
+                journaled.append(entry)
+            elif kind == 'delete':
+                cid = op.get('id')
+                if cid not in self.cues:
+                    raise KeyError(cid)
+                del self.cues[cid]
+                self.order.remove(cid)
+                journaled.append({'op': 'delete', 'id': cid})
+            else:
+                raise ValueError(f'unknown op: {kind!r}')
+        return journaled, assigned
+
+
+def _referenced(ops: Iterable[Dict[str, Any]]) -> List[Any]:
+    """Existing cue ids a patch depends on (inserts depend on their anchor)."""
+    ids = []
+    for op in ops:
+        ref = op.get('after') if op.get('op') == 'insert' else op.get('id')
+        if ref is not None and not isinstance(ref, str):
+            ids.append(ref)
+    return ids
+
+
+def diff_ops(old: _Cues, segments: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Ops that turn `old` into the full segment list `segments` (for whole-file saves)."""
+    new = [(_clean_time(s.get('start', 0.0)), _clean_time(s.get('end', s.get('start', 0.0))), _clean_text(s.get('text')))
+           for s in segments]
+    current = [old.cues[cid] for cid in old.order]
+    ops: List[Dict[str, Any]] = []
+    anchor = None
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, current, new, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            anchor = old.order[i2 - 1]
+            continue
+        paired = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+        for k in range(paired):
+            start, end, text = new[j1 + k]
+            ops.append({'op': 'update', 'id': old.order[i1 + k], 'start': start, 'end': end, 'text': text})
+            anchor = old.order[i1 + k]
+        for k in range(i1 + paired, i2):
+            ops.append({'op': 'delete', 'id': old.order[k]})
+        for k in range(j1 + paired, j2):
+            tmp = f'n{k}'
+            start, end, text = new[k]
+            ops.append({'op': 'insert', 'tmp': tmp, 'after': anchor, 'start': start, 'end': end, 'text': text})
+            anchor = tmp
+    return ops
+
+
+def _file_stamp(path: Path) -> Optional[List[int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class EditJournal:
+    """Revisions of one SRT file. Thread-safe; get instances from `journals`."""
+
+    def __init__(self, srt_path: Path):
+        self.path = Path(srt_path)
+        self.journal_path = self.path.with_name(self.path.name + JOURNAL_SUFFIX)
+        self._lock = threading.Lock()
+        self._cues: Optional[_Cues] = None
+        self.rev = 0
+        self._stamp: Optional[List[int]] = None
+        # rev -> cue ids that revision changed, or None for snapshots (everything changed)
+        self._touched: Dict[int, Optional[frozenset]] = {}
+        self._since_snapshot = 0
+
+    # -- loading ----------------------------------------------------------
+
+    def _records(self) -> List[Dict[str, Any]]:
+        records = []
+        try:
+            with open(self.journal_path, encoding='utf-8') as fh:
+                for line in fh:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # a torn last line from an interrupted append; the SRT was not rewritten yet either
+                        continue
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _load(self) -> None:
+        cues, rev, stamp = None, 0, None
+        self._touched, self._since_snapshot = {}, 0
+        for record in self._records():
+            if 'cues' in record:
+                cues = _Cues.from_snapshot(record)
+                self._touched[record['rev']] = None
+                self._since_snapshot = 0
+            elif cues is not None:
+                cues.apply(record['ops'], replay=True)
+                self._touched[record['rev']] = frozenset(op['id'] for op in record['ops'] if op['op'] != 'insert')
+                self._since_snapshot += 1
+            else:
+                continue
+            rev, stamp = record['rev'], record.get('file', stamp)
+        if cues is None:
+            # no history yet: revision 0 is the file as it is; nothing is written until the first edit
+            cues, stamp = _Cues.from_store(read_srt(self.path)), _file_stamp(self.path)
+        self._cues, self.rev, self._stamp = cues, rev, stamp
+
+    def _ensure(self) -> _Cues:
+        if self._cues is None:
+            self._load()
+        stamp = _file_stamp(self.path)
+        if stamp is None:
+            raise FileNotFoundError(str(self.path))
+        if stamp != self._stamp:
+            if self.journal_path.exists():
+                cues = _Cues.from_store(read_srt(self.path), first_id=self._cues.next_id)
+                self._append({'rev': self.rev + 1, 'ts': time.time(), 'kind': 'external',
+                              'next_id': cues.next_id, 'cues': cues.snapshot(), 'file': stamp}, cues, None)
+            else:
+                self._load()
+        return self._cues
+
+    # -- writing ----------------------------------------------------------
+
+    def _append(self, record: Dict[str, Any], cues: _Cues, touched: Optional[frozenset]) -> None:
+        if not self.journal_path.exists():
+            # keep the file as it was before the first edit, so it can be restored later
+            original = self._cues
+            line = {'rev': self.rev, 'ts': time.time(), 'kind': 'original', 'next_id': original.next_id,
+                    'cues': original.snapshot(), 'file': self._stamp}
+            self._write_lines(self.journal_path, [line], mode='a')
+            self._touched[self.rev] = None
+        self._write_lines(self.journal_path, [record], mode='a')
+        self._cues, self.rev, self._stamp = cues, record['rev'], record.get('file', self._stamp)
+        self._touched[self.rev] = touched
+        self._since_snapshot = 0 if touched is None else self._since_snapshot + 1
+        if self._since_snapshot >= COMPACT_EVERY:
+            self._compact()
+
+    @staticmethod
+    def _write_lines(path: Path, records: List[Dict[str, Any]], mode: str) -> None:
+        payload = ''.join(json.dumps(r, ensure_ascii=False, separators=(',', ':')) + '\n' for r in records)
+        with open(path, mode, encoding='utf-8') as fh:
+            fh.write(payload)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def _materialize(self, cues: _Cues) -> List[int]:
+        write_srt(cues.store(), self.path)
+        return _file_stamp(self.path)
+
+    def _compact(self) -> None:
+        records = self._records()
+        cutoff = self.rev - KEEP_REVISIONS
+        cues = self._replay(records, cutoff)
+        if cues is None:
+            return
+        kept = [r for r in records if r['rev'] > cutoff]
+        head = {'rev': cutoff, 'ts': time.time(), 'kind': 'compact', 'next_id': cues.next_id,
+                'cues': cues.snapshot(), 'file': self._stamp}
+        tmp = self.journal_path.with_name(f'.{self.journal_path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')
+        self._write_lines(tmp, [head] + kept, mode='w')
+        os.replace(tmp, self.journal_path)
+        self._touched = {rev: ids for rev, ids in self._touched.items() if rev > cutoff}
+        self._touched[cutoff] = None
+        self._since_snapshot = 0
+        for record in kept:
+            self._since_snapshot = 0 if 'cues' in record else self._since_snapshot + 1
+
+    @staticmethod
+    def _replay(records: List[Dict[str, Any]], rev: int) -> Optional[_Cues]:
+        cues = None
+        for record in records:
+            if record['rev'] > rev:
+                break
+            if 'cues' in record:
+                cues = _Cues.from_snapshot(record)
+            elif cues is not None:
+                cues.apply(record['ops'], replay=True)
+        return cues
+
+    # -- public API -------------------------------------------------------
+
+    def current(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """(revision, cues as `{'id', 'start', 'end', 'text'}` dicts)."""
+        with self._lock:
+            records = self._ensure().records()
+            return self.rev, records
+
+    def patch(self, ops: List[Dict[str, Any]], base_rev: Optional[int] = None) -> Dict[str, Any]:
+        """Apply editor ops made against `base_rev` (default: the current revision).
+
+        Returns `{'rev', 'assigned'}`, where `assigned` maps the `tmp` keys of inserts to
+        their new ids. Raises `EditConflict`, or `ValueError` for malformed patches.
+        """
+        with self._lock:
+            return self._patch(ops, base_rev)
+
+    def _patch(self, ops: List[Dict[str, Any]], base_rev: Optional[int]) -> Dict[str, Any]:
+        cues = self._ensure()
+        base = self.rev if base_rev is None else int(base_rev)
+        if base > self.rev or base < 0:
+            raise ValueError(f'unknown base revision {base}')
+        refs = _referenced(ops)
+        if base < self.rev:
+            changed = set()
+            for rev in range(base + 1, self.rev + 1):
+                touched = self._touched.get(rev)
+                if touched is None:
+                    # replaced wholesale (or history compacted away): every cue counts as changed
+                    raise EditConflict(self.rev, refs)
+                changed |= touched
+            clashes = [cid for cid in refs if cid in changed or cid not in cues.cues]
+            if clashes:
+                raise EditConflict(self.rev, clashes)
+        updated = cues.copy()
+        try:
+            journaled, assigned = updated.apply(ops)
+        except KeyError as exc:
+            raise ValueError(f'unknown cue id {exc.args[0]!r}') from None
+        if not journaled:
+            return {'rev': self.rev, 'assigned': assigned}
+        stamp = self._materialize(updated)
+        record = {'rev': self.rev + 1, 'base': base, 'ts': time.time(), 'kind': 'patch',
+                  'ops': journaled, 'file': stamp}
+        self._append(record, updated, frozenset(op['id'] for op in journaled if op['op'] != 'insert'))
+        return {'rev': self.rev, 'assigned': assigned}
+
+    def save(self, segments: List[Dict[str, Any]], base_rev: Optional[int] = None) -> Dict[str, Any]:
+        """Save a whole segment list; only the cues that differ end up in the journal."""
+        with self._lock:
+            old = self._ensure()
+            if base_rev is not None and int(base_rev) != self.rev:
+                # diff against what the editor loaded, so concurrent edits elsewhere in the file survive
+                old = self._replay(self._records(), int(base_rev)) if 0 <= int(base_rev) < self.rev else None
+                if old is None:
+                    raise EditConflict(self.rev)
+            return self._patch(diff_ops(old, segments), base_rev)
+
+    def history(self) -> List[Dict[str, Any]]:
+        """Revisions still in the journal, newest first."""
+        with self._lock:
+            self._ensure()
+            records = self._records()
+        if not records:
+            stamp = self._stamp or [0, 0]
+            return [{'rev': 0, 'ts': stamp[1] / 1e9, 'kind': 'original', 'cues': len(self._cues.order)}]
+        entries = []
+        for record in records:
+            entry = {'rev': record['rev'], 'ts': record['ts'], 'kind': record['kind']}
+            if 'cues' in record:
+                entry['cues'] = len(record['cues'])
+            else:
+                entry['base'] = record.get('base')
+                for kind, label in (('update', 'updated'), ('insert', 'inserted'), ('delete', 'deleted')):
+                    entry[label] = sum(1 for op in record['ops'] if op['op'] == kind)
+            if 'restored_from' in record:
+                entry['restored_from'] = record['restored_from']
+            entries.append(entry)
+        return entries[::-1]
+
+    def restore(self, rev: int) -> Dict[str, Any]:
+        """Make revision `rev` current again by appending it as a new snapshot."""
+        with self._lock:
+            self._ensure()
+            rev = int(rev)
+            if rev < 0 or rev > self.rev:
+                raise KeyError(rev)
+            if self.journal_path.exists():
+                target = self._replay(self._records(), rev)
+            else:
+                target = self._cues.copy()
+            if target is None:
+                raise KeyError(rev)
+            return self._replace(target, 'restore', restored_from=rev)
+
+    def restore_segments(self, segments, source: str) -> Dict[str, Any]:
+        """Make `segments` (e.g. a legacy `.bak` file) current, recorded as a restore from `source`."""
+        with self._lock:
+            self._ensure()
+            return self._replace(_Cues.from_store(SegmentStore.coerce(segments), first_id=self._cues.next_id),
+                                 'restore', restored_from=source)
+
+    def _replace(self, cues: _Cues, kind: str, **extra) -> Dict[str, Any]:
+        cues.next_id = max(cues.next_id, self._cues.next_id)
+        stamp = self._materialize(cues)
+        record = {'rev': self.rev + 1, 'ts': time.time(), 'kind': kind, 'next_id': cues.next_id,
+                  'cues': cues.snapshot(), 'file': stamp, **extra}
+        self._append(record, cues, None)
+        return {'rev': self.rev}
+
+
+class JournalRegistry:
+    """One `EditJournal` per SRT path; the least recently used ones are dropped from memory."""
+
+    def __init__(self, max_open: int = 64):
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._journals: 'OrderedDict[Path, EditJournal]' = OrderedDict()
+
+    def get(self, srt_path) -> EditJournal:
+        key = Path(srt_path).resolve()
+        with self._lock:
+            journal = self._journals.get(key)
+            if journal is None:
+                journal = self._journals[key] = EditJournal(key)
+            self._journals.move_to_end(key)
+            while len(self._journals) > self.max_open:
+                self._journals.popitem(last=False)
+            return journal
+
+
+journals = JournalRegistry()
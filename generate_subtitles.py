@@ -13,30 +13,45 @@ import subprocess
 import uuid
 import os
 from typing import List, Dict, Any
+import itertools
 import json
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
-try:
-    import torch
-except Exception:
-    torch = None
+from model_registry import registry as model_registry, directory_bytes
+from audio_buffer import AudioBuffer, extract_audio_pcm
+from result_cache import result_cache, cache_enabled, file_digest, audio_fingerprint
+from translation_memory import translation_memory, memory_enabled, normalize_text
+from sharding import ShardMerger, plan_shards, merge_shard_segments
+from segment_store import SegmentStore, WordStore, aggregate_words, format_timestamp
+from subtitle_io import FORMATS, sibling_paths, write_subtitles
+from subtitle_catalog import catalog
+from waveform_peaks import peaks_path, read_wav, write_peaks
+import pipeline_metrics
+from pipeline_metrics import span
+import backend_plugins
+import cascade
+import quantization
+from backend_plugins import lazy_module, register_backend
 
 try:
-    import whisper
+    import numpy as np
 except Exception:
-    whisper = None
+    np = None
 
-try:
-    from transformers import pipeline as hf_asr_pipeline
-    from transformers import MarianMTModel, MarianTokenizer
-except Exception:
-    hf_asr_pipeline = None
-    MarianMTModel = None
-    MarianTokenizer = None
+# torch, whisper, transformers and NeMo take seconds and hundreds of MB to import; they are
+# only imported when a model is loaded or run (see backend_plugins)
+torch = lazy_module('torch')
+whisper = lazy_module('whisper')
+transformers = lazy_module('transformers')
+nemo_asr = lazy_module('nemo.collections.asr')
 
-try:
-    import nemo.collections.asr as nemo_asr
-except Exception:
-    nemo_asr = None
+WHISPER_MODEL_SIZE = 'small'
+WAV2VEC2_MODEL_ID = 'facebook/wav2vec2-large-960h-lv60-self'
+NEMO_MODEL_NAME = 'stt_en_conformer_ctc_small'
+VOSK_MODEL_DIR = Path('models/vosk-model-small-en-us-0.15')
 
 def ensure_dir(path: Path) -> Path:
     path.mkdir(parents=True, exist_ok=True)
@@ -52,7 +67,7 @@ def extract_audio_ffmpeg(video_path: Path, output_dir: Path, sample_rate: int =
     audio_path = output_dir / f'{video_path.stem}_{uuid.uuid4().hex[:8]}.wav'
     command = [
         'ffmpeg', '-y', '-i', str(video_path),
-        '-ac', '1', '-ar', str(sample_rate), str(audio_path)
+        '-vn', '-ac', '1', '-ar', str(sample_rate), str(audio_path)
     ]
     run_ffmpeg(command)
     return audio_path
@@ -63,58 +78,33 @@ def get_audio_duration(audio_path: Path) -> float:
         rate = wf.getframerate()
     return frames / float(rate)
 
-def format_timestamp(seconds: float) -> str:
-    seconds = max(seconds, 0.0)
-    h, rem = divmod(int(seconds), 3600)
-    m, s = divmod(rem, 60)
-    ms = int(round((seconds - int(seconds)) * 1000))
-    return f'{h:02}:{m:02}:{s:02},{ms:03}'
-
-def segments_to_srt(segments: List[Dict[str, Any]], output_path: Path) -> None:
-    ensure_dir(output_path.parent)
-    with open(output_path, 'w', encoding='utf-8') as handle:
-        for idx, segment in enumerate(segments, start=1):
-            start_ts = format_timestamp(segment.get('start', 0.0))
-            end_ts = format_timestamp(segment.get('end', segment.get('start', 0.0)))
-            text = segment.get('text', '').strip()
-            handle.write(f'{idx}\n{start_ts} --> {end_ts}\n{text}\n\n')
-
-def aggregate_words(words: List[Dict[str, Any]], max_words: int = 10) -> List[Dict[str, Any]]:
-    segments, buffer, start_time = [], [], None
-    for word in words:
-        token = word.get('word', '').strip()
-        if not token:
-            continue
-        if start_time is None:
-            start_time = word.get('start', 0.0)
-        buffer.append(token)
-        end_time = word.get('end', start_time)
-        if len(buffer) >= max_words:
-            segments.append({'start': start_time, 'end': end_time, 'text': ' '.join(buffer)})
-            buffer, start_time = [], None
-    if buffer:
-        end_time = words[-1].get('end', start_time or 0.0)
-        segments.append({'start': start_time or 0.0, 'end': end_time, 'text': ' '.join(buffer)})
-    return segments
+def subtitle_formats() -> List[str]:
+    """Formats written for every transcript: SRT plus any of `SUBTITLE_OUTPUT_FORMATS` (e.g. `srt,vtt,json`)."""
+    requested = [f.strip().lower() for f in os.environ.get('SUBTITLE_OUTPUT_FORMATS', 'srt').split(',') if f.strip()]
+    return ['srt'] + [f for f in dict.fromkeys(requested) if f in FORMATS and f != 'srt']
 
-def approximate_segments_from_text(text: str, audio_duration: float, words_per_segment: int = 16) -> List[Dict[str, Any]]:
+def segments_to_srt(segments, output_path: Path) -> None:
+    """Write a `SegmentStore` (or a list of segment dicts) as an SRT file, plus the
+    sibling `.vtt` / `.json` files selected by `subtitle_formats()`, in one pass."""
+    with span('srt_write', lines=len(segments)):
+        written = write_subtitles(segments, sibling_paths(output_path, subtitle_formats()))
+    try:
+        catalog.record(written.values())
+    except Exception:
+        # the catalog is an index; a periodic rescan picks up anything missed here
+        pass
+
+def approximate_segments_from_text(text: str, audio_duration: float, words_per_segment: int = 16) -> SegmentStore:
     tokens = text.strip().split()
     if not tokens or audio_duration <= 0:
-        return []
+        return SegmentStore()
     avg_time = audio_duration / max(len(tokens), 1)
-    segments = []
-    start = 0.0
-    idx = 0
-    while idx < len(tokens):
-        chunk = tokens[idx: idx + words_per_segment]
-        chunk_duration = avg_time * len(chunk)
-        end = min(start + chunk_duration, audio_duration)
-        segments.append({'start': start, 'end': end, 'text': ' '.join(chunk)})
-        start = end
-        idx += words_per_segment
-    if segments:
-        segments[-1]['end'] = audio_duration
-    return segments
+    chunks = [tokens[idx: idx + words_per_segment] for idx in range(0, len(tokens), words_per_segment)]
+    # each segment starts where the previous one ended; running sums, clipped to the audio
+    ends = [min(end, audio_duration) for end in itertools.accumulate(avg_time * len(chunk) for chunk in chunks)]
+    starts = [0.0] + ends[:-1]
+    ends[-1] = audio_duration
+    return SegmentStore.from_columns(starts, ends, (' '.join(chunk) for chunk in chunks))
 
 LANG_CODE_MAP = {
     'hindi': 'hi', 'marathi': 'mr', 'spanish': 'es', 'french': 'fr', 'german': 'de',
@@ -133,38 +123,269 @@ def resolve_language(lang: str) -> str:
         return lang
     return LANG_CODE_MAP.get(lang, 'en')
 
+def marian_model_id(src_lang: str, tgt_lang: str) -> str:
+    return f'Helsinki-NLP/opus-mt-{src_lang}-{tgt_lang}'
+
 _translation_cache = {}
+_translation_cache_lock = threading.Lock()
+_translation_load_locks = {}
+
+def translation_model_key(src_lang: str, tgt_lang: str) -> str:
+    """Marian model id, tagged when the job's preset runs it quantized (cache and memory key)."""
+    model_name = marian_model_id(src_lang, tgt_lang)
+    quantize = quantization.quantize_mode() if quantization.can_quantize() else None
+    return f'{model_name}+{quantize}' if quantize else model_name
 
 def get_translation_model(src_lang: str, tgt_lang: str):
-    model_name = f'Helsinki-NLP/opus-mt-{src_lang}-{tgt_lang}'
-    if model_name not in _translation_cache:
-        tokenizer = MarianTokenizer.from_pretrained(model_name)
-        model = MarianMTModel.from_pretrained(model_name)
-        if torch:
-            model = model.to('cuda' if torch.cuda.is_available() else 'cpu')
-        _translation_cache[model_name] = (tokenizer, model)
-    return _translation_cache[model_name]
-
-def translate_segments(segments: List[Dict[str, Any]], src_lang: str, tgt_lang: str) -> List[Dict[str, Any]]:
+    model_name = marian_model_id(src_lang, tgt_lang)
+    cache_key = translation_model_key(src_lang, tgt_lang)
+    with _translation_cache_lock:
+        if cache_key in _translation_cache:
+            return _translation_cache[cache_key]
+        load_lock = _translation_load_locks.setdefault(cache_key, threading.Lock())
+    # languages translate concurrently; load each model once even if two threads ask for it
+    with load_lock:
+        if cache_key not in _translation_cache:
+            tokenizer = transformers.MarianTokenizer.from_pretrained(model_name)
+            if cache_key != model_name:
+                model = quantization.load_quantized(cache_key, lambda: transformers.MarianMTModel.from_pretrained(model_name))
+            else:
+                model = transformers.MarianMTModel.from_pretrained(model_name)
+                if torch.available():
+                    model = model.to('cuda' if torch.cuda.is_available() else 'cpu')
+            with _translation_cache_lock:
+                _translation_cache[cache_key] = (tokenizer, model)
+    return _translation_cache[cache_key]
+
+def _torch_threads_per_worker() -> int:
+    """Intra-op threads each translating worker will use: torch's own count once it is imported."""
+    if backend_plugins.imported('torch'):
+        try:
+            return max(1, torch.get_num_threads())
+        except Exception:
+            pass
+    # before the import torch takes OMP_NUM_THREADS (set by `configure_torch_threads`), else all cores
+    try:
+        return max(1, int(os.environ.get('OMP_NUM_THREADS', '0')) or (os.cpu_count() or 1))
+    except ValueError:
+        return os.cpu_count() or 1
+
+def translation_parallelism(num_langs: int) -> int:
+    """Worker threads for translating `num_langs` languages at once.
+
+    `SUBTITLE_TRANSLATION_WORKERS` caps concurrent languages (default 4).
+    `SUBTITLE_TRANSLATION_THREADS` is the CPU thread budget for translation (default: all
+    cores): every worker runs torch with its full intra-op thread count, so workers are
+    limited to `budget // torch threads`. With torch on all cores that is one language at a
+    time; lower `SUBTITLE_TORCH_THREADS` to translate several at once.
+    """
+    try:
+        max_workers = int(os.environ.get('SUBTITLE_TRANSLATION_WORKERS', '4'))
+    except ValueError:
+        max_workers = 4
+    try:
+        budget = int(os.environ.get('SUBTITLE_TRANSLATION_THREADS', '0')) or (os.cpu_count() or 1)
+    except ValueError:
+        budget = os.cpu_count() or 1
+    return max(1, min(num_langs, max_workers, budget // _torch_threads_per_worker()))
+
+_torch_threads_lock = threading.Lock()
+_torch_threads_configured = False
+
+def configure_torch_threads() -> None:
+    """Apply `SUBTITLE_TORCH_THREADS` once per process, before its first job.
+
+    torch's intra-op thread count is process-wide, so it is never changed per job: concurrent
+    jobs would interleave their save/restore and throttle each other's ASR. Unset, torch
+    keeps its default (all cores).
+    """
+    global _torch_threads_configured
+    with _torch_threads_lock:
+        if _torch_threads_configured:
+            return
+        _torch_threads_configured = True
+    try:
+        threads = int(os.environ.get('SUBTITLE_TORCH_THREADS', '0'))
+    except ValueError:
+        threads = 0
+    if threads > 0:
+        _limit_worker_threads(threads)
+
+# Marian batches are sized by padded tokens rather than by segment count, so one long
+# line no longer pads seven short ones.
+TRANSLATION_TOKEN_BUDGET = int(os.environ.get('SUBTITLE_TRANSLATION_TOKEN_BUDGET', '2048'))
+TRANSLATION_MAX_BATCH = 64
+
+def plan_token_batches(lengths: List[int], token_budget: int = TRANSLATION_TOKEN_BUDGET,
+                       max_batch: int = TRANSLATION_MAX_BATCH) -> List[List[int]]:
+    """Group item indices into length-sorted batches whose padded size fits `token_budget`.
+
+    Padded size is `len(batch) * longest item`; an item longer than the budget gets a batch of its own.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, current, longest = [], [], 0
+    for idx in order:
+        candidate = max(longest, lengths[idx], 1)
+        if current and (candidate * (len(current) + 1) > token_budget or len(current) >= max_batch):
+            batches.append(current)
+            current, candidate = [], max(lengths[idx], 1)
+        current.append(idx)
+        longest = candidate
+    if current:
+        batches.append(current)
+    return batches
+
+def _marian_translate(texts: List[str], src_lang: str, tgt_lang: str) -> List[str]:
     tokenizer, model = get_translation_model(src_lang, tgt_lang)
-    device = next(model.parameters()).device if torch else 'cpu'
-    translated_segments = []
-    for i in range(0, len(segments), 8):
-        batch = segments[i:i+8]
-        texts = [seg['text'] for seg in batch]
-        inputs = tokenizer(texts, return_tensors='pt', padding=True, truncation=True)
-        if torch:
+    device = next(model.parameters()).device if torch.available() else 'cpu'
+    lengths = [len(ids) for ids in tokenizer(texts, truncation=True)['input_ids']]
+    results = [''] * len(texts)
+    for batch_idx in plan_token_batches(lengths):
+        batch = [texts[i] for i in batch_idx]
+        inputs = tokenizer(batch, return_tensors='pt', padding=True, truncation=True)
+        if torch.available():
             inputs = {k: v.to(device) for k, v in inputs.items()}
             with torch.no_grad():
                 outputs = model.generate(**inputs)
         else:
             outputs = model.generate(**inputs)
-        decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
-        for seg, text in zip(batch, decoded):
-            seg_copy = dict(seg)
-            seg_copy['text'] = text
-            translated_segments.append(seg_copy)
-    return translated_segments
+        for i, text in zip(batch_idx, tokenizer.batch_decode(outputs, skip_special_tokens=True)):
+            results[i] = text
+    return results
+
+def translate_texts(texts: List[str], src_lang: str, tgt_lang: str, use_memory: bool = None,
+                    memory_counts: Dict[str, int] = None) -> List[str]:
+    """Translate a list of lines, consulting the translation memory before Marian.
+
+    Identical lines (after whitespace normalization) are translated once; only lines
+    missing from the memory are sent to the model, and their translations are stored.
+    `memory_counts` (`{'hits': n, 'misses': n}`) is incremented with this call's lookups.
+    """
+    if use_memory is None:
+        use_memory = memory_enabled()
+    model_id = translation_model_key(src_lang, tgt_lang)
+    normalized = [normalize_text(t) for t in texts]
+    known = {}
+    if use_memory:
+        known, hits, missed = translation_memory.lookup_many(normalized, src_lang, tgt_lang, model_id)
+        if memory_counts is not None:
+            memory_counts['hits'] = memory_counts.get('hits', 0) + hits
+            memory_counts['misses'] = memory_counts.get('misses', 0) + missed
+    misses = [t for t in dict.fromkeys(normalized) if t and t not in known]
+    if misses:
+        fresh = dict(zip(misses, _marian_translate(misses, src_lang, tgt_lang)))
+        if use_memory:
+            translation_memory.store_many(fresh.items(), src_lang, tgt_lang, model_id)
+        known.update(fresh)
+    return [known.get(t, '') for t in normalized]
+
+def translate_segments(segments, src_lang: str, tgt_lang: str, use_memory: bool = None) -> SegmentStore:
+    # only the store's distinct lines are translated; every segment keeps its timing and text id
+    store = SegmentStore.coerce(segments)
+    table = translate_texts(store.table, src_lang, tgt_lang, use_memory=use_memory)
+    return SegmentStore(store.starts, store.ends, store.text_ids, table)
+
+def translate_transcripts(transcripts: Dict[str, Any], src_lang: str, tgt_lang: str,
+                          use_memory: bool = None, memory_counts: Dict[str, int] = None) -> Dict[str, SegmentStore]:
+    """Translate several models' transcripts into one language in a single planned pass.
+
+    Lines from every transcript are pooled so text shared between e.g. the Whisper and NeMo
+    outputs is translated once, then scattered back onto each model's own timeline.
+    """
+    stores = {name: SegmentStore.coerce(segments) for name, segments in transcripts.items()}
+    pooled = [text for store in stores.values() for text in store.table]
+    texts = translate_texts(pooled, src_lang, tgt_lang, use_memory=use_memory, memory_counts=memory_counts)
+    translated, pos = {}, 0
+    for name, store in stores.items():
+        count = len(store.table)
+        translated[name] = SegmentStore(store.starts, store.ends, store.text_ids, texts[pos:pos + count])
+        pos += count
+    return translated
+
+def _default_device() -> str:
+    return 'cuda' if torch.available() and torch.cuda.is_available() else 'cpu'
+
+def _load_whisper(size: str = WHISPER_MODEL_SIZE, quantize: str = None):
+    if quantize:
+        return quantization.load_quantized(f'whisper-{size}', lambda: whisper.load_model(size, device='cpu'))
+    return whisper.load_model(size)
+
+def _load_wav2vec2(model_id: str = WAV2VEC2_MODEL_ID, quantize: str = None):
+    components = {'model': model_id}
+    if quantize:
+        # a model object carries no tokenizer or feature extractor; those still come from the hub id
+        components = {'model': quantization.load_quantized(model_id, lambda: transformers.AutoModelForCTC.from_pretrained(model_id)),
+                      'tokenizer': model_id, 'feature_extractor': model_id}
+    return transformers.pipeline(
+        task='automatic-speech-recognition',
+        chunk_length_s=30,
+        stride_length_s=5,
+        return_timestamps='word',
+        **components
+    )
+
+def _load_silero(language: str = 'en', device: str = 'cpu'):
+    return torch.hub.load(
+        repo_or_dir='snakers4/silero-models',
+        model='silero_stt',
+        language=language,
+        device=device
+    )
+
+def _load_nemo(model_name: str = NEMO_MODEL_NAME):
+    return nemo_asr.models.ASRModel.from_pretrained(model_name=model_name)
+
+def _load_vosk(model_dir: str = str(VOSK_MODEL_DIR)):
+    from vosk import Model
+    if not Path(model_dir).exists():
+        raise FileNotFoundError(f'Download a Vosk model to {model_dir}')
+    return Model(model_dir)
+
+
+def default_model_params(backend: str, preset: str = None) -> Dict[str, Any]:
+    """Registry parameters `generate_subtitles` uses for each backend under `preset`
+    (default: the running job's, see `quantization`)."""
+    options = quantization.preset_options(preset)
+    # only present when it applies, so fp32 models keep their registry and cache keys
+    quantized = {'quantize': options['quantize']} if options['quantize'] and quantization.can_quantize() else {}
+    if backend == 'whisper':
+        return {'size': options['whisper_size'] or WHISPER_MODEL_SIZE, **quantized}
+    if backend == 'wav2vec2':
+        return {'model_id': WAV2VEC2_MODEL_ID, **quantized}
+    if backend == 'silero':
+        return {'language': 'en', 'device': _default_device()}
+    if backend == 'nemo':
+        return {'model_name': NEMO_MODEL_NAME}
+    if backend == 'vosk':
+        return {'model_dir': str(VOSK_MODEL_DIR)}
+    if backend == 'cascade':
+        first, escalate = cascade_backends()
+        return {'min_conf': cascade.min_confidence(), 'max_share': cascade.max_share(),
+                first: default_model_params(first, preset), escalate: default_model_params(escalate, preset)}
+    raise ValueError(f'unknown backend {backend!r}')
+
+def _result_cache_params(backend: str, window_s: float = 0.0) -> Dict[str, Any]:
+    # the device does not change the transcript, so it is not part of the cache key
+    params = {k: v for k, v in default_model_params(backend).items() if k != 'device'}
+    if window_s:
+        # decoded window by window (live Whisper, or while uploading): a different transcript
+        params['window_s'] = window_s
+    return params
+
+def prewarm_models(backends: List[str], progress_callback=None) -> Dict[str, str]:
+    """Load the given backends into the shared registry ahead of the first job."""
+    names = []
+    for b in backends:
+        plugin = backend_plugins.get_backend(b) if b else None
+        # composite backends load the models of the backends they run
+        for name in (plugin.uses() if plugin is not None and plugin.uses else [b]):
+            if name and name not in names:
+                names.append(name)
+    specs = [(name, default_model_params(name)) for name in names]
+    return model_registry.prewarm(specs, progress_callback=progress_callback)
+
+class JobCancelled(Exception):
+    """Raised by `generate_subtitles` when its `cancel_event` is set."""
 
 def _coerce_text(obj):
     if obj is None:
@@ -181,38 +402,637 @@ def _coerce_text(obj):
     except Exception:
         return ''
 
-def generate_subtitles(video_path: str, model_choice: str = 'whisper', target_langs: List[str] = None, progress_callback=None) -> Dict[str, Any]:
+def _audio_file(audio) -> Path:
+    """File path for backends that can only read audio from disk."""
+    return audio.ensure_wav() if isinstance(audio, AudioBuffer) else Path(audio)
+
+# Whisper decodes in ~30 s windows anyway; when segments are streamed, in-memory audio is
+# fed to it window by window (cut at silences) so each window's lines are reported as soon as
+# they are decoded. `SUBTITLE_STREAM_WINDOW_S=0` keeps whole-file decoding.
+try:
+    STREAM_WINDOW_S = float(os.environ.get('SUBTITLE_STREAM_WINDOW_S', '30'))
+except ValueError:
+    STREAM_WINDOW_S = 30.0
+
+def _whisper_segments(result) -> SegmentStore:
+    segs = result.get('segments', [])
+    return SegmentStore.from_columns([seg['start'] for seg in segs], [seg['end'] for seg in segs],
+                                     (seg['text'].strip() for seg in segs))
+
+def transcribe_whisper(audio, audio_duration: float, check_cancelled=None, on_segments=None) -> SegmentStore:
+    whisper_model = model_registry.get('whisper', **default_model_params('whisper'))
+    # windows only pay off for a live consumer; callers without one must pass None
+    windowed = (on_segments is not None and isinstance(audio, AudioBuffer)
+                and STREAM_WINDOW_S > 0 and audio.duration > STREAM_WINDOW_S)
+    if not windowed:
+        segments = _whisper_segments(whisper_model.transcribe(audio.as_float32() if isinstance(audio, AudioBuffer) else str(audio)))
+        if on_segments:
+            on_segments(segments)
+        return segments
+    windows = plan_shards(audio, max_chunk_s=STREAM_WINDOW_S, min_chunk_s=STREAM_WINDOW_S / 4)
+    merger, prompt = ShardMerger(total_end=audio.duration), None
+    for window in windows:
+        if check_cancelled:
+            check_cancelled()
+        chunk = audio.slice(window.start, window.end)
+        # carry the previous window's text over as context, like whisper does between its own windows
+        result = whisper_model.transcribe(chunk.as_float32(), initial_prompt=prompt)
+        window_segments = _whisper_segments(result)
+        on_segments(merger.add(window, window_segments))
+        if len(window_segments):
+            prompt = window_segments[-1]['text']
+    return merger.segments()
+
+def transcribe_wav2vec2(audio, audio_duration: float, check_cancelled=None, on_segments=None) -> SegmentStore:
+    wav2vec_pipeline = model_registry.get('wav2vec2', **default_model_params('wav2vec2'))
+    if isinstance(audio, AudioBuffer):
+        wav2vec_result = wav2vec_pipeline({'raw': audio.as_float32(), 'sampling_rate': audio.sample_rate})
+    else:
+        wav2vec_result = wav2vec_pipeline(str(audio))
+    if isinstance(wav2vec_result, dict) and 'chunks' in wav2vec_result:
+        chunks = [chunk for chunk in wav2vec_result['chunks'] if chunk.get('timestamp') and chunk.get('text', '').strip()]
+        segments = SegmentStore.from_columns([float(chunk['timestamp'][0]) for chunk in chunks],
+                                             [float(chunk['timestamp'][1]) for chunk in chunks],
+                                             (chunk['text'].strip() for chunk in chunks))
+    else:
+        segments = approximate_segments_from_text(wav2vec_result.get('text', ''), audio_duration)
+    if on_segments:
+        on_segments(segments)
+    return segments
+
+def transcribe_silero(audio, audio_duration: float, check_cancelled=None, on_segments=None) -> SegmentStore:
+    silero_params = default_model_params('silero')
+    silero_device = silero_params['device']
+    silero_model, silero_decoder, silero_utils = model_registry.get('silero', **silero_params)
+    read_batch, split_into_batches, read_audio, prepare_model_input = silero_utils
+    if isinstance(audio, AudioBuffer):
+        silero_inputs = [[torch.as_tensor(audio.as_float32())]]
+    else:
+        silero_inputs = [read_batch(batch) for batch in split_into_batches([str(audio)], batch_size=1)]
+    silero_text = []
+    for batch_audio in silero_inputs:
+        input_tensor = prepare_model_input(batch_audio).to(silero_device)
+        output = silero_model(input_tensor)
+        silero_text.append(silero_decoder(output[0].cpu()))
+    combined_text = ' '.join(silero_text)
+    segments = approximate_segments_from_text(combined_text, audio_duration)
+    if on_segments:
+        on_segments(segments)
+    return segments
+
+def transcribe_nemo(audio, audio_duration: float, check_cancelled=None, on_segments=None) -> SegmentStore:
+    segments = _transcribe_nemo(audio, audio_duration)
+    if on_segments:
+        on_segments(segments)
+    return segments
+
+def _transcribe_nemo(audio, audio_duration: float) -> SegmentStore:
+    nemo_model = model_registry.get('nemo', **default_model_params('nemo'))
+    audio_path = _audio_file(audio)
+    try:
+        transcribe_result = nemo_model.transcribe([str(audio_path)], return_timestamps='word')
+    except TypeError:
+        transcribe_result = nemo_model.transcribe([str(audio_path)])
+    nemo_transcripts = []
+    nemo_word_ts = None
+    if isinstance(transcribe_result, (list, tuple)) and len(transcribe_result) == 2:
+        nemo_transcripts, nemo_word_ts = transcribe_result[0], transcribe_result[1]
+    else:
+        nemo_transcripts = transcribe_result
+    if isinstance(nemo_transcripts, (list, tuple)):
+        nemo_transcripts = [_coerce_text(t) for t in nemo_transcripts]
+    elif isinstance(nemo_transcripts, str):
+        nemo_transcripts = [nemo_transcripts]
+    else:
+        try:
+            nemo_transcripts = [_coerce_text(t) for t in list(nemo_transcripts)]
+        except Exception:
+            nemo_transcripts = []
+
+    if nemo_word_ts and len(nemo_word_ts) > 0:
+        # one file was transcribed, so only the first utterance carries words
+        starts, ends, tokens = [], [], []
+        for tok in nemo_word_ts[0]:
+            if isinstance(tok, dict):
+                word = tok.get('word') or tok.get('text') or ''
+                start = tok.get('start_time', tok.get('start', 0.0))
+                end = tok.get('end_time', tok.get('end', start))
+            else:
+                word = getattr(tok, 'word', None) or getattr(tok, 'text', None) or str(tok)
+                start = getattr(tok, 'start_time', None)
+                if start is None:
+                    start = getattr(tok, 'start', 0.0)
+                end = getattr(tok, 'end_time', None)
+                if end is None:
+                    end = getattr(tok, 'end', start)
+            try:
+                start = float(start) if start is not None else 0.0
+            except Exception:
+                start = 0.0
+            try:
+                end = float(end) if end is not None else start
+            except Exception:
+                end = start
+            starts.append(start)
+            ends.append(end)
+            tokens.append(str(word))
+        return WordStore.from_columns(starts, ends, tokens).aggregate()
+    if nemo_transcripts:
+        return approximate_segments_from_text(nemo_transcripts[0], audio_duration)
+    return SegmentStore()
+
+def _iter_pcm_frames(audio, frames: int = 4000):
+    """Yield raw int16 PCM in `frames`-sized pieces from an AudioBuffer or a WAV file."""
+    if isinstance(audio, AudioBuffer):
+        for start in range(0, audio.num_samples, frames):
+            yield bytes(audio.pcm_bytes(start, start + frames))
+        return
+    wf = wave.open(str(audio), 'rb')
+    try:
+        while True:
+            data = wf.readframes(frames)
+            if len(data) == 0:
+                break
+            yield data
+    finally:
+        wf.close()
+
+def _audio_sample_rate(audio) -> int:
+    if isinstance(audio, AudioBuffer):
+        return audio.sample_rate
+    with contextlib.closing(wave.open(str(audio), 'rb')) as wf:
+        return wf.getframerate()
+
+def _complete_word_groups(words: List[Dict[str, Any]], max_words: int = 10):
+    """Split off the leading words that already form full `aggregate_words` segments.
+
+    Returns (segments, remaining words); aggregating the pieces one after another gives
+    the same segments as aggregating all words at once.
+    """
+    count, cut = 0, 0
+    for idx, word in enumerate(words):
+        if word.get('word', '').strip():
+            count += 1
+            if count % max_words == 0:
+                cut = idx + 1
+    return aggregate_words(words[:cut], max_words), words[cut:]
+
+def _vosk_results(audio, check_cancelled=None):
+    """Yield Vosk's word dicts (`word`, `start`, `end`, `conf`), one list per recognized utterance."""
+    from vosk import KaldiRecognizer
+    vosk_model = model_registry.get('vosk', **default_model_params('vosk'))
+    recognizer = KaldiRecognizer(vosk_model, _audio_sample_rate(audio))
+    recognizer.SetWords(True)
+    for data in _iter_pcm_frames(audio):
+        if check_cancelled:
+            check_cancelled()
+        if recognizer.AcceptWaveform(data):
+            yield json.loads(recognizer.Result()).get('result', [])
+    yield json.loads(recognizer.FinalResult()).get('result', [])
+
+def transcribe_vosk(audio, audio_duration: float, check_cancelled=None, on_segments=None) -> SegmentStore:
+    batches, pending = [], []
+    for words in _vosk_results(audio, check_cancelled):
+        pending.extend(words)
+        complete, pending = _complete_word_groups(pending)
+        if complete:
+            batches.append(complete)
+            if on_segments:
+                on_segments(complete)
+    tail = aggregate_words(pending)
+    if on_segments and tail:
+        on_segments(tail)
+    return SegmentStore.concat(batches + [tail])
+
+def cascade_backends() -> List[str]:
+    """The backends `cascade` runs: Vosk, then the configured or first installed escalation backend."""
+    configured = cascade.configured_backend()
+    candidates = (configured,) if configured else cascade.ESCALATION_BACKENDS
+    for name in candidates:
+        plugin = backend_plugins.get_backend(name)
+        if plugin is not None and plugin.available():
+            return ['vosk', name]
+    return ['vosk', candidates[0]]
+
+def transcribe_cascade(audio, audio_duration: float, check_cancelled=None, on_segments=None) -> SegmentStore:
+    escalate = cascade_backends()[1]
+    if not isinstance(audio, AudioBuffer):
+        audio = read_wav(audio)
+    with span('cascade_pass', 'vosk', audio_s=audio.duration):
+        words = [w for batch in _vosk_results(audio, check_cancelled) for w in batch]
+    # share of the audio Whisper/NeMo had to redo: the number that decides what the cascade saves
+    with span('cascade_escalate', escalate) as sp:
+        segments, stats = cascade.run_cascade(audio, words, TRANSCRIBERS[escalate], check_cancelled=check_cancelled)
+        sp.set(**stats)
+    if on_segments and len(segments):
+        on_segments(segments)
+    return segments
+
+# Built-in backends, in the order `model_choice='all'` runs (and reports) them. Availability
+# is a find_spec check; nothing heavy is imported until a backend's model is loaded.
+register_backend('whisper', requires=('whisper', 'torch'), label='Whisper', transcribe=transcribe_whisper,
+                 loader=_load_whisper, shardable=True)
+register_backend('wav2vec2', requires=('transformers', 'torch'), label='Wav2Vec2', transcribe=transcribe_wav2vec2,
+                 loader=_load_wav2vec2, start_message='Starting Wav2Vec2 (transformers pipeline)...')
+register_backend('silero', requires=('torch',), label='Silero', transcribe=transcribe_silero,
+                 loader=_load_silero, shardable=True)
+register_backend('nemo', requires=('nemo', 'torch'), label='NeMo', transcribe=transcribe_nemo,
+                 loader=_load_nemo, shardable=True)
+register_backend('vosk', requires=('vosk',), label='Vosk', transcribe=transcribe_vosk,
+                 loader=_load_vosk, sizer=lambda _model: directory_bytes(VOSK_MODEL_DIR))
+# composite: not part of 'all', whose full passes already include both of its models
+register_backend('cascade', requires=('vosk',), label='Cascade (Vosk + Whisper/NeMo)', transcribe=transcribe_cascade,
+                 uses=cascade_backends, start_message='Starting Vosk, re-checking unsure parts with Whisper/NeMo...')
+register_backend('marian', kind='translation', requires=('transformers', 'torch'), label='MarianMT')
+backend_plugins.load_external_plugins()
+
+_asr_plugins = backend_plugins.backends('asr')
+BACKEND_ORDER = [p.name for p in _asr_plugins]
+BACKEND_LABELS = {p.name: p.label for p in _asr_plugins}
+BACKEND_START_MESSAGES = {p.name: p.start_message for p in _asr_plugins if p.start_message}
+TRANSCRIBERS = {p.name: p.transcribe for p in _asr_plugins}
+ALL_BACKENDS = [p.name for p in _asr_plugins if p.uses is None]
+
+def backend_available(name: str) -> bool:
+    """Whether a backend's packages are installed (checked without importing them)."""
+    plugin = backend_plugins.get_backend(name)
+    return plugin is not None and name in TRANSCRIBERS and plugin.available()
+
+def selected_backends(model_choice: str) -> List[str]:
+    """The installed backends a job with `model_choice` (a backend name or 'all') runs."""
+    model_choice = (model_choice or '').lower()
+    if model_choice == 'all':
+        return [name for name in ALL_BACKENDS if backend_available(name)]
+    return [model_choice] if model_choice in BACKEND_ORDER and backend_available(model_choice) else []
+
+def translation_available() -> bool:
+    plugin = backend_plugins.get_backend('marian')
+    return plugin is not None and plugin.available()
+
+def _parallel_backends_from_env() -> bool:
+    return os.environ.get('SUBTITLE_PARALLEL_BACKENDS', '').lower() in ('1', 'true', 'yes')
+
+def backend_thread_limits(backends: List[str]) -> Dict[str, int]:
+    """CPU threads each backend process may use so that together they don't oversubscribe cores.
+
+    `SUBTITLE_BACKEND_THREADS` overrides the per-backend count; otherwise cores are split evenly.
+    """
+    raw = os.environ.get('SUBTITLE_BACKEND_THREADS')
+    if raw:
+        try:
+            return {name: max(1, int(raw)) for name in backends}
+        except ValueError:
+            pass
+    per_backend = max(1, (os.cpu_count() or 1) // max(len(backends), 1))
+    return {name: per_backend for name in backends}
+
+def _limit_worker_threads(threads: int) -> None:
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    # torch reads OMP_NUM_THREADS when it is imported; only an already imported one needs telling
+    if backend_plugins.imported('torch'):
+        try:
+            torch.set_num_threads(threads)
+        except Exception:
+            pass
+
+def _transcribe_in_worker(name: str, audio_ref, audio_duration: float, preset: str = None) -> SegmentStore:
+    # `audio_ref` is a WAV path or an `AudioBuffer.share()` descriptor
+    audio = AudioBuffer.attach(audio_ref) if isinstance(audio_ref, dict) else Path(audio_ref)
+    try:
+        with quantization.using(preset):
+            return TRANSCRIBERS[name](audio, audio_duration)
+    except Exception as exc:
+        # backend exceptions are not always picklable; re-raise with the same message
+        raise RuntimeError(str(exc)) from None
+    finally:
+        if isinstance(audio, AudioBuffer):
+            audio.detach()
+
+# One long-lived single-process executor per backend, so each backend keeps its
+# models warm in its own process's registry across jobs.
+_backend_executors = {}
+_backend_executors_lock = threading.Lock()
+
+def _backend_executor(name: str, threads: int, workers: int = 1) -> ProcessPoolExecutor:
+    with _backend_executors_lock:
+        entry = _backend_executors.get(name)
+        if entry is not None and entry[1] == (threads, workers):
+            return entry[0]
+        if entry is not None:
+            entry[0].shutdown(wait=False)
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_limit_worker_threads,
+            initargs=(threads,),
+        )
+        _backend_executors[name] = (executor, (threads, workers))
+        return executor
+
+# Backends whose long inputs are split at silences and transcribed shard by shard.
+SHARDED_BACKENDS = tuple(p.name for p in _asr_plugins if p.shardable)
+
+def shard_settings() -> Dict[str, Any]:
+    """Sharding configuration from `SUBTITLE_SHARD_AUDIO`, `SUBTITLE_SHARD_MAX_S` and `SUBTITLE_SHARD_WORKERS`."""
+    cpus = os.cpu_count() or 1
+    try:
+        max_chunk_s = float(os.environ.get('SUBTITLE_SHARD_MAX_S', '120'))
+    except ValueError:
+        max_chunk_s = 120.0
+    try:
+        workers = int(os.environ.get('SUBTITLE_SHARD_WORKERS', '0')) or max(1, cpus // 2)
+    except ValueError:
+        workers = max(1, cpus // 2)
+    return {
+        'enabled': os.environ.get('SUBTITLE_SHARD_AUDIO', '').lower() in ('1', 'true', 'yes'),
+        'max_chunk_s': max_chunk_s,
+        'workers': workers,
+    }
+
+def transcribe_sharded(name: str, audio: AudioBuffer, shards, workers: int, check_cancelled=None,
+                       on_segments=None) -> SegmentStore:
+    """Transcribe `shards` of `audio` in a process pool and merge them into one timeline.
+
+    Workers attach to one shared copy of the PCM and each only decodes its own chunk, so
+    peak memory per worker follows the chunk length rather than the video length.
+    `on_segments` receives merged segments in timeline order as soon as every earlier
+    shard has finished.
+    """
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    executor = _backend_executor(name, threads, workers)
+    futures = {}
+    done, merged_upto = {}, 0
+    merger = ShardMerger(total_end=audio.duration)
+    try:
+        for shard in shards:
+            descriptor = audio.share_slice(shard.start, shard.end)
+            futures[executor.submit(_transcribe_in_worker, name, descriptor, shard.end - shard.start,
+                                    quantization.active())] = shard
+        for future in as_completed(futures):
+            if check_cancelled:
+                check_cancelled()
+            shard = futures[future]
+            done[shard.index] = (shard, future.result())
+            if on_segments:
+                # extend the finished prefix of the timeline
+                while merged_upto < len(shards) and shards[merged_upto].index in done:
+                    new = merger.add(*done[shards[merged_upto].index])
+                    merged_upto += 1
+                    if len(new):
+                        on_segments(new)
+    finally:
+        for future in futures:
+            future.cancel()
+        audio.release()
+    return merge_shard_segments(list(done.values()), total_end=audio.duration)
+
+def transcribe_streaming(name: str, ingest, check_cancelled=None, on_segments=None) -> SegmentStore:
+    """Transcribe the windows of a `StreamingIngest` one by one while the upload continues.
+
+    Each window is decoded as soon as its audio is available; `on_segments` receives the
+    merged timeline in order after every window.
+    """
+    done = []
+    # segments past the last window's core belong to the next window
+    merger = ShardMerger(total_end=float('inf'))
+    for shard, window in ingest.windows(check_cancelled=check_cancelled):
+        if check_cancelled:
+            check_cancelled()
+        done.append((shard, TRANSCRIBERS[name](window, window.duration, check_cancelled=check_cancelled)))
+        window.discard_wav()
+        if on_segments:
+            new = merger.add(*done[-1])
+            if len(new):
+                on_segments(new)
+    return merge_shard_segments(done)
+
+def generate_subtitles(video_path: str, model_choice: str = 'whisper', target_langs: List[str] = None, progress_callback=None,
+                       span_callback=None, **options) -> Dict[str, Any]:
     """Generate subtitles for the given video using the chosen model.
 
     Optional `progress_callback` is a callable that will be invoked with a string message
     describing current progress. This is useful for streaming progress to UIs.
 
-    Returns a dict with keys: 'srt_paths' (list of generated srt files) and 'errors'.
+    Optional `segment_callback` is called with `{'model', 'index', 'segments', 'elapsed'}`
+    each time a backend decodes new lines (per Vosk result, Whisper window or shard), so
+    UIs can show subtitles before the whole file is done. `index` is the position of the
+    first new segment in that model's transcript; `elapsed` is seconds since the job began.
+
+    Optional `cancel_event` (e.g. a `threading.Event`) is checked between stages; once it
+    is set the job stops with `JobCancelled`.
+
+    With `parallel_backends=True` (or `SUBTITLE_PARALLEL_BACKENDS=1`) the backends selected by
+    `model_choice='all'` run concurrently in separate worker processes, each limited to its
+    share of the CPU threads.
+
+    `audio_mode='memory'` (the default when numpy is available, or `SUBTITLE_AUDIO_MODE`)
+    decodes the audio once into an in-memory buffer that every backend reads directly;
+    `audio_mode='wav'` writes a WAV to `output/<video>/audio/` as before.
+
+    `shard_audio=True` (or `SUBTITLE_SHARD_AUDIO=1`) splits long in-memory audio at silences
+    and transcribes the shards of Whisper, Silero and NeMo in parallel worker processes.
+
+    `ingest` (a `streaming_ingest.StreamingIngest`) starts work on an upload that is still in
+    progress: its audio is decoded as chunks arrive and the first backend transcribes it
+    window by window; the remaining backends run once the upload is complete. Files that
+    cannot be decoded from a prefix make the job wait for the upload instead.
+
+    Results are looked up in the content-addressed `result_cache` first (disable with
+    `use_cache=False` or `SUBTITLE_RESULT_CACHE=0`), so repeat uploads only run the backends
+    and translations that are not cached yet.
+
+    `stage_gate` (an object with `acquire(stage)` and `release(stage)`, such as
+    `batch_subtitles.StageGates`) is entered at `'extract'`, `'asr'` and `'translate'`. A job
+    holds one stage at a time, so a batch runner can bound how many files are in each stage.
+
+    `preset` (`'accuracy'`, `'balanced'` or `'speed'`, default `SUBTITLE_PRESET`) selects fp32
+    or int8-quantized CPU models and the Whisper size; see `quantization`.
+
+    Every stage is measured with a `pipeline_metrics` span (wall and CPU time, memory, real-time
+    factor); optional `span_callback` receives each span as it ends.
+
+    Returns a dict with keys: 'srt_paths' (list of generated srt files), 'errors' and
+    'metrics' (`time_to_first_segment` in seconds, or None if nothing was decoded, and
+    `spans`, the per-stage totals of `JobRecorder.summary`).
     """
-    def _progress(msg: str):
+    configure_torch_threads()
+    stage_gate = options.pop('stage_gate', None)
+    preset = quantization.resolve_preset(options.pop('preset', None))
+    held = []
+
+    def _enter_stage(stage):
+        # moving on to a stage frees the slot of the previous one
+        if held:
+            stage_gate.release(held.pop())
+        stage_gate.acquire(stage)
+        held.append(stage)
+
+    recorder = pipeline_metrics.JobRecorder(span_callback)
+    try:
+        with pipeline_metrics.recording(recorder), quantization.using(preset):
+            with span('job', backend=(model_choice or '').lower() or None, preset=preset):
+                result = _generate_subtitles(video_path, model_choice, target_langs, progress_callback,
+                                             enter_stage=_enter_stage if stage_gate is not None else None, **options)
+    finally:
+        if held:
+            stage_gate.release(held.pop())
+    result['metrics']['spans'] = recorder.summary()
+    return result
+
+def _generate_subtitles(video_path: str, model_choice: str = 'whisper', target_langs: List[str] = None, progress_callback=None,
+                        cancel_event=None, parallel_backends: bool = None, audio_mode: str = None,
+                        use_cache: bool = None, shard_audio: bool = None, segment_callback=None,
+                        ingest=None, enter_stage=None) -> Dict[str, Any]:
+    started = time.monotonic()
+    _enter_stage = enter_stage or (lambda stage: None)
+
+    def _progress(msg):
         try:
             if progress_callback:
-                progress_callback(str(msg))
+                # structured messages (e.g. 'partial') are passed through for the UI to decode
+                progress_callback(msg if isinstance(msg, dict) else str(msg))
         except Exception:
             # Never fail the transcription because of progress callback errors
             pass
+
+    streamed = {}
+    metrics = {'time_to_first_segment': None}
+
+    def _emit_segments(name, segments):
+        if not segments:
+            return
+        index = streamed.get(name, 0)
+        streamed[name] = index + len(segments)
+        elapsed = round(time.monotonic() - started, 3)
+        if metrics['time_to_first_segment'] is None:
+            metrics['time_to_first_segment'] = elapsed
+            _progress(f'First subtitles after {elapsed:.1f}s ({BACKEND_LABELS.get(name, name)})')
+        try:
+            if segment_callback:
+                segment_callback({'model': name, 'index': index, 'segments': SegmentStore.coerce(segments).to_records(),
+                                  'elapsed': elapsed})
+        except Exception:
+            pass
+
+    def _segment_sink(name):
+        # without a live consumer backends decode in one piece (Whisper would otherwise window)
+        if segment_callback is None:
+            return None
+        return lambda segs: _emit_segments(name, segs)
+
+    def _check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled('job cancelled')
+
     video = Path(video_path)
-    if not video.exists():
+    if ingest is not None and not ingest.session.complete and not ingest.streamable():
+        _progress('Waiting for the upload to finish (this file cannot be decoded before it is complete)...')
+        ingest.wait_complete(_check_cancelled)
+    if ingest is not None and ingest.session.complete and not ingest.started:
+        # finished uploading before the job started: plain extraction is just as fast
+        ingest = None
+    if ingest is None and not video.exists():
         raise FileNotFoundError(video_path)
     base_name = video.stem
     out_dir = ensure_dir(Path('output') / base_name)
     audio_dir = ensure_dir(out_dir / 'audio')
     srt_dir = ensure_dir(out_dir / 'srt')
 
-    _progress('Extracting audio...')
-    audio_path = extract_audio_ffmpeg(video, audio_dir)
-    audio_duration = get_audio_duration(audio_path)
-    _progress(f'Audio extracted ({audio_duration:.2f}s)')
+    model_choice = (model_choice or '').lower()
+    backends = selected_backends(model_choice)
+    if use_cache is None:
+        use_cache = cache_enabled()
+    cache = result_cache if use_cache else None
 
     transcripts_by_model = {}
     errors = []
+    if model_choice != 'all' and not backends:
+        errors.append(f'{model_choice}: backend is not installed')
+    asr_keys = {}
+    cached_segments = {}
 
-    model_choice = (model_choice or '').lower()
+    def _lookup_cached(fingerprint):
+        for name in backends:
+            if name in cached_segments:
+                continue
+            windowed = (name == 'whisper' and segment_callback is not None) or (ingest is not None and name == backends[0])
+            asr_keys[name] = cache.asr_key(fingerprint, name, _result_cache_params(name, STREAM_WINDOW_S if windowed else 0.0))
+            segments = cache.get_segments('asr', asr_keys[name])
+            if segments is not None:
+                cached_segments[name] = segments
+
+    _check_cancelled()
+    _enter_stage('extract')
+    audio = None
+    audio_duration = None
+    stream_backend = stream_segments = None
+    if cache is not None and ingest is None:
+        # a known upload (same bytes, any file name) can skip extraction entirely
+        with span('cache_lookup'):
+            video_digest = file_digest(video)
+            source = cache.lookup_source(video_digest)
+        if source:
+            audio_duration = source['duration']
+            _lookup_cached(source['fingerprint'])
+
+    if audio_duration is None or any(name not in cached_segments for name in backends):
+        if audio_mode is None:
+            audio_mode = os.environ.get('SUBTITLE_AUDIO_MODE') or ('memory' if np is not None else 'wav')
+        if ingest is not None:
+            stream_backend = backends[0] if backends else None
+            try:
+                if stream_backend:
+                    _progress(f'Transcribing with {BACKEND_LABELS[stream_backend]} while the upload continues...')
+                    with span('asr', backend=stream_backend, mode='streaming') as asr_span:
+                        stream_segments = transcribe_streaming(stream_backend, ingest, check_cancelled=_check_cancelled,
+                                                               on_segments=lambda segs: _emit_segments(stream_backend, segs))
+                        asr_span.set(audio_s=ingest.decoded_seconds)
+                else:
+                    _progress('Extracting audio while the upload continues...')
+                with span('extract', mode='streaming') as extract_span:
+                    audio = ingest.audio(wav_dir=audio_dir, check_cancelled=_check_cancelled)
+                    extract_span.set(audio_s=audio.duration)
+                _progress(f'Upload complete; {ingest.decoded_during_upload:.0f}s of audio were decoded before it finished')
+            except JobCancelled:
+                raise
+            except Exception as exc:
+                _progress(f'Streaming ingest stopped ({exc}); waiting for the upload')
+                ingest.close()
+                ingest.wait_complete(_check_cancelled)
+                # the backend starts over on the complete file
+                streamed.pop(stream_backend, None)
+                stream_backend = stream_segments = audio = None
+            if cache is not None:
+                video_digest = file_digest(video)
+        if audio is not None:
+            audio_duration = audio.duration
+        elif audio_mode == 'memory':
+            _progress('Extracting audio...')
+            with span('extract', mode='memory') as extract_span:
+                audio = extract_audio_pcm(video, wav_dir=audio_dir)
+                audio_duration = audio.duration
+                extract_span.set(audio_s=audio_duration)
+        else:
+            _progress('Extracting audio...')
+            with span('extract', mode='wav') as extract_span:
+                audio = extract_audio_ffmpeg(video, audio_dir)
+                audio_duration = get_audio_duration(audio)
+                extract_span.set(audio_s=audio_duration)
+        _progress(f'Audio extracted ({audio_duration:.2f}s)')
+        try:
+            # the editor draws its timeline from these instead of downloading the WAV
+            with span('peaks', audio_s=audio_duration):
+                write_peaks(audio, peaks_path(audio_dir, base_name))
+        except Exception as exc:
+            _progress(f'Waveform peaks skipped: {exc}')
+        if cache is not None:
+            with span('cache_lookup'):
+                fingerprint = audio_fingerprint(audio)
+                cache.remember_source(video_digest, fingerprint, audio_duration)
+                _lookup_cached(fingerprint)
+    else:
+        _progress(f'Audio matched the result cache ({audio_duration:.2f}s), skipping extraction')
 
     def _save_segments_and_register(name, segments):
         transcripts_by_model[name] = segments
@@ -225,198 +1045,189 @@ def generate_subtitles(video_path: str, model_choice: str = 'whisper', target_la
             pass
         return path
 
-    # Whisper
-    if model_choice in ('whisper', 'all') and whisper is not None:
-        try:
-            _progress('Starting Whisper...')
-            model_size = 'small'
-            whisper_model = whisper.load_model(model_size)
-            result = whisper_model.transcribe(str(audio_path))
-            whisper_segments = [
-                {'start': seg['start'], 'end': seg['end'], 'text': seg['text'].strip()}
-                for seg in result.get('segments', [])
-            ]
-            _save_segments_and_register('whisper', whisper_segments)
-            _progress('Whisper finished')
-        except Exception as exc:
-            errors.append(f'whisper: {exc}')
-            _progress(f'Whisper error: {exc}')
+    def _store_result(name, segments):
+        if cache is not None and name in asr_keys:
+            try:
+                cache.put_segments('asr', asr_keys[name], segments, meta={'backend': name, 'video': video.name})
+            except Exception as exc:
+                _progress(f'Result cache write failed for {name}: {exc}')
 
-    # Hugging Face Wav2Vec2
-    if model_choice in ('wav2vec2', 'all') and hf_asr_pipeline is not None:
-        try:
-            _progress('Starting Wav2Vec2 (transformers pipeline)...')
-            wav2vec_model_id = 'facebook/wav2vec2-large-960h-lv60-self'
-            wav2vec_pipeline = hf_asr_pipeline(
-                task='automatic-speech-recognition',
-                model=wav2vec_model_id,
-                chunk_length_s=30,
-                stride_length_s=5,
-                return_timestamps='word'
-            )
-            wav2vec_result = wav2vec_pipeline(str(audio_path))
-            if isinstance(wav2vec_result, dict) and 'chunks' in wav2vec_result:
-                wav2vec_segments = [
-                    {'start': float(chunk['timestamp'][0]), 'end': float(chunk['timestamp'][1]), 'text': chunk['text'].strip()}
-                    for chunk in wav2vec_result['chunks']
-                    if chunk.get('timestamp') and chunk.get('text', '').strip()
-                ]
-            else:
-                wav2vec_segments = approximate_segments_from_text(wav2vec_result.get('text', ''), audio_duration)
-            _save_segments_and_register('wav2vec2', wav2vec_segments)
-            _progress('Wav2Vec2 finished')
-        except Exception as exc:
-            errors.append(f'wav2vec2: {exc}')
-            _progress(f'Wav2Vec2 error: {exc}')
+    _enter_stage('asr')
+    if stream_backend and stream_segments is not None:
+        # transcribed during the upload; its lines were already streamed to the caller
+        cached_segments.pop(stream_backend, None)
+        _save_segments_and_register(stream_backend, stream_segments)
+        _store_result(stream_backend, stream_segments)
+        _progress(f'{BACKEND_LABELS[stream_backend]} finished')
+    for name in backends:
+        if name in cached_segments:
+            _emit_segments(name, cached_segments[name])
+            _save_segments_and_register(name, cached_segments[name])
+            _progress(f'{BACKEND_LABELS[name]} loaded from cache')
+    pending = [name for name in backends if name not in cached_segments and name not in transcripts_by_model]
 
-    # Silero
-    if model_choice in ('silero', 'all') and torch is not None:
-        try:
-            _progress('Starting Silero...')
-            silero_device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            silero_model, silero_decoder, silero_utils = torch.hub.load(
-                repo_or_dir='snakers4/silero-models',
-                model='silero_stt',
-                language='en',
-                device=silero_device
-            )
-            read_batch, split_into_batches, read_audio, prepare_model_input = silero_utils
-            silero_batches = split_into_batches([str(audio_path)], batch_size=1)
-            silero_text = []
-            for batch in silero_batches:
-                audio = read_batch(batch)
-                input_tensor = prepare_model_input(audio).to(silero_device)
-                output = silero_model(input_tensor)
-                silero_text.append(silero_decoder(output[0].cpu()))
-            combined_text = ' '.join(silero_text)
-            silero_segments = approximate_segments_from_text(combined_text, audio_duration)
-            _save_segments_and_register('silero', silero_segments)
-            _progress('Silero finished')
-        except Exception as exc:
-            errors.append(f'silero: {exc}')
-            _progress(f'Silero error: {exc}')
+    if parallel_backends is None:
+        parallel_backends = _parallel_backends_from_env()
+    shard_config = shard_settings()
+    if shard_audio is None:
+        shard_audio = shard_config['enabled']
+    shards = None
 
-    # NeMo
-    if model_choice in ('nemo', 'all') and nemo_asr is not None:
-        try:
-            _progress('Starting NeMo...')
-            nemo_model_name = 'stt_en_conformer_ctc_small'
-            nemo_model = nemo_asr.models.ASRModel.from_pretrained(model_name=nemo_model_name)
-            try:
-                transcribe_result = nemo_model.transcribe([str(audio_path)], return_timestamps='word')
-            except TypeError:
-                transcribe_result = nemo_model.transcribe([str(audio_path)])
-            nemo_transcripts = []
-            nemo_word_ts = None
-            if isinstance(transcribe_result, (list, tuple)) and len(transcribe_result) == 2:
-                nemo_transcripts, nemo_word_ts = transcribe_result[0], transcribe_result[1]
-            else:
-                nemo_transcripts = transcribe_result
-            if isinstance(nemo_transcripts, (list, tuple)):
-                nemo_transcripts = [_coerce_text(t) for t in nemo_transcripts]
-            elif isinstance(nemo_transcripts, str):
-                nemo_transcripts = [nemo_transcripts]
-            else:
-                try:
-                    nemo_transcripts = [_coerce_text(t) for t in list(nemo_transcripts)]
-                except Exception:
-                    nemo_transcripts = []
-
-            if nemo_word_ts:
-                normalized_word_ts = []
-                for utt in nemo_word_ts:
-                    utt_tokens = []
-                    for tok in utt:
-                        if isinstance(tok, dict):
-                            word = tok.get('word') or tok.get('text') or ''
-                            start = tok.get('start_time', tok.get('start', 0.0))
-                            end = tok.get('end_time', tok.get('end', start))
-                        else:
-                            word = getattr(tok, 'word', None) or getattr(tok, 'text', None) or str(tok)
-                            start = getattr(tok, 'start_time', None)
-                            if start is None:
-                                start = getattr(tok, 'start', 0.0)
-                            end = getattr(tok, 'end_time', None)
-                            if end is None:
-                                end = getattr(tok, 'end', start)
-                        try:
-                            start = float(start) if start is not None else 0.0
-                        except Exception:
-                            start = 0.0
-                        try:
-                            end = float(end) if end is not None else start
-                        except Exception:
-                            end = start
-                        utt_tokens.append({'word': str(word).strip(), 'start': start, 'end': end})
-                    normalized_word_ts.append(utt_tokens)
-                nemo_word_ts = normalized_word_ts
-
-            words = []
-            if nemo_word_ts and len(nemo_word_ts) > 0:
-                for token in nemo_word_ts[0]:
-                    words.append({'word': token.get('word', ''), 'start': token.get('start', 0.0), 'end': token.get('end', 0.0)})
-                nemo_segments = aggregate_words(words)
-            elif nemo_transcripts:
-                nemo_segments = approximate_segments_from_text(nemo_transcripts[0], audio_duration)
-            else:
-                nemo_segments = []
-            _save_segments_and_register('nemo', nemo_segments)
-            _progress('NeMo finished')
-        except Exception as exc:
-            errors.append(f'nemo: {exc}')
-            _progress(f'NeMo error: {exc}')
+    def _record_error(name, exc):
+        errors.append(f'{name}: {exc}')
+        _progress(f'{BACKEND_LABELS[name]} error: {exc}')
 
-    # Vosk
-    if model_choice in ('vosk', 'all'):
+    if parallel_backends and len(pending) > 1:
+        # Independent backends run side by side in their own processes; each model's
+        # SRT is saved and announced as soon as that backend finishes.
+        _check_cancelled()
+        threads = backend_thread_limits(pending)
+        audio_ref = audio.share() if isinstance(audio, AudioBuffer) else str(audio)
+        futures = {}
+        submitted = time.perf_counter()
+        for name in pending:
+            _progress(BACKEND_START_MESSAGES.get(name, f'Starting {BACKEND_LABELS[name]}...'))
+            futures[_backend_executor(name, threads[name]).submit(_transcribe_in_worker, name, audio_ref, audio_duration,
+                                                                  quantization.active())] = name
         try:
-            _progress('Starting Vosk...')
-            from vosk import Model, KaldiRecognizer
-            vosk_model_dir = Path('models/vosk-model-small-en-us-0.15')
-            if not vosk_model_dir.exists():
-                raise FileNotFoundError(f'Download a Vosk model to {vosk_model_dir}')
-            vosk_model = Model(str(vosk_model_dir))
-            wf = wave.open(str(audio_path), 'rb')
-            recognizer = KaldiRecognizer(vosk_model, wf.getframerate())
-            recognizer.SetWords(True)
-            words = []
-            while True:
-                data = wf.readframes(4000)
-                if len(data) == 0:
-                    break
-                if recognizer.AcceptWaveform(data):
-                    partial = json.loads(recognizer.Result())
-                    words.extend(partial.get('result', []))
-            final = json.loads(recognizer.FinalResult())
-            words.extend(final.get('result', []))
-            wf.close()
-            vosk_segments = aggregate_words(words)
-            _save_segments_and_register('vosk', vosk_segments)
-            _progress('Vosk finished')
-        except Exception as exc:
-            errors.append(f'vosk: {exc}')
-            _progress(f'Vosk error: {exc}')
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    _check_cancelled()
+                    succeeded = False
+                    try:
+                        segments = future.result()
+                        succeeded = True
+                    finally:
+                        # the backend ran in a worker process; only its wall time is known here
+                        pipeline_metrics.record('asr', name, wall_s=time.perf_counter() - submitted, audio_s=audio_duration,
+                                                mode='process', outcome='ok' if succeeded else 'error')
+                    # worker processes report a backend's lines in one batch when it finishes
+                    _emit_segments(name, segments)
+                    _save_segments_and_register(name, segments)
+                    _store_result(name, segments)
+                    _progress(f'{BACKEND_LABELS[name]} finished')
+                except JobCancelled:
+                    raise
+                except Exception as exc:
+                    _record_error(name, exc)
+        finally:
+            for future in futures:
+                future.cancel()
+            if isinstance(audio, AudioBuffer):
+                # workers that are still running keep their own mapping of the block
+                audio.release()
+    else:
+        for name in pending:
+            _check_cancelled()
+            try:
+                _progress(BACKEND_START_MESSAGES.get(name, f'Starting {BACKEND_LABELS[name]}...'))
+                if shard_audio and name in SHARDED_BACKENDS and isinstance(audio, AudioBuffer) and shards is None:
+                    shards = plan_shards(audio, max_chunk_s=shard_config['max_chunk_s'])
+                if shard_audio and name in SHARDED_BACKENDS and shards and len(shards) > 1:
+                    _progress(f'{BACKEND_LABELS[name]}: transcribing {len(shards)} shards')
+                    with span('asr', backend=name, audio_s=audio_duration, mode='sharded', shards=len(shards)):
+                        segments = transcribe_sharded(name, audio, shards, shard_config['workers'], check_cancelled=_check_cancelled,
+                                                      on_segments=_segment_sink(name))
+                else:
+                    with span('asr', backend=name, audio_s=audio_duration):
+                        segments = TRANSCRIBERS[name](audio, audio_duration, check_cancelled=_check_cancelled,
+                                                      on_segments=_segment_sink(name))
+                if segment_callback is None:
+                    # still counts towards time_to_first_segment
+                    _emit_segments(name, segments)
+                _save_segments_and_register(name, segments)
+                _store_result(name, segments)
+                _progress(f'{BACKEND_LABELS[name]} finished')
+            except JobCancelled:
+                raise
+            except Exception as exc:
+                _record_error(name, exc)
+    # keep the sequential mode's model order for srt_paths and translations
+    transcripts_by_model = {name: transcripts_by_model[name] for name in BACKEND_ORDER if name in transcripts_by_model}
 
     # Translations
+    _enter_stage('translate')
     srt_paths = []
     for model_name, segments in transcripts_by_model.items():
         path = srt_dir / f'{base_name}_{model_name}.srt'
         if path.exists():
             srt_paths.append(str(path))
-    if target_langs and MarianMTModel is not None and MarianTokenizer is not None:
+    marian_available = translation_available()
+    if target_langs and (marian_available or cache is not None):
         _progress('Starting translations...')
-        for tgt in target_langs:
-            tgt_code = resolve_language(tgt)
+        lang_codes = list(dict.fromkeys(resolve_language(tgt) for tgt in target_langs))
+
+        def _translate_language(tgt_code):
+            # returns this language's SRT paths, errors and translation memory lookups;
+            # progress is reported as each file is written
+            paths, lang_errors, tm_counts = [], [], {'hits': 0, 'misses': 0}
             marian_tgt_code = MARIAN_CODE_OVERRIDES.get(tgt_code, tgt_code)
             marian_src_code = MARIAN_CODE_OVERRIDES.get('en', 'en')
-            for model_name, segments in transcripts_by_model.items():
+            marian_id = translation_model_key(marian_src_code, marian_tgt_code)
+            _check_cancelled()
+            translation_keys, translated_by_model, from_cache = {}, {}, set()
+            for model_name in transcripts_by_model:
+                if cache is not None and model_name in asr_keys:
+                    translation_keys[model_name] = cache.translation_key(asr_keys[model_name], marian_src_code, marian_tgt_code, marian_id)
+                    cached = cache.get_segments('translations', translation_keys[model_name])
+                    if cached is not None:
+                        translated_by_model[model_name] = cached
+                        from_cache.add(model_name)
+            to_translate = {name: segs for name, segs in transcripts_by_model.items() if name not in translated_by_model}
+            if to_translate and marian_available:
+                try:
+                    # one deduplicated, length-bucketed pass over every model's lines
+                    with span('translate', lang=tgt_code, lines=sum(len(segs) for segs in to_translate.values())):
+                        translated_by_model.update(translate_transcripts(to_translate, src_lang=marian_src_code, tgt_lang=marian_tgt_code,
+                                                                         memory_counts=tm_counts))
+                except Exception as exc:
+                    for model_name in to_translate:
+                        lang_errors.append(f'translate {model_name}->{tgt_code}: {exc}')
+                        _progress(f'Translation error for {model_name}->{tgt_code}: {exc}')
+            for model_name in transcripts_by_model:
+                translated = translated_by_model.get(model_name)
+                if translated is None:
+                    continue
                 try:
-                    translated = translate_segments(segments, src_lang=marian_src_code, tgt_lang=marian_tgt_code)
+                    if model_name not in from_cache and model_name in translation_keys:
+                        cache.put_segments('translations', translation_keys[model_name], translated,
+                                           meta={'backend': model_name, 'lang': tgt_code, 'video': video.name})
                     out_path = srt_dir / f'{base_name}_{model_name}_{tgt_code}.srt'
                     segments_to_srt(translated, out_path)
-                    srt_paths.append(str(out_path))
-                    _progress(f'Translated {model_name} -> {tgt_code}')
+                    paths.append(str(out_path))
+                    _progress(f'Translated {model_name} -> {tgt_code}' + (' (cached)' if model_name in from_cache else ''))
                 except Exception as exc:
-                    errors.append(f'translate {model_name}->{tgt_code}: {exc}')
+                    lang_errors.append(f'translate {model_name}->{tgt_code}: {exc}')
                     _progress(f'Translation error for {model_name}->{tgt_code}: {exc}')
+            return paths, lang_errors, tm_counts
+
+        workers = translation_parallelism(len(lang_codes))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='translate') as pool:
+                # pool threads report their spans to this job and use its preset
+                results = list(pool.map(quantization.bound(pipeline_metrics.bound(_translate_language)), lang_codes))
+        else:
+            results = [_translate_language(code) for code in lang_codes]
+        # srt_paths and errors keep the requested language order
+        tm_hits = tm_lookups = 0
+        for paths, lang_errors, tm_counts in results:
+            srt_paths.extend(paths)
+            errors.extend(lang_errors)
+            tm_hits += tm_counts['hits']
+            tm_lookups += tm_counts['hits'] + tm_counts['misses']
+        if tm_lookups:
+            _progress(f'Translation memory: {tm_hits}/{tm_lookups} lines reused ({100.0 * tm_hits / tm_lookups:.0f}%)')
+
+    if cache is not None:
+        try:
+            cache.evict()
+        except Exception:
+            pass
+    try:
+        # SRTs were recorded as they were written; this also picks up the extracted audio
+        catalog.rescan(out_dir)
+    except Exception:
+        pass
 
-    return {'srt_paths': srt_paths, 'errors': errors}
+    return {'srt_paths': srt_paths, 'errors': errors, 'metrics': metrics}
@@ -0,0 +1,232 @@
+"""Bounded worker pool for subtitle jobs.
+
+`web/app.py` used to start one thread per `/generate` request. The scheduler below runs
+jobs on a fixed number of worker threads, keeps a bounded priority queue of pending jobs,
+reports queue position and ETA to each job's event queue, supports cancellation and
+drops finished jobs after a TTL.
+
+Each job owns a `Queue` of `{'type': ..., 'payload': ...}` events, the same shape the
+`/events/<job_id>` SSE stream already forwards to the browser.
+"""
+from queue import Queue
+from typing import Any, Callable, Dict, List, Optional
+import heapq
+import itertools
+import threading
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """Raised by `submit` when the pending queue is at capacity."""
+
+    def __init__(self, retry_after: float):
+        super().__init__('job queue is full')
+        self.retry_after = retry_after
+
+
+class SchedulerClosed(Exception):
+    """Raised by `submit` once the scheduler stopped accepting work."""
+
+
+QUEUED, RUNNING, DONE, ERROR, CANCELLED = 'queued', 'running', 'done', 'error', 'cancelled'
+FINISHED_STATES = (DONE, ERROR, CANCELLED)
+
+
+class Job:
+    def __init__(self, fn: Callable[['Job'], Any], priority: int = 0, meta: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.priority = priority
+        self.meta = meta or {}
+        self.state = QUEUED
+        self.events: Queue = Queue()
+        self.cancel_event = threading.Event()
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.final_event: Optional[Dict[str, Any]] = None
+
+    def put(self, msg_type: str, payload: Any) -> None:
+        event = {'type': msg_type, 'payload': payload}
+        if msg_type in FINISHED_STATES:
+            self.final_event = event
+        self.events.put(event)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'priority': self.priority,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            **self.meta,
+        }
+
+
+class JobScheduler:
+    """Fixed-size worker pool over a bounded priority queue.
+
+    Higher `priority` values run first; ties run in submission order. `fn(job)` is called
+    on a worker thread and its return value is sent as the job's `done` event.
+    """
+
+    def __init__(self, workers: int = 1, max_pending: int = 16, job_ttl: float = 3600.0,
+                 default_duration: float = 120.0, cleanup_interval: float = 60.0):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(0, int(max_pending))
+        self.job_ttl = job_ttl
+        self.default_duration = default_duration
+        self._jobs: Dict[str, Job] = {}
+        self._pending: List = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._running = 0
+        self._durations: List[float] = []
+        self._threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f'subtitle-worker-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+        self._janitor = threading.Thread(target=self._cleanup_loop, args=(cleanup_interval,), name='subtitle-job-janitor', daemon=True)
+        self._janitor.start()
+
+    # -- submission -----------------------------------------------------
+
+    def submit(self, fn: Callable[[Job], Any], priority: int = 0, meta: Optional[Dict[str, Any]] = None) -> Job:
+        with self._cond:
+            if self._closed:
+                raise SchedulerClosed('scheduler is not accepting jobs')
+            if len(self._pending) >= self.max_pending:
+                raise QueueFull(retry_after=self._eta_for_position(len(self._pending)))
+            job = Job(fn, priority=priority, meta=meta)
+            self._jobs[job.id] = job
+            heapq.heappush(self._pending, (-priority, next(self._seq), job))
+            self._announce_positions()
+            self._cond.notify()
+            return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued job immediately or ask a running job to stop.
+
+        Running jobs are cancelled cooperatively through `job.cancel_event`.
+        Returns False when the job is unknown or already finished.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.cancel_event.set()
+            if job.state == QUEUED:
+                self._pending = [item for item in self._pending if item[2] is not job]
+                heapq.heapify(self._pending)
+                self._finish(job, CANCELLED, 'Job cancelled')
+                self._announce_positions()
+            return True
+
+    def shutdown(self, cancel_pending: bool = True) -> None:
+        with self._cond:
+            self._closed = True
+            if cancel_pending:
+                for _, _, job in self._pending:
+                    job.cancel_event.set()
+                    self._finish(job, CANCELLED, 'Server shutting down')
+                self._pending = []
+            self._cond.notify_all()
+
+    # -- introspection --------------------------------------------------
+
+    def _average_duration(self) -> float:
+        if not self._durations:
+            return self.default_duration
+        return sum(self._durations) / len(self._durations)
+
+    def _eta_for_position(self, position: int) -> float:
+        # jobs ahead are drained `workers` at a time; a running slot frees up on average halfway through
+        busy = 0.5 if self._running >= self.workers else 0.0
+        return (position // self.workers + busy) * self._average_duration()
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a queued job, or None once it left the queue."""
+        with self._cond:
+            for pos, (_, _, job) in enumerate(sorted(self._pending)):
+                if job.id == job_id:
+                    return pos + 1
+            return None
+
+    def _announce_positions(self) -> None:
+        for pos, (_, _, job) in enumerate(sorted(self._pending)):
+            job.put('queued', {'position': pos + 1, 'eta': round(self._eta_for_position(pos), 1)})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            states: Dict[str, int] = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {
+                'workers': self.workers,
+                'running': self._running,
+                'pending': len(self._pending),
+                'max_pending': self.max_pending,
+                'average_duration': self._average_duration(),
+                'jobs': states,
+            }
+
+    # -- workers --------------------------------------------------------
+
+    def _finish(self, job: Job, state: str, payload: Any) -> None:
+        job.state = state
+        job.finished_at = time.time()
+        job.put(state, payload)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                _, _, job = heapq.heappop(self._pending)
+                job.state = RUNNING
+                job.started_at = time.time()
+                self._running += 1
+                self._announce_positions()
+            try:
+                job.put('progress', 'Job started')
+                result = job.fn(job)
+                outcome = (DONE, result)
+            except Exception as exc:
+                outcome = (CANCELLED, 'Job cancelled') if job.cancel_event.is_set() else (ERROR, str(exc))
+            with self._cond:
+                self._running -= 1
+                if outcome[0] == DONE:
+                    self._durations = (self._durations + [time.time() - job.started_at])[-20:]
+                self._finish(job, *outcome)
+                self._announce_positions()
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """Forget finished jobs older than the TTL. Returns how many were dropped."""
+        now = now if now is not None else time.time()
+        with self._cond:
+            expired = [jid for jid, job in self._jobs.items()
+                       if job.finished and job.finished_at is not None and now - job.finished_at > self.job_ttl]
+            for jid in expired:
+                del self._jobs[jid]
+            return len(expired)
+
+    def _cleanup_loop(self, interval: float) -> None:
+        while not self._closed:
+            time.sleep(interval)
+            try:
+                self.cleanup()
+            except Exception:
+                pass
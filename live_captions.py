@@ -0,0 +1,409 @@
+"""Live captioning sessions on top of a streaming (Vosk-style) recognizer.
+
+A client opens a session, posts small pieces of audio as they are captured (raw mono
+16-bit PCM, or an Ogg/WebM Opus stream that ffmpeg decodes on the fly) and gets back
+`partial` captions (the words recognized so far in the current utterance) and `final`
+captions (finished lines with timestamps). Every session keeps its own recognizer,
+writes a rolling SRT of its most recent lines to `output/live/<session>.srt` and records
+latency metrics. `LiveCaptionManager` caps the number of concurrent sessions and drops
+idle ones.
+
+Recognizers follow the `vosk.KaldiRecognizer` interface (`AcceptWaveform`, `Result`,
+`PartialResult`, `FinalResult`). `StubRecognizer` implements it without any model so the
+endpoints can be exercised offline (`SUBTITLE_LIVE_RECOGNIZER=stub`).
+"""
+from collections import deque
+from pathlib import Path
+from queue import Empty, Full, Queue
+from typing import Any, Callable, Dict, List, Optional
+import array
+import bisect
+import json
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+from segment_store import aggregate_words
+from subtitle_io import write_srt
+
+
+class SessionLimitReached(Exception):
+    """Raised by `LiveCaptionManager.open` when all live session slots are taken."""
+
+    def __init__(self, retry_after: float):
+        super().__init__('too many live caption sessions')
+        self.retry_after = retry_after
+
+
+class StubRecognizer:
+    """Model-free stand-in for `KaldiRecognizer`, driven by signal energy.
+
+    Every `word_s` seconds of sound becomes one word (`word1`, `word2`, ...) and an
+    utterance ends after `pause_s` seconds of silence, so tests can script captions with
+    tones and gaps.
+    """
+
+    def __init__(self, sample_rate: int = 16000, word_s: float = 0.4, pause_s: float = 0.3,
+                 threshold: int = 500):
+        self.sample_rate = sample_rate
+        self.frame = max(1, sample_rate // 100)  # 10 ms
+        self.word_frames = max(1, int(word_s * 100))
+        self.pause_frames = max(1, int(pause_s * 100))
+        self.threshold = threshold
+        self._carry = b''
+        self._frames = 0
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._word_start = None
+        self._count = 0
+        self._words: List[Dict[str, Any]] = []
+        self._ready: List[Dict[str, Any]] = []
+
+    def SetWords(self, enabled: bool) -> None:
+        pass
+
+    def _close_word(self, end_frame: int) -> None:
+        self._count += 1
+        self._words.append({'word': f'word{self._count}', 'start': self._word_start / 100.0,
+                            'end': end_frame / 100.0, 'conf': 1.0})
+        self._word_start = None
+        self._voiced_run = 0
+
+    def AcceptWaveform(self, data) -> bool:
+        pcm = self._carry + bytes(data)
+        usable = len(pcm) - len(pcm) % (self.frame * 2)
+        self._carry = pcm[usable:]
+        samples = array.array('h')
+        samples.frombytes(pcm[:usable])
+        finished = False
+        for i in range(0, len(samples), self.frame):
+            frame = samples[i:i + self.frame]
+            loud = max(abs(v) for v in frame) >= self.threshold
+            if loud:
+                if self._word_start is None:
+                    self._word_start = self._frames
+                self._voiced_run += 1
+                self._silent_run = 0
+                if self._voiced_run >= self.word_frames:
+                    self._close_word(self._frames + 1)
+            else:
+                if self._word_start is not None:
+                    self._close_word(self._frames)
+                self._silent_run += 1
+                if self._words and self._silent_run >= self.pause_frames:
+                    self._ready.extend(self._words)
+                    self._words = []
+                    finished = True
+            self._frames += 1
+        return finished
+
+    def _result(self, words: List[Dict[str, Any]]) -> str:
+        return json.dumps({'result': words, 'text': ' '.join(w['word'] for w in words)})
+
+    def Result(self) -> str:
+        words, self._ready = self._ready, []
+        return self._result(words)
+
+    def PartialResult(self) -> str:
+        return json.dumps({'partial': ' '.join(w['word'] for w in self._words)})
+
+    def FinalResult(self) -> str:
+        if self._word_start is not None:
+            self._close_word(self._frames)
+        words, self._ready, self._words = self._ready + self._words, [], []
+        return self._result(words)
+
+
+def vosk_recognizer(sample_rate: int):
+    """A `KaldiRecognizer` over the shared, registry-managed Vosk model."""
+    from vosk import KaldiRecognizer
+    from generate_subtitles import default_model_params
+    from model_registry import registry as model_registry
+    recognizer = KaldiRecognizer(model_registry.get('vosk', **default_model_params('vosk')), sample_rate)
+    recognizer.SetWords(True)
+    return recognizer
+
+
+def recognizer_factory_from_env() -> Callable[[int], Any]:
+    if os.environ.get('SUBTITLE_LIVE_RECOGNIZER', 'vosk').lower() == 'stub':
+        return StubRecognizer
+    return vosk_recognizer
+
+
+# ffmpeg demuxers for the compressed formats browsers record (MediaRecorder gives Opus in WebM or Ogg)
+STREAM_FORMATS = {'ogg': 'ogg', 'opus': 'ogg', 'webm': 'matroska'}
+
+
+class StreamDecoder:
+    """Long-running ffmpeg process turning a compressed audio stream into mono int16 PCM."""
+
+    def __init__(self, fmt: str, sample_rate: int = 16000):
+        command = [
+            'ffmpeg', '-nostdin', '-v', 'error', '-f', STREAM_FORMATS[fmt], '-i', 'pipe:0',
+            '-vn', '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1'
+        ]
+        self._proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL, bufsize=0)
+        self._out: Queue = Queue()
+        self._reader = threading.Thread(target=self._read, name='live-decoder', daemon=True)
+        self._reader.start()
+
+    def _read(self) -> None:
+        while True:
+            block = self._proc.stdout.read(4096)
+            if not block:
+                break
+            self._out.put(block)
+
+    def _drain(self) -> bytes:
+        blocks = []
+        while True:
+            try:
+                blocks.append(self._out.get_nowait())
+            except Empty:
+                return b''.join(blocks)
+
+    def decode(self, data: bytes) -> bytes:
+        """Feed compressed bytes; returns whatever PCM ffmpeg has produced so far."""
+        self._proc.stdin.write(data)
+        self._proc.stdin.flush()
+        return self._drain()
+
+    def close(self) -> bytes:
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        self._reader.join(timeout=5)
+        self._proc.wait(timeout=5)
+        return self._drain()
+
+
+def _percentile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4)
+
+
+class LiveSession:
+    """One live audio stream: a recognizer, a rolling SRT and latency metrics."""
+
+    def __init__(self, recognizer, sample_rate: int = 16000, srt_path: Optional[Path] = None,
+                 fmt: str = 'pcm', max_lines: int = 200):
+        self.id = uuid.uuid4().hex
+        self.recognizer = recognizer
+        self.sample_rate = sample_rate
+        self.format = fmt
+        self.srt_path = srt_path
+        self.lines: deque = deque(maxlen=max_lines)
+        self.events: Queue = Queue(maxsize=500)
+        self.created_at = time.time()
+        self.last_activity = time.monotonic()
+        self.closed = False
+        self._decoder = StreamDecoder(fmt, sample_rate) if fmt in STREAM_FORMATS else None
+        self._lock = threading.Lock()
+        self._carry = b''
+        self._samples = 0
+        self._last_partial = ''
+        # (sample count at the end of a received chunk, monotonic arrival time)
+        self._arrivals_samples: List[int] = []
+        self._arrivals_times: List[float] = []
+        self._chunks = 0
+        self._bytes = 0
+        self._processing = 0.0
+        self._partial_latency: deque = deque(maxlen=500)
+        self._final_latency: deque = deque(maxlen=500)
+        self._finals = 0
+
+    @property
+    def audio_seconds(self) -> float:
+        return self._samples / float(self.sample_rate)
+
+    def _arrival_of(self, seconds: float, default: float) -> float:
+        idx = bisect.bisect_left(self._arrivals_samples, int(seconds * self.sample_rate))
+        return self._arrivals_times[idx] if idx < len(self._arrivals_times) else default
+
+    def _emit(self, event: Dict[str, Any], out: List[Dict[str, Any]]) -> None:
+        out.append(event)
+        # nobody may be listening on /events; keep only the most recent captions
+        while True:
+            try:
+                self.events.put_nowait(event)
+                return
+            except Full:
+                try:
+                    self.events.get_nowait()
+                except Empty:
+                    pass
+
+    def _finals_from(self, result_json: str, now: float, out: List[Dict[str, Any]]) -> None:
+        words = json.loads(result_json).get('result', [])
+        for caption in aggregate_words(words):
+            # latency: from the moment the last audio of the caption arrived to the caption going out
+            latency = round(now - self._arrival_of(caption['end'], now), 4)
+            self._final_latency.append(latency)
+            self._finals += 1
+            self.lines.append(caption)
+            self._emit({'type': 'final', 'start': caption['start'], 'end': caption['end'],
+                        'text': caption['text'], 'latency': latency}, out)
+        self._last_partial = ''
+        if words:
+            self._write_srt()
+
+    def _write_srt(self) -> None:
+        if self.srt_path is None:
+            return
+        write_srt(list(self.lines), self.srt_path)
+
+    def feed(self, data: bytes) -> List[Dict[str, Any]]:
+        """Process one piece of the stream and return the caption events it produced."""
+        received = time.monotonic()
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            if self.closed:
+                raise RuntimeError('session is closed')
+            self.last_activity = received
+            self._chunks += 1
+            self._bytes += len(data)
+            pcm = self._decoder.decode(data) if self._decoder is not None else data
+            pcm = self._carry + pcm
+            usable = len(pcm) - len(pcm) % 2
+            self._carry = pcm[usable:]
+            if usable:
+                self._samples += usable // 2
+                self._arrivals_samples.append(self._samples)
+                self._arrivals_times.append(received)
+                if self.recognizer.AcceptWaveform(pcm[:usable]):
+                    self._finals_from(self.recognizer.Result(), time.monotonic(), out)
+                else:
+                    partial = json.loads(self.recognizer.PartialResult()).get('partial', '')
+                    if partial and partial != self._last_partial:
+                        self._last_partial = partial
+                        latency = round(time.monotonic() - received, 4)
+                        self._partial_latency.append(latency)
+                        self._emit({'type': 'partial', 'text': partial, 'latency': latency}, out)
+            # captions only look a few seconds back, so the arrival log can stay short
+            if len(self._arrivals_samples) > 2000:
+                del self._arrivals_samples[:1000]
+                del self._arrivals_times[:1000]
+            self._processing += time.monotonic() - received
+        return out
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Flush the recognizer, write the final SRT and end the event stream."""
+        out: List[Dict[str, Any]] = []
+        with self._lock:
+            if self.closed:
+                return out
+            now = time.monotonic()
+            if self._decoder is not None:
+                tail = self._carry + self._decoder.close()
+                tail = tail[:len(tail) - len(tail) % 2]
+                if tail:
+                    self._samples += len(tail) // 2
+                    self.recognizer.AcceptWaveform(tail)
+            self._finals_from(self.recognizer.FinalResult(), now, out)
+            self.closed = True
+            self._emit({'type': 'closed', 'srt_path': str(self.srt_path) if self.srt_path else None,
+                        'metrics': self._metrics()}, out)
+        return out
+
+    def _metrics(self) -> Dict[str, Any]:
+        audio = self.audio_seconds
+        return {
+            'chunks': self._chunks,
+            'bytes': self._bytes,
+            'audio_seconds': round(audio, 3),
+            'captions': self._finals,
+            'processing_seconds': round(self._processing, 4),
+            'realtime_factor': round(self._processing / audio, 4) if audio else None,
+            'partial_latency_p50': _percentile(self._partial_latency, 0.5),
+            'partial_latency_p95': _percentile(self._partial_latency, 0.95),
+            'final_latency_p50': _percentile(self._final_latency, 0.5),
+            'final_latency_p95': _percentile(self._final_latency, 0.95),
+            'final_latency_max': max(self._final_latency) if self._final_latency else None,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'session_id': self.id,
+                'format': self.format,
+                'sample_rate': self.sample_rate,
+                'created_at': self.created_at,
+                'closed': self.closed,
+                'srt_path': str(self.srt_path) if self.srt_path else None,
+                'metrics': self._metrics(),
+            }
+
+
+class LiveCaptionManager:
+    """Registry of live sessions with a concurrency cap and an idle timeout."""
+
+    def __init__(self, max_sessions: int = 4, recognizer_factory: Optional[Callable[[int], Any]] = None,
+                 output_dir: Optional[Path] = Path('output/live'), idle_timeout: float = 60.0, max_lines: int = 200):
+        self.max_sessions = max(1, int(max_sessions))
+        self.recognizer_factory = recognizer_factory or recognizer_factory_from_env()
+        self.output_dir = Path(output_dir) if output_dir else None
+        self.idle_timeout = idle_timeout
+        self.max_lines = max_lines
+        self._sessions: Dict[str, LiveSession] = {}
+        self._opening = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def open(self, sample_rate: int = 16000, fmt: str = 'pcm') -> LiveSession:
+        if fmt != 'pcm' and fmt not in STREAM_FORMATS:
+            raise ValueError(f'unsupported audio format: {fmt}')
+        self.reap_idle()
+        with self._lock:
+            if len(self._sessions) + self._opening >= self.max_sessions:
+                self.rejected += 1
+                idle_for = max((time.monotonic() - s.last_activity for s in self._sessions.values()), default=0.0)
+                raise SessionLimitReached(retry_after=max(1.0, self.idle_timeout - idle_for))
+            # hold the slot while the (possibly slow) recognizer is built
+            self._opening += 1
+        try:
+            session = LiveSession(self.recognizer_factory(sample_rate), sample_rate, fmt=fmt, max_lines=self.max_lines)
+            if self.output_dir is not None:
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                session.srt_path = self.output_dir / f'{session.id}.srt'
+            with self._lock:
+                self._sessions[session.id] = session
+        finally:
+            with self._lock:
+                self._opening -= 1
+        return session
+
+    def get(self, session_id: str) -> Optional[LiveSession]:
+        return self._sessions.get(session_id)
+
+    def close(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+        return session.close()
+
+    def reap_idle(self, now: Optional[float] = None) -> int:
+        """Close sessions that received no audio for `idle_timeout` seconds."""
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            idle = [sid for sid, s in self._sessions.items() if now - s.last_activity > self.idle_timeout]
+        for sid in idle:
+            self.close(sid)
+        return len(idle)
+
+    def stats(self) -> Dict[str, Any]:
+        self.reap_idle()
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            'max_sessions': self.max_sessions,
+            'active': len(sessions),
+            'rejected': self.rejected,
+            'sessions': [s.to_dict() for s in sessions],
+        }
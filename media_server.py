@@ -0,0 +1,345 @@
+"""Serving videos, audio and subtitle files to the browser.
+
+`/files/<path>` used to send everything through `send_from_directory(as_attachment=True)`.
+`send_media` is the dedicated path for large media:
+
+* `Range: bytes=...` gets a `206` with exactly that slice (`416` if it is out of bounds),
+  so seeking in a player fetches only what it plays.
+* Strong ETags (size + mtime) and `Last-Modified`, with `If-None-Match`,
+  `If-Modified-Since` and `If-Range`, so an unchanged file revalidates with a `304`.
+* The body is handed to the server's `wsgi.file_wrapper`. Under gunicorn that is a
+  zero-copy `sendfile()`, ranges included. Other servers get the bounded reader.
+* Files requested with `immutable=True` (the app does this when the URL carries the file's
+  version, `?v=<etag>`) are cached for a year. Everything else must revalidate.
+
+`audio_proxy` transcodes a WAV or video once to low-bitrate Opus/AAC for the editor's
+player (`SUBTITLE_AUDIO_PROXY=opus|aac`, `SUBTITLE_AUDIO_PROXY_KBPS`). The proxy is cached
+next to the audio and served like any other file.
+
+Run `python media_server.py --clients 16` to benchmark seek-heavy clients against the old
+`send_from_directory` path.
+"""
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+import argparse
+import json
+import mimetypes
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+from urllib.parse import quote
+
+from werkzeug.http import dump_options_header, http_date, parse_date
+from werkzeug.wrappers import Response
+
+CHUNK = 1 << 20
+IMMUTABLE_MAX_AGE = 365 * 86400
+
+mimetypes.add_type('application/x-subrip', '.srt')
+mimetypes.add_type('text/vtt', '.vtt')
+mimetypes.add_type('audio/webm', '.webm')
+
+PROXY_CODECS = {
+    # codec -> (suffix, ffmpeg output arguments)
+    'opus': ('.webm', ['-c:a', 'libopus', '-application', 'voip', '-f', 'webm']),
+    'aac': ('.m4a', ['-c:a', 'aac', '-movflags', '+faststart', '-f', 'mp4']),
+}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(st: os.stat_result) -> str:
+    """Strong validator for a file: it changes whenever the size or the mtime does."""
+    return f'{st.st_size:x}-{st.st_mtime_ns:x}'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """`(start, end)` (inclusive) of a single `bytes=` range, or None to send the whole file.
+
+    Multi-range requests are answered with the whole file, which RFC 9110 allows; players
+    only ever ask for one range.
+    """
+    if not header or not header.strip().lower().startswith('bytes=') or ',' in header:
+        return None
+    spec = header.split('=', 1)[1].strip()
+    first, _, last = spec.partition('-')
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(0, size - suffix), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def _read_range(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            block = fh.read(min(CHUNK, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _body(environ: Dict, path: Path, start: int, length: int, size: int):
+    wrapper = environ.get('wsgi.file_wrapper')
+    # gunicorn sendfile()s from the current offset and stops at Content-Length; other
+    # wrappers (werkzeug's included) read to EOF, so they only get whole-file responses
+    bounded = 'gunicorn' in environ.get('SERVER_SOFTWARE', '').lower()
+    if wrapper is not None and (length == size or bounded):
+        fh = open(path, 'rb')
+        fh.seek(start)
+        return wrapper(fh, CHUNK)
+    return _read_range(path, start, length)
+
+
+def content_disposition(name: str) -> str:
+    """`attachment` header value for `name`, as `send_file` builds it.
+
+    Headers go out as latin-1, so a non-ASCII name gets an ASCII `filename` fallback plus
+    the exact name percent-encoded in `filename*` (RFC 6266); quotes are escaped.
+    """
+    try:
+        name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+        options = {'filename': simple, 'filename*': f"UTF-8''{quote(name, safe='!#$&+^`|')}"}
+    else:
+        options = {'filename': name}
+    return dump_options_header('attachment', options)
+
+
+def send_media(request, path: Path, download: bool = False, immutable: bool = False,
+               download_name: Optional[str] = None) -> Response:
+    """Answer `request` (a werkzeug/Flask request) with the file at `path`."""
+    path = Path(path)
+    try:
+        st = path.stat()
+    except OSError:
+        return Response('file not found', status=404)
+    size = st.st_size
+    etag = file_etag(st)
+    headers = {
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(st.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': f'public, max-age={IMMUTABLE_MAX_AGE}, immutable' if immutable else 'no-cache',
+    }
+    if download:
+        headers['Content-Disposition'] = content_disposition(download_name or path.name)
+    mimetype = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+    inm = request.headers.get('If-None-Match')
+    if inm is not None:
+        not_modified = _etag_matches(inm, etag, weak=True)
+    else:
+        since = parse_date(request.headers.get('If-Modified-Since'))
+        not_modified = since is not None and int(st.st_mtime) <= since.timestamp()
+    if not_modified and request.method in ('GET', 'HEAD'):
+        return Response(status=304, headers=headers)
+
+    start, end, status = 0, size - 1, 200
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and if_range:
+        # only honour the range if the client's copy is still this exact file
+        if if_range.strip().startswith(('"', 'W/')):
+            valid = _etag_matches(if_range, etag, weak=False)
+        else:
+            date = parse_date(if_range)
+            valid = date is not None and int(st.st_mtime) <= date.timestamp()
+        range_header = range_header if valid else None
+    try:
+        requested = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+    if requested is not None:
+        start, end = requested
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    length = max(0, end - start + 1)
+    headers['Content-Length'] = str(length)
+    body = [] if request.method == 'HEAD' else _body(request.environ, path, start, length, size)
+    return Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+
+
+# -- low-bitrate audio proxy ------------------------------------------------
+
+_proxy_locks: Dict[Path, threading.Lock] = {}
+_proxy_locks_guard = threading.Lock()
+
+
+def proxy_codec() -> Optional[str]:
+    codec = os.environ.get('SUBTITLE_AUDIO_PROXY', 'off').lower()
+    return codec if codec in PROXY_CODECS else None
+
+
+def audio_proxy(source: Path, codec: str, kbps: Optional[int] = None, target_dir: Optional[Path] = None) -> Path:
+    """Mono low-bitrate copy of `source` (WAV or video) in `target_dir` (default: next to it).
+
+    Transcoded on first use and whenever the source is newer than the copy.
+    """
+    source = Path(source)
+    suffix, args = PROXY_CODECS[codec]
+    kbps = kbps or int(os.environ.get('SUBTITLE_AUDIO_PROXY_KBPS', '32'))
+    target = Path(target_dir or source.parent) / f'{source.stem}.proxy{kbps}k{suffix}'
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with _proxy_locks_guard:
+        lock = _proxy_locks.setdefault(target, threading.Lock())
+    with lock:
+        if target.exists() and target.stat().st_mtime >= source.stat().st_mtime:
+            return target
+        tmp = target.with_name(f'.{target.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')
+        command = ['ffmpeg', '-nostdin', '-v', 'error', '-y', '-i', str(source), '-vn', '-ac', '1',
+                   '-b:a', f'{kbps}k', *args, str(tmp)]
+        try:
+            completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+            if completed.returncode != 0:
+                raise RuntimeError(completed.stderr.decode('utf-8', errors='ignore'))
+            os.replace(tmp, target)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+    return target
+
+
+# -- benchmark ------------------------------------------------------------
+
+def _percentile(values, q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _client(port: int, route: str, size: int, requests: int, range_kb: int, seed: int, out: list) -> None:
+    import http.client
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    etag = None
+    for i in range(requests):
+        headers = {}
+        if i % 10 == 9 and etag:
+            # a player revalidating what it already has
+            headers['If-None-Match'] = etag
+        else:
+            start = rng.randrange(0, max(1, size - range_kb * 1024))
+            headers['Range'] = f'bytes={start}-{start + range_kb * 1024 - 1}'
+        began = time.perf_counter()
+        conn.request('GET', route, headers=headers)
+        resp = conn.getresponse()
+        body = resp.read()
+        out.append((time.perf_counter() - began, resp.status, len(body)))
+        etag = resp.getheader('ETag') or etag
+    conn.close()
+
+
+def _run_clients(port: int, route: str, size: int, clients: int, requests: int, range_kb: int) -> Dict[str, object]:
+    results: list = []
+    threads = [threading.Thread(target=_client, args=(port, route, size, requests, range_kb, seed, results))
+               for seed in range(clients)]
+    began = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - began
+    latencies = [r[0] for r in results]
+    transferred = sum(r[2] for r in results)
+    statuses: Dict[str, int] = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(results),
+        'requests_per_s': round(len(results) / elapsed, 1),
+        'mb_transferred': round(transferred / 1e6, 1),
+        'mb_per_s': round(transferred / elapsed / 1e6, 1),
+        'p50_ms': round(_percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+        'statuses': statuses,
+    }
+
+
+def benchmark(size_mb: int = 256, clients: int = 16, requests: int = 50, range_kb: int = 512) -> Dict[str, object]:
+    from flask import Flask, request, send_from_directory
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        media = Path(tmp) / 'bench.mp4'
+        block = os.urandom(CHUNK)
+        with open(media, 'wb') as fh:
+            for _ in range(size_mb):
+                fh.write(block)
+        size = media.stat().st_size
+
+        app = Flask('media_bench')
+
+        @app.route('/old/<name>')
+        def old(name):
+            return send_from_directory(tmp, name, as_attachment=True)
+
+        @app.route('/new/<name>')
+        def new(name):
+            return send_media(request, Path(tmp) / name)
+
+        server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            results: Dict[str, object] = {'file_mb': size_mb, 'clients': clients, 'requests_per_client': requests,
+                                          'range_kb': range_kb, 'server': 'werkzeug (threaded, no sendfile)'}
+            for label, route in (('send_from_directory', '/old/bench.mp4'), ('send_media', '/new/bench.mp4')):
+                results[label] = _run_clients(server.server_port, route, size, clients, requests, range_kb)
+        finally:
+            server.shutdown()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark ranged media serving with concurrent seeking clients.')
+    parser.add_argument('--size-mb', type=int, default=256, help='size of the test file (default: %(default)s)')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent clients (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=50, help='requests per client (default: %(default)s)')
+    parser.add_argument('--range-kb', type=int, default=512, help='bytes per seek request, in KiB (default: %(default)s)')
+    args = parser.parse_args(argv)
+    print(json.dumps(benchmark(args.size_mb, args.clients, args.requests, args.range_kb), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
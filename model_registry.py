@@ -0,0 +1,241 @@
+"""Process-wide registry of warm ASR models.
+
+`generate_subtitles` used to load every backend from scratch on each call. The
+registry below loads each (backend, params) combination once, keeps it warm and
+evicts the least recently used models when the configured memory budget is
+exceeded. It is the ASR counterpart of `_translation_cache`.
+
+Backends are registered as plain loader callables, so small stand-in loaders can
+be plugged in when exercising the registry without the real models installed.
+"""
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+import os
+import threading
+import time
+
+from pipeline_metrics import span
+
+
+def _budget_from_env() -> Optional[int]:
+    raw = os.environ.get('SUBTITLE_MODEL_MEMORY_MB')
+    if not raw:
+        return None
+    try:
+        mb = float(raw)
+    except ValueError:
+        return None
+    return int(mb * 1024 * 1024) if mb > 0 else None
+
+
+def estimate_model_bytes(obj: Any) -> int:
+    """Best-effort size estimate of a loaded model in bytes.
+
+    Counts torch parameters and buffers when available, recurses into tuples
+    (silero returns `(model, decoder, utils)`) and HF pipelines (`.model`).
+    Returns 0 when the size cannot be determined.
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_model_bytes(item) for item in obj)
+    total = 0
+    for attr in ('parameters', 'buffers'):
+        fn = getattr(obj, attr, None)
+        if not callable(fn):
+            continue
+        try:
+            for tensor in fn():
+                total += tensor.numel() * tensor.element_size()
+        except Exception:
+            continue
+    if total == 0 and hasattr(obj, 'model') and obj.model is not obj:
+        return estimate_model_bytes(obj.model)
+    return total
+
+
+def directory_bytes(path: Path) -> int:
+    """Size on disk of a model directory (used for Vosk, which has no tensors)."""
+    total = 0
+    for root, _dirs, filenames in os.walk(str(path)):
+        for fn in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, fn))
+            except OSError:
+                continue
+    return total
+
+
+class ModelRegistry:
+    """Thread-safe LRU cache of loaded models with a memory budget.
+
+    `register(backend, loader, sizer)` declares how to build a model; `get(backend, **params)`
+    returns the warm instance, loading it on first use. Concurrent requests for the same
+    model wait for a single load instead of loading twice.
+    """
+
+    def __init__(self, memory_budget: Optional[int] = None):
+        self.memory_budget = memory_budget
+        self._loaders: Dict[str, Tuple[Callable[..., Any], Optional[Callable[[Any], int]]]] = {}
+        self._entries: 'OrderedDict[Tuple, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'load_errors': 0, 'evictions': 0, 'load_seconds': 0.0}
+        self._per_backend: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, backend: str, loader: Callable[..., Any], sizer: Optional[Callable[[Any], int]] = None) -> None:
+        with self._lock:
+            self._loaders[backend] = (loader, sizer)
+
+    def is_registered(self, backend: str) -> bool:
+        return backend in self._loaders
+
+    @staticmethod
+    def _make_key(backend: str, params: Dict[str, Any]) -> Tuple:
+        return (backend,) + tuple(sorted((k, repr(v)) for k, v in params.items()))
+
+    def _backend_stats(self, backend: str) -> Dict[str, Any]:
+        st = self._per_backend.get(backend)
+        if st is None:
+            st = {'hits': 0, 'misses': 0, 'loads': 0, 'load_seconds': 0.0, 'last_load_seconds': None}
+            self._per_backend[backend] = st
+        return st
+
+    def get(self, backend: str, **params) -> Any:
+        if backend not in self._loaders:
+            raise KeyError(f'no loader registered for backend {backend!r}')
+        key = self._make_key(backend, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry['last_used'] = time.time()
+                entry['hits'] += 1
+                self._stats['hits'] += 1
+                self._backend_stats(backend)['hits'] += 1
+                return entry['model']
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # another thread may have finished loading while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry['last_used'] = time.time()
+                    entry['hits'] += 1
+                    self._stats['hits'] += 1
+                    self._backend_stats(backend)['hits'] += 1
+                    return entry['model']
+                self._stats['misses'] += 1
+                self._backend_stats(backend)['misses'] += 1
+                loader, sizer = self._loaders[backend]
+
+            started = time.perf_counter()
+            try:
+                with span('model_load', backend=backend):
+                    model = loader(**params)
+            except Exception:
+                with self._lock:
+                    self._stats['load_errors'] += 1
+                raise
+            elapsed = time.perf_counter() - started
+            try:
+                size = int(sizer(model)) if sizer else estimate_model_bytes(model)
+            except Exception:
+                size = 0
+
+            with self._lock:
+                self._entries[key] = {
+                    'backend': backend,
+                    'params': dict(params),
+                    'model': model,
+                    'size': size,
+                    'load_seconds': elapsed,
+                    'loaded_at': time.time(),
+                    'last_used': time.time(),
+                    'hits': 0,
+                }
+                self._stats['loads'] += 1
+                self._stats['load_seconds'] += elapsed
+                st = self._backend_stats(backend)
+                st['loads'] += 1
+                st['load_seconds'] += elapsed
+                st['last_load_seconds'] = elapsed
+                self._enforce_budget(keep=key)
+            return model
+
+    def _enforce_budget(self, keep: Optional[Tuple] = None) -> None:
+        if not self.memory_budget:
+            return
+        while self.total_bytes() > self.memory_budget:
+            victim = next((k for k in self._entries if k != keep), None)
+            if victim is None:
+                break
+            self._evict_key(victim)
+
+    def _evict_key(self, key: Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._stats['evictions'] += 1
+        entry['model'] = None
+
+    def evict(self, backend: Optional[str] = None) -> int:
+        """Drop warm models (all of them, or only those of `backend`). Returns the count."""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if backend is None or e['backend'] == backend]
+            for k in keys:
+                self._evict_key(k)
+            return len(keys)
+
+    def set_memory_budget(self, memory_budget: Optional[int]) -> None:
+        with self._lock:
+            self.memory_budget = memory_budget
+            self._enforce_budget()
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(e['size'] for e in self._entries.values())
+
+    def prewarm(self, specs: Iterable[Tuple[str, Dict[str, Any]]], progress_callback=None) -> Dict[str, str]:
+        """Load each `(backend, params)` spec. Returns `{backend: 'ok' | error message}`."""
+        results = {}
+        for backend, params in specs:
+            try:
+                self.get(backend, **(params or {}))
+                results[backend] = 'ok'
+            except Exception as exc:
+                results[backend] = str(exc)
+            if progress_callback:
+                try:
+                    progress_callback(f'Prewarm {backend}: {results[backend]}')
+                except Exception:
+                    pass
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': (self._stats['hits'] / lookups) if lookups else 0.0,
+                'memory_budget': self.memory_budget,
+                'total_bytes': self.total_bytes(),
+                'backends': {name: dict(st) for name, st in self._per_backend.items()},
+                'models': [
+                    {
+                        'backend': e['backend'],
+                        'params': e['params'],
+                        'size': e['size'],
+                        'hits': e['hits'],
+                        'load_seconds': e['load_seconds'],
+                        'last_used': e['last_used'],
+                    }
+                    for e in self._entries.values()
+                ],
+            }
+
+
+registry = ModelRegistry(memory_budget=_budget_from_env())
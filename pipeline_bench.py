@@ -0,0 +1,579 @@
+"""Offline benchmark suite for the subtitle pipeline.
+
+Runs every stage of `generate_subtitles` in isolation on synthetic media, with
+deterministic stand-in ASR and translation backends, so regressions can be measured on any
+machine without downloading a model:
+
+    startup.*       cold import of `generate_subtitles` and of the web app in a new interpreter:
+                    seconds, resident memory added and any heavy ML package pulled in
+    extract.*       ffmpeg decoding of a synthetic video (in-memory PCM and WAV)
+    asr.*           real-time factor of each backend (fake unless `--real` picks installed ones)
+    aggregate_words, approximate_segments
+    translate.*     token batch planning and a pooled multi-model translation with a fake Marian
+    srt_io          write/parse numbers from `subtitle_io.benchmark`
+    flask.*         per-request latency of the editor and upload endpoints (test client)
+    pipeline        `generate_subtitles` end to end with fake backends and two languages
+
+Synthetic audio and video are generated with ffmpeg (`aevalsrc` tone bursts with regular
+silences, `testsrc` video). Without ffmpeg the audio is synthesized in Python and the
+stages that need a container are reported under `skipped`.
+
+Results are printed (or written with `--output`) as JSON. With `--baseline` every stage's
+`seconds` is compared to a previous result file; a stage that got slower by more than
+`--threshold` (and by more than `--min-delta` seconds) is a regression, and the exit
+status is 1::
+
+    python pipeline_bench.py --output bench.json
+    python pipeline_bench.py --baseline bench.json --threshold 0.2 --stage-threshold 'flask.*=0.5'
+
+Everything runs in a temporary directory; the catalog, result cache and translation memory
+are pointed there too, so the repository's own `cache/` and `output/` are left alone.
+"""
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import contextlib
+import fnmatch
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import wave
+
+BASE_DIR = Path(__file__).resolve().parent
+SUITE_VERSION = 1
+VOCABULARY = ['the', 'a', 'subtitle', 'line', 'video', 'speaker', 'said', 'that', 'we', 'will', 'now', 'see',
+              'audio', 'model', 'fast', 'slow', 'benchmark', 'window', 'shard', 'cue']
+
+
+def _timed(fn: Callable[[], Any], repeat: int = 1) -> Tuple[float, Any]:
+    """(median seconds over `repeat` runs, result of the last run)."""
+    times, result = [], None
+    for _ in range(max(1, repeat)):
+        began = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - began)
+    return statistics.median(times), result
+
+
+def have_ffmpeg() -> bool:
+    return shutil.which('ffmpeg') is not None
+
+
+# -- synthetic media ------------------------------------------------------
+
+def synthetic_wav(path: Path, seconds: float, sample_rate: int = 16000) -> Path:
+    """Mono 16-bit tone bursts: 4.2 s of sound, then 0.8 s of silence, repeated."""
+    path = Path(path)
+    if have_ffmpeg():
+        expr = '0.3*sin(2*PI*220*t)*(1+0.5*sin(2*PI*3*t))*gt(mod(t\\,5)\\,0.8)'
+        subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi',
+                        '-i', f'aevalsrc={expr}:s={sample_rate}:d={seconds}',
+                        '-ac', '1', '-acodec', 'pcm_s16le', str(path)], check=True)
+        return path
+    rng = random.Random(0)
+    frames = bytearray()
+    for i in range(int(seconds * sample_rate)):
+        t = i / sample_rate
+        value = 0 if t % 5 < 0.8 else int(9000 * math.sin(2 * math.pi * 220 * t) + rng.uniform(-300, 300))
+        frames += value.to_bytes(2, 'little', signed=True)
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(bytes(frames))
+    return path
+
+
+def synthetic_video(path: Path, wav: Path, seconds: float) -> Path:
+    """A small MP4 (test pattern + the WAV as AAC); needs ffmpeg."""
+    subprocess.run(['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc=size=320x240:rate=15:duration={seconds}',
+                    '-i', str(wav), '-c:v', 'mpeg4', '-q:v', '10', '-c:a', 'aac', '-b:a', '64k', '-shortest',
+                    '-movflags', '+faststart', str(path)], check=True)
+    return Path(path)
+
+
+def synthetic_words(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    words, t = [], 0.0
+    for _ in range(count):
+        duration = rng.uniform(0.15, 0.6)
+        words.append({'word': rng.choice(VOCABULARY), 'start': t, 'end': t + duration})
+        t += duration + rng.uniform(0.0, 0.3)
+    return words
+
+
+# -- stand-in backends ----------------------------------------------------
+
+class FakeASR:
+    """Deterministic transcriber: one word per 0.4 s of audio, costing `rtf` seconds per audio second."""
+
+    def __init__(self, name: str, rtf: float = 0.02):
+        self.name = name
+        self.rtf = rtf
+
+    def __call__(self, audio, audio_duration: float, check_cancelled=None, on_segments=None):
+        from segment_store import aggregate_words
+        time.sleep(max(0.0, audio_duration * self.rtf))
+        if check_cancelled:
+            check_cancelled()
+        rng = random.Random(f'{self.name}:{round(audio_duration, 2)}')
+        words, t = [], 0.0
+        while t + 0.4 <= audio_duration:
+            words.append({'word': rng.choice(VOCABULARY), 'start': t, 'end': t + 0.35})
+            t += 0.4
+        segments = aggregate_words(words)
+        if on_segments and len(segments):
+            on_segments(segments)
+        return segments
+
+
+class FakeMarian:
+    """Translates by tagging each line, sleeping per padded token of every planned batch."""
+
+    def __init__(self, ms_per_token: float = 0.01):
+        self.ms_per_token = ms_per_token
+        self.padded_tokens = 0
+        self.batches = 0
+
+    def __call__(self, texts: List[str], src_lang: str, tgt_lang: str) -> List[str]:
+        from generate_subtitles import plan_token_batches
+        lengths = [len(t.split()) + 2 for t in texts]
+        results = [''] * len(texts)
+        for batch in plan_token_batches(lengths):
+            padded = len(batch) * max(lengths[i] for i in batch)
+            self.padded_tokens += padded
+            self.batches += 1
+            time.sleep(padded * self.ms_per_token / 1000.0)
+            for i in batch:
+                results[i] = f'[{tgt_lang}] {texts[i]}'
+        return results
+
+
+@contextlib.contextmanager
+def fake_backends(rtf: float = 0.02, ms_per_token: float = 0.01, keep_real: Tuple[str, ...] = ()):
+    """Swap the ASR backends (except `keep_real`) and Marian for stand-ins inside the block.
+
+    Only the sequential pipeline sees the fakes; `parallel_backends` workers import the real
+    transcribers in their own processes.
+    """
+    import generate_subtitles as gs
+    saved = (dict(gs.TRANSCRIBERS), gs.backend_available, gs._marian_translate, gs.translation_available)
+    real_available = gs.backend_available
+    marian = FakeMarian(ms_per_token)
+    for name in gs.BACKEND_ORDER:
+        if name not in keep_real:
+            gs.TRANSCRIBERS[name] = FakeASR(name, rtf)
+    gs.backend_available = lambda name: name not in keep_real or real_available(name)
+    gs._marian_translate = marian
+    gs.translation_available = lambda: True
+    try:
+        yield marian
+    finally:
+        gs.TRANSCRIBERS.clear()
+        gs.TRANSCRIBERS.update(saved[0])
+        gs.backend_available, gs._marian_translate, gs.translation_available = saved[1:]
+
+
+# -- stages ---------------------------------------------------------------
+
+def bench_extract(video: Path, workdir: Path, duration: float) -> Dict[str, Any]:
+    from audio_buffer import extract_audio_pcm
+    from generate_subtitles import extract_audio_ffmpeg
+    results = {}
+    seconds, audio = _timed(lambda: extract_audio_pcm(video))
+    results['extract.pcm'] = {'seconds': round(seconds, 4), 'audio_s': round(audio.duration, 2),
+                              'x_realtime': round(duration / seconds, 1)}
+    seconds, _ = _timed(lambda: extract_audio_ffmpeg(video, workdir / 'wav'))
+    results['extract.wav'] = {'seconds': round(seconds, 4), 'x_realtime': round(duration / seconds, 1)}
+    return results
+
+
+def bench_asr(wav: Path, rtf: float, real: Tuple[str, ...]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    import generate_subtitles as gs
+    from waveform_peaks import read_wav
+    audio = read_wav(wav)
+    results, skipped = {}, {}
+    for name in gs.BACKEND_ORDER:
+        seconds, segments = _timed(lambda: FakeASR(name, rtf)(audio, audio.duration))
+        results[f'asr.fake_{name}'] = {'seconds': round(seconds, 4), 'rtf': round(seconds / audio.duration, 4),
+                                       'segments': len(segments)}
+        if name not in real:
+            continue
+        if not gs.backend_available(name):
+            skipped[f'asr.{name}'] = 'backend not installed'
+            continue
+        try:
+            # first call loads the model; the timed one measures decoding only
+            gs.TRANSCRIBERS[name](audio, audio.duration)
+            seconds, segments = _timed(lambda: gs.TRANSCRIBERS[name](audio, audio.duration))
+            results[f'asr.{name}'] = {'seconds': round(seconds, 4), 'rtf': round(seconds / audio.duration, 4),
+                                      'segments': len(segments)}
+        except Exception as exc:
+            skipped[f'asr.{name}'] = f'failed: {exc}'
+    return results, skipped
+
+
+def bench_text(words: int, repeat: int) -> Dict[str, Any]:
+    from generate_subtitles import approximate_segments_from_text
+    from segment_store import aggregate_words
+    records = synthetic_words(words)
+    results = {}
+    seconds, segments = _timed(lambda: aggregate_words(records), repeat)
+    results['aggregate_words'] = {'seconds': round(seconds, 4), 'words': words, 'segments': len(segments),
+                                  'words_per_s': round(words / seconds)}
+    text = ' '.join(r['word'] for r in records)
+    duration = records[-1]['end'] if records else 0.0
+    seconds, segments = _timed(lambda: approximate_segments_from_text(text, duration), repeat)
+    results['approximate_segments'] = {'seconds': round(seconds, 4), 'words': words, 'segments': len(segments)}
+    return results
+
+
+def bench_translation(lines: int, ms_per_token: float, repeat: int) -> Dict[str, Any]:
+    import generate_subtitles as gs
+    from subtitle_io import synthetic_segments
+    store = synthetic_segments(lines)
+    lengths = [len(t.split()) + 2 for t in store.texts]
+    results = {}
+    seconds, batches = _timed(lambda: gs.plan_token_batches(lengths), repeat)
+    padded = sum(len(b) * max(lengths[i] for i in b) for b in batches)
+    # what fixed batches of 8 lines in transcript order would have padded to
+    naive = sum(len(lengths[i:i + 8]) * max(lengths[i:i + 8]) for i in range(0, len(lengths), 8))
+    results['translate.plan_batches'] = {'seconds': round(seconds, 5), 'lines': lines, 'batches': len(batches),
+                                         'padded_tokens': padded, 'naive_padded_tokens': naive,
+                                         'padding_saved': round(1 - padded / float(naive), 3) if naive else 0.0}
+    # two models sharing most lines, as with Whisper + NeMo
+    other = synthetic_segments(lines, seed=1)
+    transcripts = {'whisper': store, 'nemo': other}
+    with fake_backends(ms_per_token=ms_per_token) as marian:
+        seconds, _ = _timed(lambda: gs.translate_transcripts(transcripts, 'en', 'de', use_memory=False))
+    results['translate.fake_marian'] = {'seconds': round(seconds, 4), 'lines': 2 * lines,
+                                        'batches': marian.batches, 'padded_tokens': marian.padded_tokens}
+    return results
+
+
+def bench_srt(cues: int, workdir: Path) -> Dict[str, Any]:
+    from subtitle_io import benchmark
+    raw = benchmark(cues, workdir)
+    raw['seconds'] = round(raw['write_all_formats_s'] + raw['parse_stream_s'], 4)
+    return {'srt_io': raw}
+
+
+def _request_stats(fn: Callable[[], Any], requests: int) -> Dict[str, Any]:
+    fn()  # warm-up
+    times = []
+    for _ in range(requests):
+        began = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - began)
+    times.sort()
+    return {'seconds': round(statistics.mean(times), 5), 'p95_ms': round(1000 * times[int(0.95 * (len(times) - 1))], 2),
+            'requests': requests}
+
+
+def bench_flask(workdir: Path, cues: int, requests: int) -> Dict[str, Any]:
+    """Editor and upload endpoints through Flask's test client."""
+    # importing the app creates media/; leave the tree as it was found
+    created = [BASE_DIR / d for d in ('media', 'output') if not (BASE_DIR / d).exists()]
+    sys.path.insert(0, str(BASE_DIR / 'web'))
+    import app as web_app
+    from subtitle_io import synthetic_segments, write_srt
+    from upload_store import UploadManager
+    client = web_app.app.test_client()
+    # the SRT has to live under the project root for the editor endpoints
+    bench_dir = BASE_DIR / 'output' / f'_bench_{uuid.uuid4().hex[:8]}'
+    srt = bench_dir / 'srt' / 'bench_fake.srt'
+    srt.parent.mkdir(parents=True)
+    saved_uploads = web_app.uploads
+    web_app.uploads = UploadManager(workdir / 'media')
+    results = {}
+    try:
+        write_srt(synthetic_segments(cues), srt)
+        rel = os.path.relpath(str(srt), start=str(BASE_DIR))
+
+        def ok(resp):
+            if resp.status_code >= 400:
+                raise RuntimeError(f'{resp.request.path}: HTTP {resp.status_code}')
+            return resp
+
+        results['flask.index'] = _request_stats(lambda: ok(client.get('/')), requests)
+        results['flask.srt_list'] = _request_stats(lambda: ok(client.get('/api/srt_list?limit=50')), requests)
+        results['flask.segments'] = _request_stats(lambda: ok(client.get('/api/segments', query_string={'path': rel})), requests)
+        results['flask.export_vtt'] = _request_stats(
+            lambda: ok(client.get('/api/export', query_string={'path': rel, 'format': 'vtt'})), requests)
+        results['flask.media_range'] = _request_stats(
+            lambda: ok(client.get(f'/media/{rel}', headers={'Range': 'bytes=1000-66535'})), requests)
+
+        counter = {'n': 0}
+
+        def patch():
+            state = ok(client.get('/api/segments', query_string={'path': rel})).get_json()
+            counter['n'] += 1
+            op = {'op': 'update', 'id': state['segments'][0]['id'], 'text': f'edited {counter["n"]}'}
+            ok(client.post('/api/patch_segments', json={'path': rel, 'base_rev': state['rev'], 'ops': [op]}))
+
+        results['flask.patch_segments'] = _request_stats(patch, max(5, requests // 5))
+        results['flask.patch_segments']['note'] = 'includes the /api/segments read before each patch'
+
+        chunk = os.urandom(1 << 20)
+        uploads = {'n': 0}
+
+        def upload():
+            uploads['n'] += 1
+            headers = {'X-Upload-Id': f'bench{uploads["n"]}', 'X-Chunk-Index': '0', 'X-Total-Chunks': '1',
+                       'X-Chunk-Size': str(len(chunk)), 'X-File-Size': str(len(chunk)),
+                       'X-File-Name': f'bench_{uploads["n"]}.bin', 'Content-Type': 'application/octet-stream'}
+            ok(client.post('/upload_chunk', data=chunk, headers=headers))
+
+        results['flask.upload_chunk_1mb'] = _request_stats(upload, requests)
+    finally:
+        web_app.uploads = saved_uploads
+        shutil.rmtree(bench_dir, ignore_errors=True)
+        for path in created:
+            shutil.rmtree(path, ignore_errors=True)
+    return results
+
+
+def bench_pipeline(video: Path, workdir: Path, rtf: float, ms_per_token: float) -> Dict[str, Any]:
+    import generate_subtitles as gs
+    events = []
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with fake_backends(rtf=rtf, ms_per_token=ms_per_token):
+            seconds, result = _timed(lambda: gs.generate_subtitles(
+                str(video), 'whisper', target_langs=['de', 'fr'], use_cache=False, parallel_backends=False,
+                progress_callback=events.append))
+    finally:
+        os.chdir(previous)
+    return {'pipeline': {'seconds': round(seconds, 4), 'files': len(result['srt_paths']), 'errors': result['errors'],
+                         'time_to_first_segment': result['metrics']['time_to_first_segment']}}
+
+
+# runs in a fresh interpreter: time and memory of importing one module, and which heavy packages it pulled in
+_STARTUP_PROBE = """
+import json, sys, time
+sys.path[:0] = {paths!r}
+import pipeline_metrics
+before = pipeline_metrics.rss_bytes() or 0
+modules = len(sys.modules)
+began = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - began
+import backend_plugins
+print(json.dumps({{'seconds': seconds, 'import_mb': ((pipeline_metrics.rss_bytes() or 0) - before) / 1048576.0,
+                  'max_rss_mb': (pipeline_metrics.max_rss_bytes() or 0) / 1048576.0,
+                  'modules': len(sys.modules) - modules, 'heavy_modules': backend_plugins.heavy_modules_loaded()}}))
+"""
+
+
+def bench_startup(repeat: int) -> Dict[str, Any]:
+    """Cold import of `generate_subtitles` and of the Flask app, each in a new interpreter."""
+    # importing the app creates media/; leave the tree as it was found
+    created = [BASE_DIR / d for d in ('media', 'output') if not (BASE_DIR / d).exists()]
+    targets = {'startup.generate_subtitles': ('generate_subtitles', [str(BASE_DIR)]),
+               'startup.app': ('app', [str(BASE_DIR / 'web'), str(BASE_DIR)])}
+    results = {}
+    try:
+        for name, (module, paths) in targets.items():
+            runs = []
+            for _ in range(max(1, repeat)):
+                began = time.perf_counter()
+                completed = subprocess.run([sys.executable, '-c', _STARTUP_PROBE.format(paths=paths, module=module)],
+                                           cwd=str(BASE_DIR), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                           check=False)
+                process_s = time.perf_counter() - began
+                if completed.returncode != 0:
+                    raise RuntimeError(completed.stderr.decode('utf-8', errors='ignore').strip().splitlines()[-1])
+                run = json.loads(completed.stdout.decode('utf-8').strip().splitlines()[-1])
+                run['process_s'] = process_s
+                runs.append(run)
+            last = runs[-1]
+            results[name] = {'seconds': round(statistics.median(r['seconds'] for r in runs), 4),
+                             'process_s': round(statistics.median(r['process_s'] for r in runs), 4),
+                             'import_mb': round(statistics.median(r['import_mb'] for r in runs), 1),
+                             'max_rss_mb': round(last['max_rss_mb'], 1), 'modules': last['modules'],
+                             'heavy_modules': last['heavy_modules']}
+    finally:
+        for path in created:
+            shutil.rmtree(path, ignore_errors=True)
+    return results
+
+
+# -- suite ----------------------------------------------------------------
+
+STAGE_GROUPS = ('startup', 'extract', 'asr', 'text', 'translate', 'srt', 'flask', 'pipeline')
+
+
+def _isolate(workdir: Path) -> None:
+    # must run before the pipeline modules are imported: their singletons read these
+    os.environ['SUBTITLE_CATALOG_PATH'] = str(workdir / 'catalog.sqlite3')
+    os.environ['SUBTITLE_CATALOG_RESCAN_S'] = '0'
+    os.environ['SUBTITLE_CACHE_DIR'] = str(workdir / 'results')
+    os.environ['SUBTITLE_TM_PATH'] = str(workdir / 'tm.sqlite3')
+    os.environ['SUBTITLE_RESULT_CACHE'] = '0'
+    os.environ['SUBTITLE_TRANSLATION_MEMORY'] = '0'
+    os.environ.setdefault('SUBTITLE_PREWARM_MODELS', '')
+
+
+def run_suite(stages=STAGE_GROUPS, seconds: float = 120.0, rtf: float = 0.02, ms_per_token: float = 0.01,
+              words: int = 200000, lines: int = 5000, cues: int = 20000, requests: int = 50, repeat: int = 3,
+              real: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix='subtitle-bench-'))
+    _isolate(workdir)
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    results: Dict[str, Any] = {}
+    skipped: Dict[str, str] = {}
+    params = {'seconds': seconds, 'fake_rtf': rtf, 'ms_per_token': ms_per_token, 'words': words, 'lines': lines,
+              'cues': cues, 'requests': requests, 'repeat': repeat, 'real': list(real)}
+    try:
+        wav = synthetic_wav(workdir / 'bench.wav', seconds)
+        video = None
+        if have_ffmpeg():
+            video = synthetic_video(workdir / 'bench.mp4', wav, seconds)
+        stage_fns = {
+            'startup': lambda: bench_startup(repeat),
+            'extract': lambda: bench_extract(video, workdir, seconds),
+            'asr': lambda: bench_asr(wav, rtf, real),
+            'text': lambda: bench_text(words, repeat),
+            'translate': lambda: bench_translation(lines, ms_per_token, repeat),
+            'srt': lambda: bench_srt(cues, workdir),
+            'flask': lambda: bench_flask(workdir, cues, requests),
+            'pipeline': lambda: bench_pipeline(video, workdir, rtf, ms_per_token),
+        }
+        for group in stages:
+            if group in ('extract', 'pipeline') and video is None:
+                skipped[group] = 'ffmpeg not found'
+                continue
+            try:
+                out = stage_fns[group]()
+            except Exception as exc:
+                skipped[group] = f'failed: {exc}'
+                continue
+            if isinstance(out, tuple):
+                out, more = out
+                skipped.update(more)
+            results.update(out)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'suite': 'subtitle-pipeline',
+        'version': SUITE_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'env': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                'ffmpeg': have_ffmpeg()},
+        'params': params,
+        'stages': results,
+        'skipped': skipped,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.2, min_delta: float = 0.005,
+            stage_thresholds: Optional[Dict[str, float]] = None, min_mb: float = 5.0) -> Dict[str, Any]:
+    """Per-stage change in `seconds` against `baseline`; `regressions` lists the stages over their threshold.
+
+    `stage_thresholds` maps fnmatch patterns (e.g. `flask.*`) to their own allowed slowdown.
+    Startup stages are also compared on `import_mb` (growth above the threshold and above
+    `min_mb`), and a heavy package that is now imported at startup is always a regression.
+    """
+    stage_thresholds = stage_thresholds or {}
+    rows, regressions = {}, []
+    for name, stage in current.get('stages', {}).items():
+        before = baseline.get('stages', {}).get(name)
+        if not before or 'seconds' not in before or 'seconds' not in stage:
+            continue
+        allowed = next((v for pattern, v in stage_thresholds.items() if fnmatch.fnmatch(name, pattern)), threshold)
+        old, new = float(before['seconds']), float(stage['seconds'])
+        change = (new - old) / old if old > 0 else 0.0
+        regressed = change > allowed and new - old > min_delta
+        row = {'baseline': old, 'current': new, 'change': round(change, 3), 'allowed': allowed,
+               'regression': regressed}
+        if 'import_mb' in stage and 'import_mb' in before:
+            old_mb, new_mb = float(before['import_mb']), float(stage['import_mb'])
+            mem_change = (new_mb - old_mb) / old_mb if old_mb > 0 else 0.0
+            row['import_mb'] = {'baseline': old_mb, 'current': new_mb, 'change': round(mem_change, 3)}
+            if mem_change > allowed and new_mb - old_mb > min_mb:
+                row['regression'] = regressed = True
+        new_heavy = sorted(set(stage.get('heavy_modules', ())) - set(before.get('heavy_modules', ())))
+        if new_heavy:
+            row['new_heavy_modules'] = new_heavy
+            row['regression'] = regressed = True
+        rows[name] = row
+        if regressed:
+            regressions.append(name)
+    if baseline.get('params') != current.get('params'):
+        rows['_warning'] = 'baseline was recorded with different parameters'
+    return {'stages': rows, 'regressions': regressions}
+
+
+def _parse_stage_thresholds(values: List[str]) -> Dict[str, float]:
+    out = {}
+    for value in values or []:
+        pattern, _, frac = value.partition('=')
+        out[pattern] = float(frac)
+    return out
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the subtitle pipeline stage by stage with stand-in backends.')
+    parser.add_argument('--stages', default=','.join(STAGE_GROUPS),
+                        help='comma-separated stage groups to run (default: %(default)s)')
+    parser.add_argument('--seconds', type=float, default=120.0, help='length of the synthetic media (default: %(default)s)')
+    parser.add_argument('--fake-rtf', type=float, default=0.02,
+                        help='seconds the fake ASR spends per second of audio (default: %(default)s)')
+    parser.add_argument('--ms-per-token', type=float, default=0.01,
+                        help='fake Marian latency per padded token (default: %(default)s)')
+    parser.add_argument('--words', type=int, default=200000, help='words for aggregate_words (default: %(default)s)')
+    parser.add_argument('--lines', type=int, default=5000, help='lines per translated transcript (default: %(default)s)')
+    parser.add_argument('--cues', type=int, default=20000, help='cues for the SRT and editor stages (default: %(default)s)')
+    parser.add_argument('--requests', type=int, default=50, help='requests per Flask endpoint (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of the quick stages; the median is kept (default: %(default)s)')
+    parser.add_argument('--real', default='', help="installed backends to time as well, e.g. 'whisper,vosk' or 'all'")
+    parser.add_argument('--output', help='write the results JSON here instead of printing it')
+    parser.add_argument('--baseline', help='results JSON to compare against; exit status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown per stage (default: %(default)s)')
+    parser.add_argument('--stage-threshold', action='append', metavar='PATTERN=FRACTION',
+                        help="allowed slowdown for matching stages, e.g. 'flask.*=0.5' (repeatable)")
+    parser.add_argument('--min-delta', type=float, default=0.005,
+                        help='ignore slowdowns smaller than this many seconds (default: %(default)s)')
+    parser.add_argument('--min-mb', type=float, default=5.0,
+                        help='ignore import memory growth smaller than this many MB (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGE_GROUPS]
+    if unknown:
+        parser.error(f'unknown stage groups: {", ".join(unknown)}')
+    real = tuple(s.strip() for s in args.real.split(',') if s.strip())
+    if 'all' in real:
+        real = ('whisper', 'wav2vec2', 'silero', 'nemo', 'vosk')
+    result = run_suite(stages, seconds=args.seconds, rtf=args.fake_rtf, ms_per_token=args.ms_per_token,
+                       words=args.words, lines=args.lines, cues=args.cues, requests=args.requests,
+                       repeat=args.repeat, real=real)
+    status = 0
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        result['comparison'] = compare(result, baseline, args.threshold, args.min_delta,
+                                       _parse_stage_thresholds(args.stage_threshold), args.min_mb)
+        status = 1 if result['comparison']['regressions'] else 0
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+        if args.baseline:
+            print(json.dumps(result['comparison'], indent=2))
+    else:
+        print(text)
+    return status
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,334 @@
+"""Structured timing, CPU and memory spans for the subtitle pipeline, exported for Prometheus.
+
+`generate_subtitles` wraps each stage (cache lookup, audio extraction, model load, every
+backend's inference, translation per language, SRT writing, ...) in `span(stage, backend=...)`.
+A span measures:
+
+    wall_s         elapsed time
+    cpu_s          CPU time of the calling thread
+    child_cpu_s    CPU time of child processes that exited meanwhile (ffmpeg), process-wide
+    rss_mb         resident memory when the span ended
+    max_rss_mb     peak resident memory of the process so far (ffmpeg children separately)
+    audio_s        audio covered by the stage, when known; then also `rtf` (wall / audio)
+                   and `audio_s_per_s` (audio / wall)
+
+Every finished span goes to the `JobRecorder` bound to the current thread, which forwards
+it to the job's callback (the web app streams them as `span` SSE events), and to the
+process-wide `metrics` registry, which keeps counters and histograms by stage and backend
+and renders them in the Prometheus text format for `/metrics`. Other components add their
+own numbers through `metrics.register_collector`.
+
+`profiled(path)` wraps a job in cProfile and writes `<path>.prof` plus a text summary.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import cProfile
+import io
+import math
+import os
+import pstats
+import threading
+import time
+
+try:
+    import resource
+except Exception:
+    resource = None
+
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1.0, 2.0, 5.0)
+# only these span fields become Prometheus labels; the rest stay in the per-job events
+LABELS = ('stage', 'backend')
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size (Linux), or None."""
+    try:
+        with open('/proc/self/statm', 'rb') as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def max_rss_bytes(children: bool = False) -> Optional[int]:
+    """Peak resident set size of this process (or of its waited-for children)."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # kilobytes on Linux, bytes on macOS
+    return usage.ru_maxrss if os.uname().sysname == 'Darwin' else usage.ru_maxrss * 1024
+
+
+def _children_cpu() -> float:
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def _mb(value: Optional[int]) -> Optional[float]:
+    return None if value is None else round(value / (1024.0 * 1024.0), 1)
+
+
+class MetricsRegistry:
+    """Counters and histograms keyed by (name, labels), rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], List[float]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]] = []
+
+    def describe(self, name: str, kind: str, text: str, buckets: Tuple[float, ...] = DURATION_BUCKETS) -> None:
+        with self._lock:
+            self._help[name] = (kind, text)
+            if kind == 'histogram':
+                self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            buckets = self._buckets.get(name, DURATION_BUCKETS)
+            state = self._histograms.get(key)
+            if state is None:
+                # per bucket counts, then sum and count
+                state = self._histograms[key] = [0.0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def register_collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]) -> None:
+        """`fn()` yields `(name, kind, help, labels, value)` samples at every scrape."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def record_span(self, span: Dict[str, Any]) -> None:
+        labels = {k: span[k] for k in LABELS if span.get(k)}
+        self.inc('subtitle_stage_total', outcome=span['outcome'], **labels)
+        self.observe('subtitle_stage_duration_seconds', span['wall_s'], **labels)
+        self.inc('subtitle_stage_wall_seconds_total', span['wall_s'], **labels)
+        self.inc('subtitle_stage_cpu_seconds_total', span['cpu_s'], **labels)
+        if span.get('audio_s'):
+            self.inc('subtitle_stage_audio_seconds_total', span['audio_s'], **labels)
+            if span['stage'] == 'asr' and span['outcome'] == 'ok':
+                self.observe('subtitle_backend_rtf', span['rtf'], backend=span.get('backend') or 'unknown')
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            helps = dict(self._help)
+            buckets = dict(self._buckets)
+            collectors = list(self._collectors)
+        families: Dict[str, List[str]] = {}
+        for (name, labels), value in sorted(counters.items()):
+            families.setdefault(name, []).append(f'{name}{_labels(labels)} {_num(value)}')
+        for (name, labels), state in sorted(histograms.items()):
+            lines = families.setdefault(name, [])
+            bounds = buckets.get(name, DURATION_BUCKETS)
+            for bound, count in zip(bounds, state):
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _num(bound)),))} {_num(count)}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {_num(state[-1])}')
+            lines.append(f'{name}_sum{_labels(labels)} {_num(state[-2])}')
+            lines.append(f'{name}_count{_labels(labels)} {_num(state[-1])}')
+        for collect in collectors:
+            try:
+                samples = list(collect())
+            except Exception:
+                continue
+            for name, kind, text, labels, value in samples:
+                if value is None:
+                    continue
+                helps.setdefault(name, (kind, text))
+                families.setdefault(name, []).append(f'{name}{_labels(tuple(sorted(labels.items())))} {_num(value)}')
+        out = []
+        for name in sorted(families):
+            kind, text = helps.get(name, ('untyped', ''))
+            if text:
+                out.append(f'# HELP {name} {text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(families[name])
+        return '\n'.join(out) + '\n'
+
+
+def _num(value: float) -> str:
+    if isinstance(value, float) and (math.isinf(value) or math.isnan(value)):
+        return '+Inf' if value > 0 else ('-Inf' if value < 0 else 'NaN')
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+metrics = MetricsRegistry()
+metrics.describe('subtitle_stage_total', 'counter', 'Pipeline stage runs by outcome.')
+metrics.describe('subtitle_stage_duration_seconds', 'histogram', 'Wall time per pipeline stage run.')
+metrics.describe('subtitle_stage_wall_seconds_total', 'counter', 'Wall time spent in each pipeline stage.')
+metrics.describe('subtitle_stage_cpu_seconds_total', 'counter', 'CPU time of the calling thread in each pipeline stage.')
+metrics.describe('subtitle_stage_audio_seconds_total', 'counter', 'Seconds of audio processed by each stage.')
+metrics.describe('subtitle_backend_rtf', 'histogram', 'Real-time factor (wall / audio) of ASR runs.', RTF_BUCKETS)
+
+
+class JobRecorder:
+    """Spans of one job, forwarded to `callback` as they finish."""
+
+    def __init__(self, callback: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.callback = callback
+        self.started = time.monotonic()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]) -> None:
+        span['elapsed'] = round(time.monotonic() - self.started, 3)
+        with self._lock:
+            self.spans.append(span)
+        if self.callback:
+            try:
+                self.callback(span)
+            except Exception:
+                pass
+
+    def summary(self) -> Dict[str, Any]:
+        """Wall/CPU seconds per stage (and backend), plus the job's audio throughput."""
+        stages: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            key = span['stage'] + (f".{span['backend']}" if span.get('backend') else '')
+            row = stages.setdefault(key, {'wall_s': 0.0, 'cpu_s': 0.0, 'runs': 0})
+            row['wall_s'] = round(row['wall_s'] + span['wall_s'], 4)
+            row['cpu_s'] = round(row['cpu_s'] + span['cpu_s'], 4)
+            row['runs'] += 1
+            if span.get('rtf') is not None:
+                row['rtf'] = span['rtf']
+        audio_s = max((s.get('audio_s') or 0.0 for s in spans), default=0.0)
+        wall = time.monotonic() - self.started
+        peaks = [s['max_rss_mb'] for s in spans if s.get('max_rss_mb') is not None]
+        return {'stages': stages, 'audio_s': audio_s, 'wall_s': round(wall, 3),
+                'audio_s_per_s': round(audio_s / wall, 2) if wall > 0 and audio_s else None,
+                'max_rss_mb': max(peaks) if peaks else None}
+
+
+_local = threading.local()
+
+
+def current() -> Optional[JobRecorder]:
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def recording(recorder: Optional[JobRecorder]):
+    """Send spans opened in this thread to `recorder` inside the block."""
+    previous = current()
+    _local.recorder = recorder
+    try:
+        yield recorder
+    finally:
+        _local.recorder = previous
+
+
+def bound(fn: Callable) -> Callable:
+    """`fn` wrapped to record into the calling thread's recorder from any thread (e.g. a pool)."""
+    recorder = current()
+
+    def run(*args, **kwargs):
+        with recording(recorder):
+            return fn(*args, **kwargs)
+    return run
+
+
+class Span:
+    """Context manager measuring one stage; see the module docstring for the fields."""
+
+    def __init__(self, stage: str, backend: Optional[str] = None, **attrs):
+        self.stage = stage
+        self.backend = backend
+        self.attrs = attrs
+
+    def set(self, **attrs) -> 'Span':
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self) -> 'Span':
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        self._child = _children_cpu()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is None:
+            outcome = 'ok'
+        elif exc_type.__name__ == 'JobCancelled':
+            outcome = 'cancelled'
+        else:
+            outcome = 'error'
+        record(self.stage, self.backend, wall_s=time.perf_counter() - self._wall, cpu_s=time.thread_time() - self._cpu,
+               child_cpu_s=_children_cpu() - self._child, outcome=outcome, **self.attrs)
+        return False
+
+
+def span(stage: str, backend: Optional[str] = None, **attrs) -> Span:
+    return Span(stage, backend, **attrs)
+
+
+def record(stage: str, backend: Optional[str] = None, wall_s: float = 0.0, cpu_s: float = 0.0,
+           outcome: str = 'ok', **attrs) -> Dict[str, Any]:
+    """Record a span measured elsewhere (e.g. a backend that ran in a worker process)."""
+    data: Dict[str, Any] = {'stage': stage, 'backend': backend, 'outcome': outcome,
+                            'wall_s': round(wall_s, 4), 'cpu_s': round(cpu_s, 4)}
+    for key, value in attrs.items():
+        data[key] = round(value, 4) if isinstance(value, float) else value
+    audio_s = data.get('audio_s')
+    if audio_s:
+        data['rtf'] = round(wall_s / audio_s, 4)
+        data['audio_s_per_s'] = round(audio_s / wall_s, 2) if wall_s > 0 else None
+    data['rss_mb'] = _mb(rss_bytes())
+    data['max_rss_mb'] = _mb(max_rss_bytes())
+    child_peak = max_rss_bytes(children=True)
+    if child_peak:
+        data['child_max_rss_mb'] = _mb(child_peak)
+    metrics.record_span(data)
+    recorder = current()
+    if recorder is not None:
+        recorder.add(data)
+    return data
+
+
+def profiling_requested(flag: Optional[str] = None) -> bool:
+    """A job is profiled when the request asks for it, or for every job with `SUBTITLE_PROFILE_JOBS=1`."""
+    values = (flag or '', os.environ.get('SUBTITLE_PROFILE_JOBS', ''))
+    return any(v.lower() in ('1', 'true', 'yes', 'on') for v in values)
+
+
+@contextmanager
+def profiled(path: Path, limit: int = 40):
+    """cProfile the block (this thread only); writes `<path>.prof` and a cumulative-time `<path>.txt`."""
+    path = Path(path)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield path
+    finally:
+        profiler.disable()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(path.with_suffix('.prof')))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(limit)
+        path.with_suffix('.txt').write_text(text.getvalue(), encoding='utf-8')
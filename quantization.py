@@ -0,0 +1,292 @@
+"""Opt-in int8 CPU inference for Whisper, wav2vec2 and Marian.
+
+Every model used to run in fp32. Their Linear layers hold most of the weights and most of
+the CPU time, so on CPU-only machines the `balanced` and `speed` presets load them with
+torch dynamic quantization: int8 weights, with activations quantized on the fly. This makes
+them roughly 2-4x smaller and usually 1.5-3x faster, at a small accuracy cost.
+
+    accuracy   fp32 models as before (default, or `SUBTITLE_PRESET`)
+    balanced   the same models, int8
+    speed      int8, with the smaller `base` Whisper model
+
+Quantizing needs the fp32 model loaded first, so the quantized module is pickled to
+`cache/quantized/` (or `SUBTITLE_QUANT_CACHE`) and later loads skip the fp32 weights
+entirely. The file name carries the torch version, since pickled modules are not portable
+across versions. Dynamic quantization is a CPU feature: with CUDA available the presets only
+change the Whisper size. Thread counts are left to `SUBTITLE_TORCH_THREADS`, which
+`generate_subtitles` applies once before the first job.
+
+A job's preset is thread-local, like the `pipeline_metrics` recorder. `generate_subtitles`
+enters it with `using()` and hands it to its worker processes, and `default_model_params`
+reads it. Quantized models get their own registry, result cache and translation memory
+keys, so fp32 and int8 outputs never mix.
+
+`python quantization.py bench clip.wav` compares the presets on real models: load time,
+real-time factor and word error rate of each int8 transcript against the fp32 one (or
+against `--reference` text).
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+from backend_plugins import lazy_module
+
+torch = lazy_module('torch')
+
+PRESETS: Dict[str, Dict[str, Any]] = {
+    'accuracy': {'quantize': None, 'whisper_size': None},
+    'balanced': {'quantize': 'int8', 'whisper_size': None},
+    'speed': {'quantize': 'int8', 'whisper_size': 'base'},
+}
+PRESET_LABELS = {'accuracy': 'Accuracy (fp32)', 'balanced': 'Balanced (int8)', 'speed': 'Speed (int8, smaller Whisper)'}
+QUANTIZED_BACKENDS = ('whisper', 'wav2vec2', 'marian')
+
+_local = threading.local()
+
+
+def default_preset() -> str:
+    name = os.environ.get('SUBTITLE_PRESET', 'accuracy').strip().lower()
+    return name if name in PRESETS else 'accuracy'
+
+
+def resolve_preset(name: Optional[str]) -> str:
+    """`name` if it is a known preset, else the configured default."""
+    name = (name or '').strip().lower()
+    return name if name in PRESETS else default_preset()
+
+
+def active() -> str:
+    """The preset of the job running in this thread."""
+    return getattr(_local, 'preset', None) or default_preset()
+
+
+def quantize_mode(preset: Optional[str] = None) -> Optional[str]:
+    return PRESETS[resolve_preset(preset or active())]['quantize']
+
+
+def preset_options(preset: Optional[str] = None) -> Dict[str, Any]:
+    return dict(PRESETS[resolve_preset(preset or active())])
+
+
+@contextmanager
+def using(preset: Optional[str]):
+    """Run the block with `preset` as this thread's preset (None keeps the current one)."""
+    previous = getattr(_local, 'preset', None)
+    if preset:
+        _local.preset = resolve_preset(preset)
+    try:
+        yield
+    finally:
+        _local.preset = previous
+
+
+def bound(fn: Callable) -> Callable:
+    """Wrap `fn` so it runs with the calling thread's preset (for pool threads)."""
+    preset = active()
+
+    def run(*args, **kwargs):
+        with using(preset):
+            return fn(*args, **kwargs)
+    return run
+
+
+def can_quantize() -> bool:
+    """Dynamic quantization needs torch, and only pays off on CPU."""
+    if not torch.available():
+        return False
+    try:
+        return not torch.cuda.is_available()
+    except Exception:
+        return True
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get('SUBTITLE_QUANT_CACHE', 'cache/quantized'))
+
+
+def quantize_module(module):
+    """int8 dynamic quantization of every `nn.Linear` in `module`."""
+    return torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _cache_path(name: str) -> Path:
+    safe = re.sub(r'[^A-Za-z0-9_.-]+', '_', name)
+    return cache_dir() / f'{safe}-int8-torch{torch.__version__}.pt'
+
+
+def load_quantized(name: str, build: Callable[[], Any]):
+    """The int8 version of the module `build()` returns, reloaded from the disk cache when possible."""
+    path = _cache_path(name)
+    if path.exists():
+        try:
+            try:
+                return torch.load(str(path), map_location='cpu', weights_only=False)
+            except TypeError:
+                # torch < 1.13 has no weights_only
+                return torch.load(str(path), map_location='cpu')
+        except Exception as exc:
+            print(f'Quantized cache {path} unusable ({exc}); rebuilding')
+            try:
+                path.unlink()
+            except OSError:
+                pass
+    module = quantize_module(build())
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        torch.save(module, str(tmp))
+        os.replace(tmp, path)
+    except Exception as exc:
+        # still usable, only the next load pays for quantizing again
+        print(f'Could not cache quantized {name}: {exc}')
+    return module
+
+
+def cached_models() -> List[Dict[str, Any]]:
+    root = cache_dir()
+    if not root.exists():
+        return []
+    return [{'file': p.name, 'bytes': p.stat().st_size} for p in sorted(root.glob('*.pt'))]
+
+
+# -- evaluation -----------------------------------------------------------
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[\w']+", text.lower())
+
+
+def word_error_rate(reference: str, hypothesis: str) -> Optional[float]:
+    """(substitutions + insertions + deletions) / reference words, on lowercased word tokens."""
+    ref, hyp = _words(reference), _words(hypothesis)
+    if not ref:
+        return None if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, other in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word != other))
+        previous = current
+    return previous[-1] / float(len(ref))
+
+
+def _load_audio(path: Path):
+    from audio_buffer import extract_audio_pcm
+    try:
+        return extract_audio_pcm(path)
+    except Exception:
+        from waveform_peaks import read_wav
+        return read_wav(path)
+
+
+def benchmark(media: Path, backends=('whisper', 'wav2vec2', 'marian'), presets=('accuracy', 'balanced', 'speed'),
+              reference: Optional[str] = None, target_lang: str = 'de') -> Dict[str, Any]:
+    """Load time, real-time factor and WER of each backend under each preset.
+
+    WER is measured against `reference` when given, otherwise against the `accuracy`
+    (fp32) output. Marian translates the fp32 Whisper transcript (or the reference) line by
+    line and its WER is against the fp32 translation.
+    """
+    import generate_subtitles as gs
+    from model_registry import registry as model_registry
+    # the copy of this module generate_subtitles reads the preset from (this file may be __main__)
+    import quantization
+
+    audio = _load_audio(Path(media))
+    results: Dict[str, Any] = {'audio_s': round(audio.duration, 2), 'can_quantize': can_quantize(), 'backends': {}}
+    source_lines: List[str] = []
+    for backend in backends:
+        rows: Dict[str, Any] = {}
+        baseline_text = None
+        for preset in presets:
+            with quantization.using(preset):
+                try:
+                    model_registry.evict(backend)
+                    began = time.perf_counter()
+                    if backend == 'marian':
+                        if not gs.translation_available():
+                            rows[preset] = {'skipped': 'not installed'}
+                            continue
+                        lines = source_lines or [line for line in (reference or '').split('.') if line.strip()]
+                        if not lines:
+                            rows[preset] = {'skipped': 'nothing to translate (transcribe with whisper first or pass --reference)'}
+                            continue
+                        gs._translation_cache.clear()
+                        gs.get_translation_model('en', target_lang)
+                        load_s = time.perf_counter() - began
+                        began = time.perf_counter()
+                        text = ' '.join(gs.translate_texts(lines, 'en', target_lang, use_memory=False))
+                        seconds = time.perf_counter() - began
+                        row = {'load_s': round(load_s, 2), 'seconds': round(seconds, 3),
+                               'ms_per_line': round(1000 * seconds / len(lines), 1)}
+                    else:
+                        if not gs.backend_available(backend):
+                            rows[preset] = {'skipped': 'not installed'}
+                            continue
+                        model_registry.get(backend, **gs.default_model_params(backend))
+                        load_s = time.perf_counter() - began
+                        began = time.perf_counter()
+                        segments = gs.TRANSCRIBERS[backend](audio, audio.duration)
+                        seconds = time.perf_counter() - began
+                        segments = gs.SegmentStore.coerce(segments)
+                        text = ' '.join(segments.texts)
+                        row = {'load_s': round(load_s, 2), 'seconds': round(seconds, 3),
+                               'rtf': round(seconds / audio.duration, 4)}
+                        if backend == 'whisper' and preset == presets[0]:
+                            source_lines = [line for line in segments.texts if line.strip()]
+                    row['params'] = gs.default_model_params(backend) if backend != 'marian' else {'quantize': quantization.quantize_mode()}
+                except Exception as exc:
+                    rows[preset] = {'error': str(exc)}
+                    continue
+            if baseline_text is None:
+                baseline_text = text
+            against = reference if reference and backend != 'marian' else baseline_text
+            wer = None if against is None else word_error_rate(against, text)
+            row['wer'] = None if wer is None else round(wer, 4)
+            rows[preset] = row
+        first = rows.get(presets[0], {})
+        for preset, row in rows.items():
+            if preset != presets[0] and 'seconds' in row and first.get('seconds'):
+                row['speedup'] = round(first['seconds'] / row['seconds'], 2) if row['seconds'] else None
+        results['backends'][backend] = rows
+    results['cached'] = cached_models()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Quantized model cache and fp32 vs int8 benchmark.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    bench = sub.add_parser('bench', help='RTF and WER of every preset on a media file')
+    bench.add_argument('media', help='audio or video file (ffmpeg), or a 16 kHz WAV')
+    bench.add_argument('--backends', default='whisper,wav2vec2,marian', help='comma-separated (default: %(default)s)')
+    bench.add_argument('--presets', default=','.join(PRESETS), help='comma-separated (default: %(default)s)')
+    bench.add_argument('--reference', help='text file with the true transcript')
+    bench.add_argument('--lang', default='de', help='Marian target language (default: %(default)s)')
+    sub.add_parser('list', help='quantized models cached on disk')
+    sub.add_parser('purge', help='delete the quantized model cache')
+    args = parser.parse_args(argv)
+
+    if args.command == 'bench':
+        reference = Path(args.reference).read_text(encoding='utf-8') if args.reference else None
+        presets = [p.strip() for p in args.presets.split(',') if p.strip() in PRESETS]
+        result = benchmark(Path(args.media), [b.strip() for b in args.backends.split(',') if b.strip()],
+                           presets, reference=reference, target_lang=args.lang)
+        print(json.dumps(result, indent=2))
+    elif args.command == 'list':
+        print(json.dumps(cached_models(), indent=2))
+    elif args.command == 'purge':
+        removed = 0
+        for item in cached_models():
+            (cache_dir() / item['file']).unlink()
+            removed += 1
+        print(f'removed {removed} files')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
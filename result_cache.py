@@ -0,0 +1,241 @@
+"""Content-addressed on-disk cache of transcription and translation results.
+
+Entries are keyed by a hash of the extracted audio (not the file name) plus the backend
+and its model parameters, so re-uploading the same video under another name, or asking
+for one more target language, reuses every ASR pass and translation already done.
+
+Layout under the cache root (default `cache/results`, or `SUBTITLE_CACHE_DIR`)::
+
+    sources/<video sha256>.json       -> audio fingerprint + duration (lets repeat jobs skip ffmpeg)
+    asr/<key[:2]>/<key>.json          -> canonical segments of one backend run
+    translations/<key[:2]>/<key>.json -> translated segments for one (asr result, language)
+
+Least recently used entries are evicted once the cache grows past `max_bytes`
+(`SUBTITLE_CACHE_MAX_MB`, default 2048). Run `python result_cache.py --help` to inspect
+or purge the cache.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import time
+import wave
+
+from segment_store import SegmentStore
+
+# Bump when the stored segment format or the way results are produced changes.
+CACHE_VERSION = 2
+KINDS = ('sources', 'asr', 'translations')
+
+
+def _digest(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def file_digest(path: Path, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def audio_fingerprint(audio) -> str:
+    """sha256 of the decoded PCM, from an `AudioBuffer` or a WAV file."""
+    h = hashlib.sha256()
+    if hasattr(audio, 'pcm_bytes'):
+        h.update(f'{audio.sample_rate}:'.encode('ascii'))
+        h.update(audio.pcm_bytes())
+        return h.hexdigest()
+    with contextlib.closing(wave.open(str(audio), 'rb')) as wf:
+        h.update(f'{wf.getframerate()}:'.encode('ascii'))
+        while True:
+            frames = wf.readframes(1 << 16)
+            if not frames:
+                break
+            h.update(frames)
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root: Path, max_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    # -- keys -----------------------------------------------------------
+
+    @staticmethod
+    def asr_key(fingerprint: str, backend: str, params: Dict[str, Any]) -> str:
+        return _digest({'v': CACHE_VERSION, 'audio': fingerprint, 'backend': backend, 'params': params})
+
+    @staticmethod
+    def translation_key(asr_key: str, src_lang: str, tgt_lang: str, model_id: str) -> str:
+        return _digest({'v': CACHE_VERSION, 'asr': asr_key, 'src': src_lang, 'tgt': tgt_lang, 'model': model_id})
+
+    # -- storage --------------------------------------------------------
+
+    def _path(self, kind: str, key: str) -> Path:
+        if kind == 'sources':
+            return self.root / kind / f'{key}.json'
+        return self.root / kind / key[:2] / f'{key}.json'
+
+    def _read(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(kind, key)
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            # refresh mtime so eviction is least-recently-used rather than oldest-written
+            os.utime(path, None)
+        except OSError:
+            pass
+        self.hits += 1
+        return data
+
+    def _write(self, kind: str, key: str, data: Dict[str, Any]) -> None:
+        path = self._path(kind, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps(data), encoding='utf-8')
+        os.replace(tmp, path)
+
+    def lookup_source(self, video_digest: str) -> Optional[Dict[str, Any]]:
+        return self._read('sources', video_digest)
+
+    def remember_source(self, video_digest: str, fingerprint: str, duration: float) -> None:
+        self._write('sources', video_digest, {'fingerprint': fingerprint, 'duration': duration, 'created': time.time()})
+
+    def get_segments(self, kind: str, key: str) -> Optional[SegmentStore]:
+        data = self._read(kind, key)
+        return None if data is None else SegmentStore.from_records(data.get('segments') or [])
+
+    def put_segments(self, kind: str, key: str, segments, meta: Optional[Dict[str, Any]] = None) -> None:
+        # entries stay a list of {'start', 'end', 'text'} records on disk
+        records = SegmentStore.coerce(segments).to_records()
+        self._write(kind, key, {'segments': records, 'meta': meta or {}, 'created': time.time()})
+
+    # -- maintenance ----------------------------------------------------
+
+    def entries(self) -> List[Dict[str, Any]]:
+        items = []
+        for kind in KINDS:
+            base = self.root / kind
+            if not base.exists():
+                continue
+            for path in base.rglob('*.json'):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                items.append({'kind': kind, 'key': path.stem, 'path': str(path), 'size': st.st_size, 'last_used': st.st_mtime})
+        return items
+
+    def stats(self) -> Dict[str, Any]:
+        items = self.entries()
+        by_kind: Dict[str, Dict[str, int]] = {}
+        for item in items:
+            k = by_kind.setdefault(item['kind'], {'entries': 0, 'bytes': 0})
+            k['entries'] += 1
+            k['bytes'] += item['size']
+        return {
+            'root': str(self.root),
+            'entries': len(items),
+            'bytes': sum(i['size'] for i in items),
+            'max_bytes': self.max_bytes,
+            'kinds': by_kind,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """Delete least recently used entries until the cache fits in `max_bytes`."""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        if limit is None:
+            return 0
+        items = sorted(self.entries(), key=lambda i: i['last_used'])
+        total = sum(i['size'] for i in items)
+        removed = 0
+        for item in items:
+            if total <= limit:
+                break
+            try:
+                os.remove(item['path'])
+            except OSError:
+                continue
+            total -= item['size']
+            removed += 1
+        return removed
+
+    def purge(self, older_than: Optional[float] = None, kind: Optional[str] = None) -> int:
+        """Delete entries (optionally only those unused for `older_than` seconds, or of one kind)."""
+        now = time.time()
+        removed = 0
+        for item in self.entries():
+            if kind and item['kind'] != kind:
+                continue
+            if older_than is not None and now - item['last_used'] < older_than:
+                continue
+            try:
+                os.remove(item['path'])
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+def _max_bytes_from_env() -> Optional[int]:
+    raw = os.environ.get('SUBTITLE_CACHE_MAX_MB', '2048')
+    try:
+        mb = float(raw)
+    except ValueError:
+        return None
+    return int(mb * 1024 * 1024) if mb > 0 else None
+
+
+def cache_enabled() -> bool:
+    return os.environ.get('SUBTITLE_RESULT_CACHE', '1').lower() not in ('0', 'false', 'no')
+
+
+result_cache = ResultCache(Path(os.environ.get('SUBTITLE_CACHE_DIR', 'cache/results')), max_bytes=_max_bytes_from_env())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Inspect or purge the subtitle result cache.')
+    parser.add_argument('--root', default=str(result_cache.root), help='cache directory (default: %(default)s)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('stats', help='entry counts and sizes per kind')
+    list_p = sub.add_parser('list', help='list entries, most recently used first')
+    list_p.add_argument('--kind', choices=KINDS)
+    list_p.add_argument('--limit', type=int, default=50)
+    purge_p = sub.add_parser('purge', help='delete entries')
+    purge_p.add_argument('--kind', choices=KINDS)
+    purge_p.add_argument('--older-than', type=float, metavar='DAYS', help='only entries unused for this many days')
+    evict_p = sub.add_parser('evict', help='shrink the cache to a size budget (LRU)')
+    evict_p.add_argument('--max-mb', type=float, required=True)
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(Path(args.root))
+    if args.command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == 'list':
+        items = [i for i in cache.entries() if not args.kind or i['kind'] == args.kind]
+        for item in sorted(items, key=lambda i: i['last_used'], reverse=True)[:args.limit]:
+            used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['last_used']))
+            print(f"{item['kind']:<13} {item['key'][:16]}  {item['size']:>10}  {used}")
+    elif args.command == 'purge':
+        older = args.older_than * 86400 if args.older_than is not None else None
+        print(f'removed {cache.purge(older_than=older, kind=args.kind)} entries')
+    elif args.command == 'evict':
+        print(f'removed {cache.evict(int(args.max_mb * 1024 * 1024))} entries')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
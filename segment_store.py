@@ -0,0 +1,256 @@
+"""Columnar containers for subtitle segments and recognized words.
+
+Long videos produce hundreds of thousands of word timestamps (NeMo, Vosk). Holding each
+one as a small dict costs far more memory than the data itself, and copying them at every
+stage (aggregation, translation, SRT writing) dominates the non-model time.
+`SegmentStore` and `WordStore` keep start/end times in float arrays and text as integer
+ids into a per-store string table, so repeated lines are stored once. Timestamp
+formatting and word aggregation run over the whole arrays at once.
+
+Both stores still behave like the old `List[Dict]` where callers need it: indexing gives
+`{'start', 'end', 'text'}` dicts, and `to_records()` / `from_records()` convert at JSON
+boundaries (API responses, the result cache, SSE events). Reading and writing subtitle
+files lives in `subtitle_io`.
+
+numpy is optional; without it the columns are `array.array('d')` and the vectorized
+helpers fall back to plain loops.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import array
+import re
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+
+def _float_column(values: Iterable[float] = ()):
+    if np is not None:
+        return np.asarray(values if hasattr(values, 'dtype') else list(values), dtype=np.float64)
+    return array.array('d', values)
+
+
+def _intern(texts: Iterable[str]) -> Tuple[List[str], Any]:
+    """(string table, id per text); equal strings share one table entry."""
+    table: List[str] = []
+    index: Dict[str, int] = {}
+    ids = []
+    for text in texts:
+        code = index.get(text)
+        if code is None:
+            code = index[text] = len(table)
+            table.append(text)
+        ids.append(code)
+    return table, (np.asarray(ids, dtype=np.int32) if np is not None else array.array('i', ids))
+
+
+def _take(column, positions):
+    if np is not None:
+        return column[positions]
+    return array.array(column.typecode, (column[i] for i in positions))
+
+
+# -- timestamps -----------------------------------------------------------
+
+def format_timestamp(seconds: float) -> str:
+    total_ms = int(round(max(seconds, 0.0) * 1000))
+    h, rem = divmod(total_ms, 3600000)
+    m, rem = divmod(rem, 60000)
+    s, ms = divmod(rem, 1000)
+    return f'{h:02}:{m:02}:{s:02},{ms:03}'
+
+
+def format_timestamps(seconds) -> List[str]:
+    """`format_timestamp` over a whole column; the arithmetic is done in one numpy pass."""
+    if np is None:
+        return [format_timestamp(s) for s in seconds]
+    total_ms = np.round(np.maximum(np.asarray(seconds, dtype=np.float64), 0.0) * 1000).astype(np.int64)
+    h, rem = np.divmod(total_ms, 3600000)
+    m, rem = np.divmod(rem, 60000)
+    s, ms = np.divmod(rem, 1000)
+    return [f'{a:02}:{b:02}:{c:02},{d:03}' for a, b, c, d in zip(h.tolist(), m.tolist(), s.tolist(), ms.tolist())]
+
+
+_TIMESTAMP_RE = re.compile(r'^\s*(?:(\d+):)?(\d+):(\d+)(?:[,.](\d+))?\s*$')
+
+
+def parse_timestamp(value) -> float:
+    """Seconds from an SRT/VTT timestamp (`00:00:01,234`, `00:01.5`) or a number."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = str(value).strip()
+    if len(value) == 12 and value[2] == ':' and value[5] == ':' and value[8] in ',.':
+        # fast path for the fixed-width HH:MM:SS,mmm form every SRT writer produces
+        try:
+            return int(value[0:2]) * 3600 + int(value[3:5]) * 60 + int(value[6:8]) + int(value[9:12]) / 1000.0
+        except ValueError:
+            pass
+    match = _TIMESTAMP_RE.match(value)
+    if not match:
+        return float(value)
+    h, m, s, frac = match.groups()
+    return int(h or 0) * 3600 + int(m) * 60 + int(s) + (float(f'0.{frac}') if frac else 0.0)
+
+
+# -- segments -------------------------------------------------------------
+
+class SegmentStore:
+    """Subtitle segments as parallel `starts` / `ends` arrays plus interned text."""
+
+    def __init__(self, starts=None, ends=None, text_ids=None, table: Optional[List[str]] = None):
+        self.starts = starts if starts is not None else _float_column()
+        self.ends = ends if ends is not None else _float_column()
+        if text_ids is None:
+            table, text_ids = _intern(())
+        self.text_ids = text_ids
+        self.table = table if table is not None else []
+
+    @classmethod
+    def from_columns(cls, starts: Sequence[float], ends: Sequence[float], texts: Iterable[str]) -> 'SegmentStore':
+        table, ids = _intern(texts)
+        return cls(_float_column(starts), _float_column(ends), ids, table)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> 'SegmentStore':
+        starts, ends, texts = [], [], []
+        for rec in records:
+            start = float(rec.get('start', 0.0))
+            starts.append(start)
+            ends.append(float(rec.get('end', start)))
+            texts.append(rec.get('text', ''))
+        return cls.from_columns(starts, ends, texts)
+
+    @classmethod
+    def coerce(cls, segments) -> 'SegmentStore':
+        """The store itself, or a store built from a list of segment dicts."""
+        return segments if isinstance(segments, cls) else cls.from_records(segments or [])
+
+    @classmethod
+    def concat(cls, stores: Iterable['SegmentStore']) -> 'SegmentStore':
+        stores = [cls.coerce(s) for s in stores]
+        if np is not None and stores:
+            starts = np.concatenate([s.starts for s in stores])
+            ends = np.concatenate([s.ends for s in stores])
+        else:
+            starts = [t for s in stores for t in s.starts]
+            ends = [t for s in stores for t in s.ends]
+        return cls.from_columns(starts, ends, (t for s in stores for t in s.texts))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            positions = range(len(self))[index]
+            if np is not None:
+                positions = np.arange(positions.start, positions.stop, positions.step, dtype=np.int64)
+            return SegmentStore(_take(self.starts, positions), _take(self.ends, positions),
+                                _take(self.text_ids, positions), self.table)
+        if index < 0:
+            index += len(self)
+        return {'start': float(self.starts[index]), 'end': float(self.ends[index]), 'text': self.table[self.text_ids[index]]}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        table = self.table
+        starts = self.starts.tolist()
+        ends = self.ends.tolist()
+        for start, end, code in zip(starts, ends, self.text_ids.tolist()):
+            yield {'start': start, 'end': end, 'text': table[code]}
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (SegmentStore, list)):
+            return self.to_records() == SegmentStore.coerce(other).to_records()
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'SegmentStore({len(self)} segments, {len(self.table)} distinct lines)'
+
+    @property
+    def texts(self) -> List[str]:
+        table = self.table
+        return [table[code] for code in self.text_ids.tolist()]
+
+    @property
+    def end_time(self) -> float:
+        return float(self.ends[-1]) if len(self) else 0.0
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    def with_texts(self, texts: Iterable[str]) -> 'SegmentStore':
+        """Same timing, new text (e.g. a translation); the time columns are shared, not copied."""
+        table, ids = _intern(texts)
+        return SegmentStore(self.starts, self.ends, ids, table)
+
+    def shifted(self, offset: float) -> 'SegmentStore':
+        if np is not None:
+            return SegmentStore(self.starts + offset, self.ends + offset, self.text_ids, self.table)
+        return SegmentStore(array.array('d', (t + offset for t in self.starts)),
+                            array.array('d', (t + offset for t in self.ends)), self.text_ids, self.table)
+
+
+# -- words ----------------------------------------------------------------
+
+class WordStore:
+    """Recognized words with timestamps; empty tokens are kept so timing stays aligned."""
+
+    def __init__(self, starts, ends, word_ids, table: List[str]):
+        self.starts = starts
+        self.ends = ends
+        self.word_ids = word_ids
+        self.table = table
+
+    @classmethod
+    def from_columns(cls, starts: Sequence[float], ends: Sequence[float], words: Iterable[str]) -> 'WordStore':
+        table, ids = _intern(word.strip() for word in words)
+        return cls(_float_column(starts), _float_column(ends), ids, table)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> 'WordStore':
+        starts, ends, words = [], [], []
+        for rec in records:
+            start = rec.get('start', 0.0)
+            start = 0.0 if start is None else float(start)
+            end = rec.get('end', start)
+            starts.append(start)
+            ends.append(start if end is None else float(end))
+            words.append(rec.get('word') or '')
+        return cls.from_columns(starts, ends, words)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def aggregate(self, max_words: int = 10) -> SegmentStore:
+        """Group consecutive non-empty words into segments of `max_words` words.
+
+        The last, shorter group ends at the last word of the list (empty tokens included),
+        as the list-of-dicts version always did.
+        """
+        table = self.table
+        if np is not None:
+            nonempty = np.asarray([bool(t) for t in table], dtype=bool)
+            keep = np.flatnonzero(nonempty[self.word_ids]) if len(self) else np.zeros(0, dtype=np.int64)
+        else:
+            keep = [i for i, code in enumerate(self.word_ids) if table[code]]
+        count = len(keep)
+        if count == 0:
+            return SegmentStore()
+        firsts = keep[0::max_words]
+        lasts = keep[max_words - 1::max_words]
+        starts = _take(self.starts, firsts)
+        ends = list(_take(self.ends, lasts)) if np is None else self.ends[lasts]
+        if count % max_words:
+            tail = float(self.ends[-1])
+            ends = np.append(ends, tail) if np is not None else ends + [tail]
+        codes = self.word_ids[keep].tolist() if np is not None else [self.word_ids[i] for i in keep]
+        tokens = [table[code] for code in codes]
+        texts = [' '.join(tokens[i:i + max_words]) for i in range(0, count, max_words)]
+        return SegmentStore.from_columns(starts, ends, texts)
+
+
+def aggregate_words(words, max_words: int = 10) -> SegmentStore:
+    """Word timestamps (a `WordStore` or `{'word', 'start', 'end'}` dicts) to subtitle segments."""
+    if not isinstance(words, WordStore):
+        words = WordStore.from_records(words)
+    return words.aggregate(max_words)
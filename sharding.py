@@ -0,0 +1,158 @@
+"""Split long audio at silences so one file can be transcribed by several processes.
+
+`plan_shards` runs a cheap energy-based voice activity detector over an `AudioBuffer` and
+cuts it into chunks of at most `max_chunk_s` seconds, preferring the middle of silent
+stretches. When a chunk has to be cut inside speech, neighbouring shards overlap by
+`overlap_s` and `merge_shard_segments` keeps each segment only in the shard whose core
+range contains its midpoint, dropping words duplicated across the boundary. `ShardMerger`
+does the same incrementally for shards that finish in timeline order.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from segment_store import SegmentStore
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+
+class Shard:
+    """A time range to transcribe (`start`..`end`) and the part of it this shard owns (`core_*`)."""
+
+    __slots__ = ('index', 'start', 'end', 'core_start', 'core_end')
+
+    def __init__(self, index: int, start: float, end: float, core_start: float, core_end: float):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.core_start = core_start
+        self.core_end = core_end
+
+    def __repr__(self) -> str:
+        return f'Shard({self.index}, {self.start:.2f}-{self.end:.2f}, core {self.core_start:.2f}-{self.core_end:.2f})'
+
+
+def voiced_frames(audio, frame_s: float = 0.03):
+    """Per-frame speech mask (`frame_s` seconds per frame) from an adaptive RMS threshold."""
+    if np is None:
+        raise RuntimeError('numpy is required for audio sharding')
+    samples = audio.samples()
+    frame = max(1, int(audio.sample_rate * frame_s))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = samples[:n_frames * frame].reshape(n_frames, frame).astype(np.float32)
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    # adaptive threshold: a bit above the noise floor but well below typical speech level,
+    # never below an absolute minimum
+    floor = float(np.percentile(rms, 10))
+    speech = float(np.percentile(rms, 90))
+    threshold = max(min(floor * 2.5, speech * 0.1), 100.0)
+    return rms >= threshold
+
+
+def silence_midpoints(audio, frame_s: float = 0.03, min_silence_s: float = 0.3) -> List[float]:
+    """Centers (in seconds) of silent stretches at least `min_silence_s` long."""
+    voiced = voiced_frames(audio, frame_s)
+    if len(voiced) == 0:
+        return []
+    silent = ~voiced
+    # run-length encode the silent mask
+    padded = np.concatenate(([False], silent, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+    min_frames = max(1, int(round(min_silence_s / frame_s)))
+    keep = (ends - starts) >= min_frames
+    return [float((s + e) / 2.0 * frame_s) for s, e in zip(starts[keep], ends[keep])]
+
+
+def plan_shards(audio, max_chunk_s: float = 120.0, min_chunk_s: float = 20.0, overlap_s: float = 1.0,
+                min_silence_s: float = 0.3) -> List[Shard]:
+    """Cut `audio` into shards no longer than `max_chunk_s` (plus overlap on forced cuts)."""
+    duration = audio.duration
+    if duration <= max_chunk_s:
+        return [Shard(0, 0.0, duration, 0.0, duration)]
+    cut_candidates = silence_midpoints(audio, min_silence_s=min_silence_s)
+    cuts: List[Tuple[float, bool]] = []  # (time, cut falls in silence)
+    pos, ci = 0.0, 0
+    while duration - pos > max_chunk_s:
+        limit = pos + max_chunk_s
+        best = None
+        while ci < len(cut_candidates) and cut_candidates[ci] <= limit:
+            if cut_candidates[ci] >= pos + min_chunk_s:
+                best = cut_candidates[ci]
+            ci += 1
+        if best is None:
+            cuts.append((limit, False))
+            pos = limit
+        else:
+            cuts.append((best, True))
+            pos = best
+    shards = []
+    bounds = [(0.0, True)] + cuts + [(duration, True)]
+    for i in range(len(bounds) - 1):
+        core_start, start_clean = bounds[i]
+        core_end, end_clean = bounds[i + 1]
+        start = core_start if start_clean else max(0.0, core_start - overlap_s)
+        end = core_end if end_clean else min(duration, core_end + overlap_s)
+        shards.append(Shard(i, start, end, core_start, core_end))
+    return shards
+
+
+def _norm_word(text: str) -> str:
+    return ''.join(ch for ch in text.lower() if ch.isalnum())
+
+
+class ShardMerger:
+    """`merge_shard_segments` one shard at a time, for shards added in timeline order.
+
+    `add` returns only the segments the new shard contributes, so emitting a growing
+    timeline costs O(segments) in total instead of re-merging every earlier shard.
+    """
+
+    def __init__(self, total_end: float):
+        self.total_end = total_end
+        self.merged: List[Dict[str, Any]] = []
+
+    def add(self, shard: Shard, segments) -> SegmentStore:
+        merged, first = self.merged, len(self.merged)
+        for seg in segments:
+            start = float(seg.get('start', 0.0)) + shard.start
+            end = float(seg.get('end', seg.get('start', 0.0))) + shard.start
+            mid = (start + end) / 2.0
+            # each segment belongs to exactly one shard: the one whose core holds its midpoint
+            if mid < shard.core_start or (mid >= shard.core_end and shard.core_end < self.total_end):
+                continue
+            text = (seg.get('text') or '').strip()
+            if merged and start < merged[-1]['end']:
+                # boundary overlap: drop leading words the previous segment already ends with
+                prev_words = [_norm_word(w) for w in merged[-1]['text'].split()]
+                words = text.split()
+                k = min(len(prev_words), len(words))
+                while k > 0 and prev_words[-k:] != [_norm_word(w) for w in words[:k]]:
+                    k -= 1
+                if k:
+                    text = ' '.join(words[k:])
+                start = max(start, merged[-1]['end'])
+            if not text:
+                continue
+            merged.append({'start': start, 'end': max(end, start), 'text': text})
+        return SegmentStore.from_records(merged[first:])
+
+    def segments(self) -> SegmentStore:
+        return SegmentStore.from_records(self.merged)
+
+
+def merge_shard_segments(results: List[Tuple[Shard, Any]], total_end: Optional[float] = None) -> SegmentStore:
+    """Merge per-shard segments (timestamps relative to the shard) into one absolute timeline.
+
+    Pass the audio duration as `total_end` when merging only the first few shards, so the
+    result is a prefix of what merging every shard would give.
+    """
+    if total_end is None:
+        total_end = max((shard.core_end for shard, _ in results), default=0.0)
+    merger = ShardMerger(total_end)
+    for shard, segments in sorted(results, key=lambda r: r[0].index):
+        merger.add(shard, segments)
+    return merger.segments()
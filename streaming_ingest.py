@@ -0,0 +1,307 @@
+"""Decode and transcribe an upload while its later chunks are still arriving.
+
+A chunked upload (see `upload_store`) fills its file from the front, so the contiguous
+prefix received so far is usually most of what has been sent. `StreamingIngest` pipes that
+prefix into ffmpeg as it grows (`PrefixReader` blocks at the first gap instead of
+reporting end of file), collects the decoded PCM, and `windows()` cuts it into
+transcription windows at silences, using the same detector and overlap rules as
+`sharding`. The first backend therefore works on the beginning of a long video while the
+end is still uploading, and the full `AudioBuffer` is ready the moment the last chunk
+lands.
+
+Containers that need the end of the file before anything can be decoded (MP4/MOV with the
+`moov` index after the media data) are detected up front; for those `streamable()` is
+False and the job simply waits for the upload.
+"""
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+import os
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+from audio_buffer import AudioBuffer
+from sharding import Shard, silence_midpoints
+from upload_store import UploadError, UploadSession
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+READ_BLOCK = 1 << 16
+HEAD_BYTES = 1 << 16
+# top-level ISO BMFF boxes that may precede the index in a streamable file
+_LEADING_BOXES = {b'ftyp', b'free', b'skip', b'wide', b'uuid', b'pdin', b'styp', b'sidx'}
+
+
+def stream_settings() -> dict:
+    """Window sizes and stall timeout from `SUBTITLE_STREAM_WINDOW_S` and `SUBTITLE_STREAM_IDLE_S`."""
+    try:
+        window_s = float(os.environ.get('SUBTITLE_STREAM_WINDOW_S', '30'))
+    except ValueError:
+        window_s = 30.0
+    try:
+        idle_s = float(os.environ.get('SUBTITLE_STREAM_IDLE_S', '600'))
+    except ValueError:
+        idle_s = 600.0
+    return {
+        'enabled': os.environ.get('SUBTITLE_STREAM_INGEST', '1').lower() not in ('0', 'false', 'no'),
+        'max_window_s': max(window_s, 2.0),
+        'min_window_s': max(window_s / 3.0, 1.0),
+        'idle_timeout': idle_s,
+    }
+
+
+def iso_index_first(head: bytes) -> Optional[bool]:
+    """For an MP4/MOV prefix: True if `moov` precedes `mdat`, False if not, None for other formats.
+
+    Also None when `head` ends before either box is reached.
+    """
+    if head[4:8] != b'ftyp':
+        return None
+    pos = 0
+    while pos + 8 <= len(head):
+        size, kind = struct.unpack('>I4s', head[pos:pos + 8])
+        if kind in (b'moov', b'moof'):
+            return True
+        if kind == b'mdat':
+            return False
+        if kind not in _LEADING_BOXES:
+            return False
+        if size == 1:
+            if pos + 16 > len(head):
+                return None
+            size = struct.unpack('>Q', head[pos + 8:pos + 16])[0]
+        if size < 8:
+            return False
+        pos += size
+    return None
+
+
+class PrefixReader:
+    """File-like reader over an upload that waits for missing chunks instead of ending early."""
+
+    def __init__(self, session: UploadSession, idle_timeout: float = 600.0, stop: Optional[threading.Event] = None):
+        self.session = session
+        self.idle_timeout = idle_timeout
+        self.stop = stop or threading.Event()
+        self.pos = 0
+        self._fd = session.open_reader()
+
+    def read(self, size: int = READ_BLOCK) -> bytes:
+        while True:
+            end = self.session.wait_for(self.pos, timeout=1.0)
+            if self.stop.is_set():
+                return b''
+            if end > self.pos:
+                break
+            if self.session.complete:
+                return b''
+            if time.time() - self.session.updated > self.idle_timeout:
+                raise UploadError(f'upload {self.session.id} stalled at {self.pos} bytes')
+        data = os.pread(self._fd, min(size, end - self.pos), self.pos)
+        self.pos += len(data)
+        return data
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class StreamingIngest:
+    """ffmpeg decoding of a growing upload, plus VAD-bounded windows of the decoded audio."""
+
+    def __init__(self, session: UploadSession, sample_rate: int = 16000, max_window_s: float = None,
+                 min_window_s: float = None, overlap_s: float = 1.0, idle_timeout: float = None):
+        settings = stream_settings()
+        self.session = session
+        self.sample_rate = sample_rate
+        self.max_window_s = max_window_s or settings['max_window_s']
+        self.min_window_s = min_window_s or min(settings['min_window_s'], self.max_window_s)
+        self.overlap_s = overlap_s
+        self.idle_timeout = settings['idle_timeout'] if idle_timeout is None else idle_timeout
+        self._stop = threading.Event()
+        self._cond = threading.Condition()
+        self._pcm = bytearray()
+        self._done = False
+        self._error: Optional[str] = None
+        self._proc = None
+        self._threads: List[threading.Thread] = []
+        self.decoded_during_upload = 0.0
+
+    @property
+    def started(self) -> bool:
+        return self._proc is not None
+
+    @property
+    def decoded_seconds(self) -> float:
+        return len(self._pcm) / (2.0 * self.sample_rate)
+
+    @property
+    def video_path(self) -> Path:
+        return self.session.final_path
+
+    # -- upload side ------------------------------------------------------
+
+    def streamable(self) -> bool:
+        """Whether decoding can start before the upload completes."""
+        if np is None or not stream_settings()['enabled']:
+            return False
+        head = self._head()
+        return iso_index_first(head) is not False
+
+    def _head(self) -> bytes:
+        reader = PrefixReader(self.session, self.idle_timeout, self._stop)
+        try:
+            want = HEAD_BYTES if self.session.size is None else min(HEAD_BYTES, self.session.size)
+            while reader.pos < want:
+                block = reader.read(want - reader.pos)
+                if not block:
+                    break
+            return os.pread(reader._fd, reader.pos, 0)
+        finally:
+            reader.close()
+
+    def wait_complete(self, check_cancelled=None) -> Path:
+        """Block until every chunk arrived; returns the final path."""
+        while not self.session.complete:
+            if check_cancelled:
+                check_cancelled()
+            with self.session.progress:
+                self.session.progress.wait(1.0)
+            if time.time() - self.session.updated > self.idle_timeout and not self.session.complete:
+                raise UploadError(f'upload {self.session.id} stalled')
+        return self.session.final_path
+
+    # -- decoding ---------------------------------------------------------
+
+    def start(self) -> None:
+        if self._proc is not None:
+            return
+        self._stderr = tempfile.TemporaryFile()
+        self._proc = subprocess.Popen(
+            ['ffmpeg', '-v', 'error', '-i', 'pipe:0', '-vn', '-ac', '1', '-ar', str(self.sample_rate),
+             '-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self._stderr)
+        for target in (self._feed, self._collect):
+            thread = threading.Thread(target=target, name=f'ingest-{self.session.id}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _feed(self) -> None:
+        reader = PrefixReader(self.session, self.idle_timeout, self._stop)
+        try:
+            while True:
+                block = reader.read(READ_BLOCK)
+                if not block:
+                    break
+                self._proc.stdin.write(block)
+        except UploadError as exc:
+            self._fail(str(exc))
+            self._proc.kill()
+        except (OSError, ValueError):
+            # ffmpeg exited early (bad input or close()); _collect reports its error
+            pass
+        finally:
+            reader.close()
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+
+    def _collect(self) -> None:
+        stdout = self._proc.stdout
+        while True:
+            block = stdout.read(READ_BLOCK)
+            if not block:
+                break
+            with self._cond:
+                self._pcm += block
+                if not self.session.complete:
+                    self.decoded_during_upload = len(self._pcm) / (2.0 * self.sample_rate)
+                self._cond.notify_all()
+        code = self._proc.wait()
+        if code != 0 and not self._stop.is_set():
+            self._stderr.seek(0)
+            self._fail(self._stderr.read().decode('utf-8', errors='ignore').strip() or f'ffmpeg exited with {code}')
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+
+    def _fail(self, message: str) -> None:
+        with self._cond:
+            if self._error is None:
+                self._error = message
+            self._cond.notify_all()
+
+    def _wait_samples(self, samples: int, check_cancelled=None) -> Tuple[int, bool]:
+        """Wait until `samples` are decoded or decoding ended; (decoded samples, finished)."""
+        with self._cond:
+            while True:
+                if self._error:
+                    raise RuntimeError(f'streaming decode failed: {self._error}')
+                decoded = len(self._pcm) // 2
+                if self._done or decoded >= samples:
+                    return decoded, self._done
+                self._cond.wait(1.0)
+                if check_cancelled:
+                    check_cancelled()
+
+    def _buffer(self, start: int, end: int) -> AudioBuffer:
+        with self._cond:
+            data = bytes(self._pcm[start * 2:end * 2])
+        return AudioBuffer(data, self.sample_rate, name=self.video_path.stem)
+
+    def windows(self, check_cancelled=None) -> Iterator[Tuple[Shard, AudioBuffer]]:
+        """Yield `(shard, audio)` windows in order as soon as enough audio is decoded.
+
+        Windows end in the middle of a silence between `min_window_s` and `max_window_s`
+        when there is one; otherwise they are cut at `max_window_s` and overlap the next
+        window by `overlap_s`, exactly like `plan_shards`. Timestamps from each window are
+        relative to `shard.start`; merge them with `sharding.merge_shard_segments`.
+        """
+        self.start()
+        sr = self.sample_rate
+        core_start, clean = 0.0, True
+        index = 0
+        while True:
+            need = int((core_start + self.max_window_s + self.overlap_s) * sr)
+            decoded, finished = self._wait_samples(need, check_cancelled)
+            start = core_start if clean else max(0.0, core_start - self.overlap_s)
+            if finished and decoded <= need:
+                end = decoded / float(sr)
+                if end > core_start or index == 0:
+                    yield Shard(index, start, end, core_start, end), self._buffer(int(start * sr), decoded)
+                return
+            limit = core_start + self.max_window_s
+            region = self._buffer(int(core_start * sr), int(limit * sr))
+            cuts = [core_start + t for t in silence_midpoints(region) if t >= self.min_window_s]
+            if cuts:
+                cut, next_clean = cuts[-1], True
+                end = cut
+            else:
+                cut, next_clean = limit, False
+                end = limit + self.overlap_s
+            yield Shard(index, start, end, core_start, cut), self._buffer(int(start * sr), int(end * sr))
+            core_start, clean = cut, next_clean
+            index += 1
+
+    def audio(self, wav_dir: Optional[Path] = None, check_cancelled=None) -> AudioBuffer:
+        """The whole decoded track once the upload is complete and ffmpeg has finished."""
+        self.start()
+        self._wait_samples(float('inf'), check_cancelled)
+        for thread in self._threads:
+            thread.join()
+        # decoding is over, so the buffer can be shared without copying
+        return AudioBuffer(self._pcm, self.sample_rate, wav_dir=wav_dir, name=self.video_path.stem)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+        with self.session.progress:
+            self.session.progress.notify_all()
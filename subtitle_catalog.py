@@ -0,0 +1,326 @@
+"""Index of processed videos and their output files, backed by SQLite.
+
+Listing subtitles used to walk the whole `output/` tree (and glob `media/`) on every
+request. The catalog keeps one row per file instead:
+
+    media/<video>.<ext>                           -> kind 'video'
+    output/<video>/audio/*.wav                    -> kind 'audio'
+    output/<video>/srt/<video>_<model>[_<lang>].srt/.vtt/.json -> kind 'srt' / 'vtt' / 'json'
+    output/<video>/srt/<file>.srt.bak.*           -> kind 'backup' (`source` is the SRT)
+    output/live/<session>.srt                     -> kind 'srt', model 'live'
+
+Jobs record what they write as they go. `rescan()` reconciles the index with the disk
+(new, changed and deleted files). It runs on first use, every `SUBTITLE_CATALOG_RESCAN_S`
+seconds in the background (default 600, `0` turns it off) and on demand. The database
+lives at `cache/catalog.sqlite3` unless `SUBTITLE_CATALOG_PATH` says otherwise.
+Run `python subtitle_catalog.py --help` to rescan or query it from the shell.
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+VIDEO_EXTS = ('.mp4', '.webm', '.mov', '.mkv', '.avi')
+SUBTITLE_KINDS = ('srt', 'vtt', 'json')
+KINDS = ('video', 'audio', 'backup') + SUBTITLE_KINDS
+MAX_PAGE = 1000
+
+_COLUMNS = ('path', 'kind', 'video', 'model', 'lang', 'source', 'size', 'mtime')
+
+
+def classify(rel: str) -> Optional[Dict[str, Any]]:
+    """Catalog fields for a path relative to the project root, or None if it is not indexed."""
+    parts = Path(rel).parts
+    name = parts[-1] if parts else ''
+    if len(parts) == 2 and parts[0] == 'media' and Path(name).suffix.lower() in VIDEO_EXTS:
+        return {'kind': 'video', 'video': Path(name).stem}
+    if len(parts) < 3 or parts[0] != 'output':
+        return None
+    video = parts[1]
+    if len(parts) == 3 and video == 'live' and name.lower().endswith('.srt'):
+        return {'kind': 'srt', 'video': 'live', 'model': 'live'}
+    if len(parts) != 4:
+        return None
+    if parts[2] == 'audio' and name.lower().endswith('.wav'):
+        return {'kind': 'audio', 'video': video}
+    if parts[2] != 'srt':
+        return None
+    if '.srt.bak.' in name:
+        source = name.split('.bak.', 1)[0]
+        return {'kind': 'backup', 'video': video, 'source': '/'.join(parts[:3] + (source,))}
+    stem, suffix = os.path.splitext(name)
+    kind = suffix[1:].lower()
+    if kind not in SUBTITLE_KINDS:
+        return None
+    # <video>_<model>[_<lang>]; anything else keeps the whole stem as its model
+    rest = stem[len(video) + 1:] if stem.startswith(video + '_') else stem
+    model, _, lang = rest.partition('_')
+    return {'kind': kind, 'video': video, 'model': model or None, 'lang': lang or None}
+
+
+class SubtitleCatalog:
+    def __init__(self, path: Path, root: Path, rescan_interval: float = 600.0):
+        self.path = Path(path)
+        self.root = Path(root).resolve()
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._scanned_at: Optional[float] = None
+        self._scan_thread: Optional[threading.Thread] = None
+        self.last_scan: Dict[str, Any] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                ' path TEXT PRIMARY KEY, kind TEXT NOT NULL, video TEXT, model TEXT, lang TEXT, source TEXT,'
+                ' size INTEGER NOT NULL, mtime REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS files_kind_video ON files (kind, video, path)')
+            conn.execute('CREATE INDEX IF NOT EXISTS files_source ON files (source)')
+            self._conn = conn
+        return self._conn
+
+    def relative(self, path) -> Optional[str]:
+        """`path` relative to the catalog root (with `/`), or None if it lies outside."""
+        full = Path(path)
+        full = (full if full.is_absolute() else Path.cwd() / full).resolve()
+        try:
+            return full.relative_to(self.root).as_posix()
+        except ValueError:
+            return None
+
+    # -- updates ----------------------------------------------------------
+
+    def record(self, paths: Iterable) -> int:
+        """Index (or re-index) files that were just written. Unknown or missing paths are skipped."""
+        rows = []
+        for path in ([paths] if isinstance(paths, (str, Path)) else paths):
+            rel = self.relative(path)
+            info = classify(rel) if rel else None
+            if info is None:
+                continue
+            try:
+                st = (self.root / rel).stat()
+            except OSError:
+                continue
+            rows.append(self._row(rel, info, st.st_size, st.st_mtime))
+        if rows:
+            with self._lock:
+                conn = self._connection()
+                conn.executemany(f'INSERT OR REPLACE INTO files ({", ".join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                conn.commit()
+        return len(rows)
+
+    def forget(self, paths: Iterable) -> None:
+        rels = [r for r in (self.relative(p) for p in ([paths] if isinstance(paths, (str, Path)) else paths)) if r]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany('DELETE FROM files WHERE path = ?', [(r,) for r in rels])
+            conn.commit()
+
+    @staticmethod
+    def _row(rel: str, info: Dict[str, Any], size: int, mtime: float) -> Tuple:
+        return (rel, info['kind'], info.get('video'), info.get('model'), info.get('lang'), info.get('source'), size, mtime)
+
+    def _walk(self, base: Path, depth: int):
+        # os.scandir hands back stat results from the directory listing, so this stays one pass
+        try:
+            entries = list(os.scandir(base))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if depth > 0:
+                        yield from self._walk(Path(entry.path), depth - 1)
+                elif entry.is_file():
+                    yield entry
+            except OSError:
+                continue
+
+    def rescan(self, under=None) -> Dict[str, Any]:
+        """Reconcile the index with the files on disk (everything, or only the tree `under`)."""
+        began = time.perf_counter()
+        if under is None:
+            scopes = [(self.root / 'media', 0), (self.root / 'output', 2)]
+        else:
+            scopes = [(Path(under), 1)]
+        found: Dict[str, Tuple] = {}
+        for base, depth in scopes:
+            for entry in self._walk(base, depth):
+                rel = self.relative(entry.path)
+                info = classify(rel) if rel else None
+                if info is None:
+                    continue
+                st = entry.stat()
+                found[rel] = self._row(rel, info, st.st_size, st.st_mtime)
+        prefixes = [self.relative(base) for base, _ in scopes]
+        with self._lock:
+            conn = self._connection()
+            known = {}
+            for prefix in prefixes:
+                if prefix is None:
+                    continue
+                pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/%'
+                known.update((row['path'], (row['size'], row['mtime'])) for row in conn.execute(
+                    "SELECT path, size, mtime FROM files WHERE path LIKE ? ESCAPE '\\'", (pattern,)))
+            changed = [row for rel, row in found.items() if known.get(rel) != (row[6], row[7])]
+            gone = [(rel,) for rel in known if rel not in found]
+            conn.executemany(f'INSERT OR REPLACE INTO files ({", ".join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', changed)
+            conn.executemany('DELETE FROM files WHERE path = ?', gone)
+            conn.commit()
+            if under is None:
+                self._scanned_at = time.time()
+            self.last_scan = {'files': len(found), 'updated': len(changed), 'removed': len(gone),
+                              'seconds': round(time.perf_counter() - began, 3), 'at': time.time()}
+            return dict(self.last_scan)
+
+    def ensure_fresh(self) -> None:
+        """Scan once before the first query; afterwards rescan in the background when due."""
+        if self._scanned_at is None:
+            self.rescan()
+            return
+        due = self.rescan_interval > 0 and time.time() - self._scanned_at > self.rescan_interval
+        if due and (self._scan_thread is None or not self._scan_thread.is_alive()):
+            self._scanned_at = time.time()
+            self._scan_thread = threading.Thread(target=self.rescan, name='catalog-rescan', daemon=True)
+            self._scan_thread.start()
+
+    # -- queries ----------------------------------------------------------
+
+    def query(self, kind: str = 'srt', video: Optional[str] = None, model: Optional[str] = None,
+              lang: Optional[str] = None, source: Optional[str] = None, q: Optional[str] = None,
+              limit: int = 100, offset: int = 0, newest_first: bool = False) -> Dict[str, Any]:
+        """One page of files plus the total count. `lang='none'` selects untranslated subtitles."""
+        self.ensure_fresh()
+        where, params = ['kind = ?'], [kind]
+        for column, value in (('video', video), ('model', model), ('source', source)):
+            if value:
+                where.append(f'{column} = ?')
+                params.append(value)
+        if lang == 'none':
+            where.append('lang IS NULL')
+        elif lang:
+            where.append('lang = ?')
+            params.append(lang)
+        if q:
+            where.append("path LIKE ? ESCAPE '\\'")
+            params.append('%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        limit = max(1, min(int(limit), MAX_PAGE))
+        offset = max(0, int(offset))
+        clause = ' AND '.join(where)
+        order = 'mtime DESC, path' if newest_first else 'path'
+        with self._lock:
+            conn = self._connection()
+            total = conn.execute(f'SELECT COUNT(*) FROM files WHERE {clause}', params).fetchone()[0]
+            rows = conn.execute(f'SELECT {", ".join(_COLUMNS)} FROM files WHERE {clause} ORDER BY {order} LIMIT ? OFFSET ?',
+                                params + [limit, offset]).fetchall()
+        items = [dict(row) for row in rows]
+        return {'items': items, 'total': total, 'limit': limit, 'offset': offset,
+                'next_offset': offset + len(items) if offset + len(items) < total else None}
+
+    def videos(self, q: Optional[str] = None, limit: int = 100, offset: int = 0) -> Dict[str, Any]:
+        """Videos that have a media file or outputs, with per-kind file counts and their models/languages."""
+        self.ensure_fresh()
+        where, params = ['video IS NOT NULL', "video != 'live'"], []
+        if q:
+            where.append("video LIKE ? ESCAPE '\\'")
+            params.append('%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        limit = max(1, min(int(limit), MAX_PAGE))
+        offset = max(0, int(offset))
+        clause = ' AND '.join(where)
+        with self._lock:
+            conn = self._connection()
+            total = conn.execute(f'SELECT COUNT(DISTINCT video) FROM files WHERE {clause}', params).fetchone()[0]
+            rows = conn.execute(
+                'SELECT video, MAX(mtime) AS updated,'
+                " MAX(CASE WHEN kind = 'video' THEN path END) AS media,"
+                " SUM(kind = 'srt') AS srt, SUM(kind = 'audio') AS audio, SUM(kind = 'backup') AS backups,"
+                " GROUP_CONCAT(DISTINCT CASE WHEN kind = 'srt' THEN model END) AS models,"
+                " GROUP_CONCAT(DISTINCT CASE WHEN kind = 'srt' THEN lang END) AS languages"
+                f' FROM files WHERE {clause} GROUP BY video ORDER BY video LIMIT ? OFFSET ?',
+                params + [limit, offset]).fetchall()
+        items = []
+        for row in rows:
+            item = dict(row)
+            item['models'] = sorted(filter(None, (item['models'] or '').split(',')))
+            item['languages'] = sorted(filter(None, (item['languages'] or '').split(',')))
+            items.append(item)
+        return {'items': items, 'total': total, 'limit': limit, 'offset': offset,
+                'next_offset': offset + len(items) if offset + len(items) < total else None}
+
+    def first(self, kind: str, video: Optional[str] = None) -> Optional[str]:
+        """Path of one existing file of `kind` (for `video`, if given), pruning stale rows on the way."""
+        page = self.query(kind, video=video, limit=5)
+        for item in page['items']:
+            if (self.root / item['path']).exists():
+                return item['path']
+            self.forget([self.root / item['path']])
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            try:
+                counts = dict(self._connection().execute('SELECT kind, COUNT(*) FROM files GROUP BY kind').fetchall())
+            except sqlite3.Error:
+                counts = {}
+        return {'path': str(self.path), 'root': str(self.root), 'files': counts, 'last_scan': self.last_scan,
+                'rescan_interval': self.rescan_interval}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _rescan_interval_from_env() -> float:
+    try:
+        return float(os.environ.get('SUBTITLE_CATALOG_RESCAN_S', '600'))
+    except ValueError:
+        return 600.0
+
+
+catalog = SubtitleCatalog(Path(os.environ.get('SUBTITLE_CATALOG_PATH', 'cache/catalog.sqlite3')),
+                          root=Path(__file__).resolve().parent, rescan_interval=_rescan_interval_from_env())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Rescan or query the subtitle catalog.')
+    parser.add_argument('--db', default=str(catalog.path), help='catalog database (default: %(default)s)')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('rescan', help='reconcile the catalog with output/ and media/')
+    sub.add_parser('stats', help='file counts per kind')
+    list_p = sub.add_parser('list', help='list cataloged files')
+    list_p.add_argument('--kind', choices=KINDS, default='srt')
+    list_p.add_argument('--video')
+    list_p.add_argument('--model')
+    list_p.add_argument('--lang')
+    list_p.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    cat = SubtitleCatalog(Path(args.db), root=catalog.root, rescan_interval=0)
+    if args.command == 'rescan':
+        print(json.dumps(cat.rescan(), indent=2))
+    elif args.command == 'stats':
+        print(json.dumps(cat.stats(), indent=2))
+    elif args.command == 'list':
+        page = cat.query(args.kind, video=args.video, model=args.model, lang=args.lang, limit=args.limit)
+        for item in page['items']:
+            print(f"{item['kind']:<7} {item['video'] or '-':<30} {item['model'] or '-':<9} {item['lang'] or '-':<5} {item['path']}")
+        print(f"{len(page['items'])} of {page['total']}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
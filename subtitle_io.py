@@ -0,0 +1,244 @@
+"""Reading and writing subtitle files.
+
+`iter_srt` parses SRT (and WebVTT cue syntax) line by line as a generator, so only the
+current cue is held in memory; `read_srt` collects the cues into a `SegmentStore`.
+`write_subtitles` writes SRT, WebVTT and JSON from the same segments in a single pass:
+timestamps are formatted a block of cues at a time and every output gets one buffered
+write per block. Files are written next to their target and renamed into place, so a
+reader never sees a half-written subtitle.
+
+Run `python subtitle_io.py --cues 200000` to benchmark parsing and writing.
+"""
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+from segment_store import SegmentStore, format_timestamps, parse_timestamp
+
+FORMATS = ('srt', 'vtt', 'json')
+WRITE_BLOCK = 2048
+BUFFER_SIZE = 1 << 16
+
+Cue = Tuple[float, float, str]
+
+
+# -- parsing --------------------------------------------------------------
+
+def _parse_times(line: str) -> Optional[Tuple[float, float]]:
+    start_s, _, rest = line.partition('-->')
+    # WebVTT cue settings ("align:start position:10%") may follow the end time
+    end_s = rest.split(None, 1)[0] if rest.strip() else ''
+    try:
+        return parse_timestamp(start_s), parse_timestamp(end_s)
+    except ValueError:
+        return None
+
+
+def iter_srt(source: Union[str, Path, Iterable[str]]) -> Iterator[Cue]:
+    """Yield `(start, end, text)` for each cue of an SRT file, path or iterable of lines.
+
+    Cue numbers are optional, text lines are stripped and joined with newlines, and cues
+    with unreadable timestamps are skipped. WebVTT headers, NOTE blocks and cue settings
+    are ignored, so `.vtt` files parse too.
+    """
+    handle = open(source, encoding='utf-8-sig') if isinstance(source, (str, Path)) else source
+    try:
+        times, text = None, []
+        for line in handle:
+            stripped = line.strip()
+            if times is None:
+                # everything outside a cue (numbers, headers, blank lines) is skipped until a timing line
+                if '-->' in stripped:
+                    times, text = _parse_times(stripped), []
+                continue
+            if stripped:
+                text.append(stripped)
+                continue
+            yield times[0], times[1], '\n'.join(text)
+            times = None
+        if times is not None:
+            yield times[0], times[1], '\n'.join(text)
+    finally:
+        if handle is not source:
+            handle.close()
+
+
+def read_srt(source: Union[str, Path, Iterable[str]]) -> SegmentStore:
+    starts, ends, texts = [], [], []
+    for start, end, text in iter_srt(source):
+        starts.append(start)
+        ends.append(end)
+        texts.append(text)
+    return SegmentStore.from_columns(starts, ends, texts)
+
+
+# -- writing --------------------------------------------------------------
+
+def _srt_block(first: int, starts, ends, texts) -> str:
+    return ''.join(f'{idx}\n{start} --> {end}\n{text}\n\n'
+                   for idx, (start, end, text) in enumerate(zip(starts, ends, texts), start=first))
+
+
+def _vtt_block(first: int, starts, ends, texts) -> str:
+    # WebVTT timestamps only differ from SRT in the millisecond separator
+    return ''.join(f'{start[:-4]}.{start[-3:]} --> {end[:-4]}.{end[-3:]}\n{text}\n\n'
+                   for start, end, text in zip(starts, ends, texts))
+
+
+def _json_block(first: int, start_values, end_values, texts) -> str:
+    sep = ',\n' if first > 1 else '\n'
+    return sep + ',\n'.join(f'{{"start": {start!r}, "end": {end!r}, "text": {json.dumps(text, ensure_ascii=False)}}}'
+                            for start, end, text in zip(start_values, end_values, texts))
+
+
+def write_subtitles(segments, outputs: Dict[str, Union[str, Path]], block: int = WRITE_BLOCK) -> Dict[str, Path]:
+    """Write `segments` to every `{format: path}` in `outputs` in one pass over the cues."""
+    store = SegmentStore.coerce(segments)
+    unknown = set(outputs) - set(FORMATS)
+    if unknown:
+        raise ValueError(f'unsupported subtitle format(s): {", ".join(sorted(unknown))}')
+    targets = {fmt: Path(path) for fmt, path in outputs.items()}
+    handles, temps = {}, {}
+    try:
+        for fmt, path in targets.items():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temps[fmt] = path.with_name(f'.{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')
+            handles[fmt] = open(temps[fmt], 'w', encoding='utf-8', newline='\n', buffering=BUFFER_SIZE)
+        if 'vtt' in handles:
+            handles['vtt'].write('WEBVTT\n\n')
+        if 'json' in handles:
+            handles['json'].write('[')
+        table = store.table
+        for pos in range(0, len(store), block):
+            start_values = store.starts[pos:pos + block]
+            end_values = store.ends[pos:pos + block]
+            texts = [table[code].strip() for code in store.text_ids[pos:pos + block].tolist()]
+            if 'srt' in handles or 'vtt' in handles:
+                starts = format_timestamps(start_values)
+                ends = format_timestamps(end_values)
+                if 'srt' in handles:
+                    handles['srt'].write(_srt_block(pos + 1, starts, ends, texts))
+                if 'vtt' in handles:
+                    handles['vtt'].write(_vtt_block(pos + 1, starts, ends, texts))
+            if 'json' in handles:
+                handles['json'].write(_json_block(pos + 1, start_values.tolist(), end_values.tolist(), texts))
+        if 'json' in handles:
+            handles['json'].write('\n]\n')
+        for fmt in list(handles):
+            handles.pop(fmt).close()
+            os.replace(temps.pop(fmt), targets[fmt])
+    finally:
+        for handle in handles.values():
+            handle.close()
+        for tmp in temps.values():
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return targets
+
+
+def write_srt(segments, path: Union[str, Path]) -> Path:
+    return write_subtitles(segments, {'srt': path})['srt']
+
+
+def sibling_paths(srt_path: Union[str, Path], formats: Iterable[str]) -> Dict[str, Path]:
+    """`{format: path}` next to `srt_path` for each requested format (`x.srt` -> `x.vtt`, `x.json`)."""
+    srt_path = Path(srt_path)
+    return {fmt: srt_path if fmt == 'srt' else srt_path.with_suffix(f'.{fmt}') for fmt in formats}
+
+
+# -- benchmark ------------------------------------------------------------
+
+def synthetic_segments(count: int, seed: int = 0) -> SegmentStore:
+    rng = random.Random(seed)
+    vocabulary = ['the', 'a', 'subtitle', 'line', 'video', 'speaker', 'said', 'that', 'we', 'will', 'now', 'see']
+    starts, ends, texts, t = [], [], [], 0.0
+    for _ in range(count):
+        duration = rng.uniform(0.8, 4.0)
+        starts.append(t)
+        ends.append(t + duration)
+        texts.append(' '.join(rng.choice(vocabulary) for _ in range(rng.randint(3, 12))))
+        t += duration + rng.uniform(0.0, 0.5)
+    return SegmentStore.from_columns(starts, ends, texts)
+
+
+def _regex_parse(path: Path) -> list:
+    # the previous approach: read the whole file, split cues with a regex, build dicts
+    segments = []
+    for entry in re.split(r'\n\s*\n', path.read_text(encoding='utf-8').strip()):
+        lines = entry.strip().splitlines()
+        if len(lines) >= 2 and '-->' in lines[1]:
+            start_s, end_s = lines[1].split('-->')
+            segments.append({'start': parse_timestamp(start_s), 'end': parse_timestamp(end_s), 'text': '\n'.join(lines[2:])})
+    return segments
+
+
+def _peak_kb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark(cues: int = 100000, workdir: Optional[Path] = None) -> Dict[str, object]:
+    store = synthetic_segments(cues)
+    with tempfile.TemporaryDirectory(dir=str(workdir) if workdir else None) as tmp:
+        base = Path(tmp) / 'bench.srt'
+        outputs = sibling_paths(base, FORMATS)
+        results: Dict[str, object] = {'cues': cues}
+
+        began = time.perf_counter()
+        write_subtitles(store, {'srt': base})
+        results['write_srt_s'] = round(time.perf_counter() - began, 4)
+
+        began = time.perf_counter()
+        write_subtitles(store, outputs)
+        elapsed = time.perf_counter() - began
+        results['write_all_formats_s'] = round(elapsed, 4)
+        results['write_all_cues_per_s'] = round(cues / elapsed)
+        results['bytes'] = {fmt: path.stat().st_size for fmt, path in outputs.items()}
+
+        began = time.perf_counter()
+        parsed = sum(1 for _ in iter_srt(base))
+        elapsed = time.perf_counter() - began
+        results['parse_stream_s'] = round(elapsed, 4)
+        results['parse_cues_per_s'] = round(parsed / elapsed)
+        results['parse_mb_per_s'] = round(results['bytes']['srt'] / elapsed / 1e6, 2)
+
+        began = time.perf_counter()
+        _regex_parse(base)
+        results['parse_regex_baseline_s'] = round(time.perf_counter() - began, 4)
+
+        # peak memory is measured in separate passes; tracing slows the parsers down a lot
+        results['parse_stream_peak_kb'] = _peak_kb(lambda: sum(1 for _ in iter_srt(base)))
+        results['parse_regex_baseline_peak_kb'] = _peak_kb(lambda: _regex_parse(base))
+
+        began = time.perf_counter()
+        loaded = read_srt(base)
+        results['read_store_s'] = round(time.perf_counter() - began, 4)
+        results['roundtrip_ok'] = parsed == cues and len(loaded) == cues and loaded.texts == [t.strip() for t in store.texts]
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark subtitle parsing and multi-format writing.')
+    parser.add_argument('--cues', type=int, default=100000, help='number of synthetic cues (default: %(default)s)')
+    parser.add_argument('--workdir', help='directory for the temporary files (default: system temp)')
+    args = parser.parse_args(argv)
+    print(json.dumps(benchmark(args.cues, Path(args.workdir) if args.workdir else None), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
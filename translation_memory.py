@@ -0,0 +1,116 @@
+"""Segment-level translation memory backed by SQLite.
+
+Subtitle lines repeat a lot (intros, outros, "Thank you.") across episodes and across the
+transcripts of different ASR backends. `translate_segments` looks every line up here first
+and only sends the misses to Marian.
+
+Entries are keyed on (normalized text, source language, target language, model id).
+The database lives at `cache/translation_memory.sqlite3` unless `SUBTITLE_TM_PATH` says
+otherwise; set `SUBTITLE_TRANSLATION_MEMORY=0` to bypass it.
+"""
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used as the lookup key: NFC, whitespace collapsed, trimmed."""
+    return ' '.join(unicodedata.normalize('NFC', text or '').split())
+
+
+class TranslationMemory:
+    # SQLite caps bound parameters per statement; stay well below the limit
+    _LOOKUP_CHUNK = 500
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS tm ('
+                ' src TEXT NOT NULL, tgt TEXT NOT NULL, model TEXT NOT NULL, source_text TEXT NOT NULL,'
+                ' translation TEXT NOT NULL, uses INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL,'
+                ' PRIMARY KEY (src, tgt, model, source_text))'
+            )
+            self._conn = conn
+        return self._conn
+
+    def lookup_many(self, texts: Iterable[str], src_lang: str, tgt_lang: str,
+                    model_id: str) -> Tuple[Dict[str, str], int, int]:
+        """Translations for the given normalized texts that are already in memory, with this
+        call's hit and miss counts (distinct texts). `hits`/`misses` are process-wide totals."""
+        wanted = list(dict.fromkeys(t for t in texts if t))
+        found: Dict[str, str] = {}
+        with self._lock:
+            conn = self._connection()
+            for i in range(0, len(wanted), self._LOOKUP_CHUNK):
+                chunk = wanted[i:i + self._LOOKUP_CHUNK]
+                marks = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    f'SELECT source_text, translation FROM tm WHERE src=? AND tgt=? AND model=? AND source_text IN ({marks})',
+                    [src_lang, tgt_lang, model_id, *chunk],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                conn.executemany(
+                    'UPDATE tm SET uses = uses + 1 WHERE src=? AND tgt=? AND model=? AND source_text=?',
+                    [(src_lang, tgt_lang, model_id, t) for t in found],
+                )
+                conn.commit()
+            self.hits += len(found)
+            self.misses += len(wanted) - len(found)
+        return found, len(found), len(wanted) - len(found)
+
+    def store_many(self, pairs: Iterable[Tuple[str, str]], src_lang: str, tgt_lang: str, model_id: str) -> None:
+        now = time.time()
+        rows = [(src_lang, tgt_lang, model_id, text, translation, now) for text, translation in pairs if text]
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                'INSERT OR REPLACE INTO tm (src, tgt, model, source_text, translation, uses, created) VALUES (?, ?, ?, ?, ?, 0, ?)',
+                rows,
+            )
+            conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            try:
+                entries = self._connection().execute('SELECT COUNT(*) FROM tm').fetchone()[0]
+            except sqlite3.Error:
+                entries = 0
+            lookups = self.hits + self.misses
+            return {
+                'path': str(self.path),
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def memory_enabled() -> bool:
+    return os.environ.get('SUBTITLE_TRANSLATION_MEMORY', '1').lower() not in ('0', 'false', 'no')
+
+
+translation_memory = TranslationMemory(Path(os.environ.get('SUBTITLE_TM_PATH', 'cache/translation_memory.sqlite3')))
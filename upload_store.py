@@ -0,0 +1,282 @@
+"""Resumable chunked uploads written in place.
+
+The browser used to send 5 MB chunks that were saved as separate files. The request that
+delivered the last index then concatenated all of them into the final video: a second
+full copy, done inside one HTTP request, and broken if that chunk arrived before the
+others. Now each upload gets one preallocated `media/uploads/<id>.part` file and every
+chunk is written straight to `index * chunk_size` with `pwrite`. Chunks may arrive in any
+order and in parallel. A chunk sent with `X-Chunk-Sha256` is verified before it counts.
+When the last missing chunk lands, the file is fsynced, trimmed to its exact size and
+renamed into `media/` in one step.
+
+Which chunks arrived is a bitmap kept in memory (and in a small `<id>.json` sidecar, so an
+interrupted upload can resume after a restart). `/upload_status` answers from it without
+touching the directory.
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+COPY_BLOCK = 1 << 20
+_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class UploadError(ValueError):
+    pass
+
+
+class ChecksumMismatch(UploadError):
+    pass
+
+
+class UploadSession:
+    """One file being uploaded; all methods are thread-safe."""
+
+    def __init__(self, upload_id: str, filename: str, total: int, chunk_size: int, size: Optional[int],
+                 part_path: Path, final_path: Path, received: Optional[bytearray] = None):
+        self.id = upload_id
+        self.filename = filename
+        self.total = total
+        self.chunk_size = chunk_size
+        self.size = size
+        self.part_path = part_path
+        self.final_path = final_path
+        self.bitmap = received if received is not None else bytearray((total + 7) // 8)
+        self.count = sum(bin(b).count('1') for b in self.bitmap)
+        self._prefix = 0
+        self.complete = False
+        self.updated = time.time()
+        self.lock = threading.Lock()
+        # notified after every stored chunk (streaming ingest waits on it)
+        self.progress = threading.Condition(self.lock)
+
+    # -- bitmap -----------------------------------------------------------
+
+    def has(self, index: int) -> bool:
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def _mark(self, index: int) -> None:
+        if not self.has(index):
+            self.bitmap[index >> 3] |= 1 << (index & 7)
+            self.count += 1
+
+    def received(self) -> List[int]:
+        return [i for i in range(self.total) if self.has(i)]
+
+    def contiguous_chunks(self) -> int:
+        """Number of chunks present from the start of the file without a gap."""
+        # chunks are never unmarked, so the scan resumes where the last one stopped
+        while self._prefix < self.total and self.has(self._prefix):
+            self._prefix += 1
+        return self._prefix
+
+    def contiguous_bytes(self) -> int:
+        chunks = self.contiguous_chunks()
+        if chunks == self.total and self.size is not None:
+            return self.size
+        return chunks * self.chunk_size
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'received': self.received(), 'total': self.total, 'count': self.count,
+                    'chunk_size': self.chunk_size, 'size': self.size, 'complete': self.complete,
+                    'contiguous_bytes': self.contiguous_bytes()}
+
+    def wait_for(self, offset: int, timeout: Optional[float] = None) -> int:
+        """Block until more than `offset` bytes from the start are present (or the upload is
+        complete, or `timeout` passes); returns the contiguous length."""
+        with self.progress:
+            if not self.complete and self.contiguous_bytes() <= offset:
+                self.progress.wait_for(lambda: self.complete or self.contiguous_bytes() > offset, timeout)
+            return self.contiguous_bytes()
+
+    def open_reader(self) -> int:
+        """A read-only descriptor on the upload's data, valid across the final rename."""
+        try:
+            return os.open(self.part_path, os.O_RDONLY)
+        except FileNotFoundError:
+            # completed (and renamed) in the meantime
+            return os.open(self.final_path, os.O_RDONLY)
+
+    # -- storage ----------------------------------------------------------
+
+    def _meta_path(self) -> Path:
+        return self.part_path.with_suffix('.json')
+
+    def _save_meta(self) -> None:
+        meta = {'filename': self.filename, 'total': self.total, 'chunk_size': self.chunk_size,
+                'size': self.size, 'bitmap': self.bitmap.hex()}
+        tmp = self._meta_path().with_suffix('.json.tmp')
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self._meta_path())
+
+    def write_chunk(self, index: int, stream, sha256: Optional[str] = None) -> bool:
+        """Store chunk `index` read from the file-like `stream`; True once the upload is complete.
+
+        The data goes straight to its offset in the part file. Raises `ChecksumMismatch`
+        (the chunk is then not marked as received) or `UploadError`.
+        """
+        if not 0 <= index < self.total:
+            raise UploadError(f'chunk index {index} out of range 0..{self.total - 1}')
+        if self.complete:
+            return True
+        if self.has(index):
+            # a retried chunk that already landed: keep the verified bytes
+            while stream.read(COPY_BLOCK):
+                pass
+            return False
+        offset = index * self.chunk_size
+        digest = hashlib.sha256() if sha256 else None
+        written = 0
+        fd = os.open(self.part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            while True:
+                block = stream.read(COPY_BLOCK)
+                if not block:
+                    break
+                if written + len(block) > self.chunk_size:
+                    raise UploadError(f'chunk {index} is larger than the chunk size {self.chunk_size}')
+                # distinct chunks never overlap, so concurrent pwrites need no lock
+                os.pwrite(fd, block, offset + written)
+                written += len(block)
+                if digest is not None:
+                    digest.update(block)
+        finally:
+            os.close(fd)
+        if digest is not None and digest.hexdigest() != sha256.lower():
+            raise ChecksumMismatch(f'chunk {index}: checksum mismatch')
+        if index < self.total - 1 and written != self.chunk_size:
+            raise UploadError(f'chunk {index} has {written} bytes, expected {self.chunk_size}')
+        if index == self.total - 1 and self.size is not None and offset + written != self.size:
+            raise UploadError(f'last chunk ends at {offset + written}, expected {self.size}')
+        with self.lock:
+            if index == self.total - 1:
+                self.size = offset + written
+            self._mark(index)
+            self.updated = time.time()
+            done = self.count == self.total and not self.complete
+            if done:
+                self._finish()
+            else:
+                self._save_meta()
+            self.progress.notify_all()
+            return self.complete
+
+    def _finish(self) -> None:
+        fd = os.open(self.part_path, os.O_WRONLY)
+        try:
+            os.ftruncate(fd, self.size)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.final_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.part_path, self.final_path)
+        self.complete = True
+        try:
+            self._meta_path().unlink()
+        except OSError:
+            pass
+
+
+class UploadManager:
+    """Upload sessions by id, created on the first chunk and reloaded from disk if needed."""
+
+    def __init__(self, media_dir: Path, max_idle: float = 6 * 3600, reap_interval: Optional[float] = 600.0):
+        self.media_dir = Path(media_dir)
+        self.upload_dir = self.media_dir / 'uploads'
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, UploadSession] = {}
+        if reap_interval:
+            # like the job scheduler's janitor: abandoned sessions must not live as long as the process
+            self._janitor = threading.Thread(target=self._reap_loop, args=(reap_interval,),
+                                             name='upload-janitor', daemon=True)
+            self._janitor.start()
+
+    def _paths(self, upload_id: str, filename: str):
+        if not _ID_RE.match(upload_id or ''):
+            raise UploadError('invalid upload id')
+        name = Path(filename or '').name
+        if not name:
+            raise UploadError('missing file name')
+        return self.upload_dir / f'{upload_id}.part', self.media_dir / name
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        if not _ID_RE.match(upload_id or ''):
+            return None
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None:
+                session = self._load(upload_id)
+            return session
+
+    def _load(self, upload_id: str) -> Optional[UploadSession]:
+        meta_path = self.upload_dir / f'{upload_id}.json'
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        part, final = self._paths(upload_id, meta['filename'])
+        session = UploadSession(upload_id, Path(meta['filename']).name, meta['total'], meta['chunk_size'],
+                                meta.get('size'), part, final, bytearray.fromhex(meta['bitmap']))
+        self._sessions[upload_id] = session
+        return session
+
+    def open(self, upload_id: str, filename: str, total: int, chunk_size: Optional[int] = None,
+             size: Optional[int] = None) -> UploadSession:
+        """The session for `upload_id`, created (and its file preallocated) on first use."""
+        part, final = self._paths(upload_id, filename)
+        if total <= 0:
+            raise UploadError('invalid chunk count')
+        with self._lock:
+            session = self._sessions.get(upload_id) or self._load(upload_id)
+            if session is not None:
+                if session.total != total or session.final_path != final:
+                    raise UploadError('upload id reused for a different file')
+                return session
+            chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+            if size is not None and not (total - 1) * chunk_size < size <= total * chunk_size:
+                raise UploadError('file size does not match the chunk count')
+            self.upload_dir.mkdir(parents=True, exist_ok=True)
+            fd = os.open(part, os.O_WRONLY | os.O_CREAT, 0o644)
+            try:
+                if size:
+                    # reserve the blocks now: no fragmentation, and a full disk fails on the first chunk
+                    try:
+                        os.posix_fallocate(fd, 0, size)
+                    except (AttributeError, OSError):
+                        os.ftruncate(fd, size)
+            finally:
+                os.close(fd)
+            session = UploadSession(upload_id, final.name, total, chunk_size, size, part, final)
+            session._save_meta()
+            self._sessions[upload_id] = session
+            return session
+
+    def forget(self, upload_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(upload_id, None)
+
+    def reap(self, max_idle: Optional[float] = None) -> int:
+        """Drop finished or long-idle sessions from memory (incomplete ones stay resumable on disk)."""
+        max_idle = self.max_idle if max_idle is None else max_idle
+        now = time.time()
+        with self._lock:
+            stale = [k for k, s in self._sessions.items() if s.complete or now - s.updated > max_idle]
+            for key in stale:
+                del self._sessions[key]
+        return len(stale)
+
+    def _reap_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.reap()
+            except Exception:
+                pass
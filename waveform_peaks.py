@@ -0,0 +1,175 @@
+"""Multi-resolution waveform peaks for the editor timeline.
+
+Drawing a waveform used to mean shipping the whole extracted WAV to the browser. Right
+after audio extraction, `write_peaks` now stores a min/max pyramid in a small sidecar
+(`output/<video>/audio/<video>.peaks`). Level 0 holds one (min, max) pair per
+`BASE_BLOCK` samples, and every further level halves the resolution, down to a few hundred
+pairs for the whole file. `PeakFile.window` reads just the pairs of one level inside a
+time range, so a request costs the same for a 3 minute clip and a 3 hour one.
+
+Layout (little endian): a 28 byte header
+
+    magic 'SGPK', version u16, reserved u16, sample_rate u32, num_samples u64,
+    base_block u32, factor u16, levels u16
+
+followed by the levels, finest first, each `ceil(num_samples / samples_per_peak)` pairs of
+int8 (min, max). Samples are scaled from int16 by dropping the low byte. A 3 hour 16 kHz
+track takes about 2.7 MB.
+
+Computing peaks needs numpy; reading them does not.
+"""
+from array import array
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+import os
+import struct
+import uuid
+import wave
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from audio_buffer import AudioBuffer
+
+MAGIC = b'SGPK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIQIHH')
+BASE_BLOCK = 256
+FACTOR = 2
+MIN_PEAKS = 256
+PEAKS_SUFFIX = '.peaks'
+# a single response never carries more pairs than this; wider requests get a coarser level
+MAX_WINDOW_PEAKS = 16384
+
+
+def peaks_path(audio_dir: Path, name: str) -> Path:
+    return Path(audio_dir) / f'{name}{PEAKS_SUFFIX}'
+
+
+def _level_counts(num_samples: int, base_block: int, factor: int, levels: int) -> List[int]:
+    return [-(-num_samples // (base_block * factor ** i)) for i in range(levels)]
+
+
+def compute_peaks(audio: AudioBuffer, base_block: int = BASE_BLOCK, factor: int = FACTOR,
+                  min_peaks: int = MIN_PEAKS) -> List[bytes]:
+    """The pyramid as one `bytes` of interleaved int8 (min, max) pairs per level."""
+    if np is None:
+        raise RuntimeError('numpy is required to compute waveform peaks')
+    samples = audio.samples()
+    count = -(-len(samples) // base_block)
+    if count == 0:
+        return [b'']
+    # pad the last block with its own last sample so the padding never widens the range
+    padded = np.empty(count * base_block, dtype=np.int16)
+    padded[:len(samples)] = samples
+    padded[len(samples):] = samples[-1]
+    blocks = padded.reshape(count, base_block)
+    lo = (blocks.min(axis=1) >> 8).astype(np.int8)
+    hi = (blocks.max(axis=1) >> 8).astype(np.int8)
+    levels = []
+    while True:
+        pairs = np.empty(2 * len(lo), dtype=np.int8)
+        pairs[0::2], pairs[1::2] = lo, hi
+        levels.append(pairs.tobytes())
+        if len(lo) <= min_peaks:
+            return levels
+        odd = len(lo) % factor
+        if odd:
+            lo = np.concatenate([lo, np.repeat(lo[-1:], factor - odd)])
+            hi = np.concatenate([hi, np.repeat(hi[-1:], factor - odd)])
+        lo = lo.reshape(-1, factor).min(axis=1)
+        hi = hi.reshape(-1, factor).max(axis=1)
+
+
+def write_peaks(audio: Union[AudioBuffer, Path, str], path: Path, base_block: int = BASE_BLOCK,
+                factor: int = FACTOR) -> Path:
+    """Compute the pyramid of an `AudioBuffer` (or mono 16-bit WAV) and write the sidecar atomically."""
+    if not isinstance(audio, AudioBuffer):
+        audio = read_wav(audio)
+    levels = compute_peaks(audio, base_block, factor)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp')
+    try:
+        with open(tmp, 'wb') as fh:
+            fh.write(HEADER.pack(MAGIC, VERSION, 0, audio.sample_rate, audio.num_samples, base_block, factor, len(levels)))
+            for level in levels:
+                fh.write(level)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+    return path
+
+
+def read_wav(path: Union[Path, str]) -> AudioBuffer:
+    with wave.open(str(path), 'rb') as wf:
+        if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f'{path}: expected mono 16-bit PCM')
+        return AudioBuffer(wf.readframes(wf.getnframes()), wf.getframerate(), name=Path(path).stem)
+
+
+def ensure_peaks(wav_path: Path, path: Path) -> Path:
+    """The sidecar for `wav_path`, (re)built when it is missing or older than the WAV."""
+    path = Path(path)
+    if not path.exists() or path.stat().st_mtime < Path(wav_path).stat().st_mtime:
+        write_peaks(wav_path, path)
+    return path
+
+
+class PeakFile:
+    """Reader for a `.peaks` sidecar; only the requested window is read from disk."""
+
+    def __init__(self, path: Union[Path, str]):
+        self.path = Path(path)
+        with open(self.path, 'rb') as fh:
+            raw = fh.read(HEADER.size)
+        if len(raw) < HEADER.size:
+            raise ValueError(f'{self.path}: truncated peaks header')
+        magic, version, _, self.sample_rate, self.num_samples, self.base_block, self.factor, levels = HEADER.unpack(raw)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{self.path}: not a version {VERSION} peaks file')
+        self.counts = _level_counts(self.num_samples, self.base_block, self.factor, levels)
+        self.offsets = []
+        offset = HEADER.size
+        for count in self.counts:
+            self.offsets.append(offset)
+            offset += 2 * count
+
+    @property
+    def levels(self) -> int:
+        return len(self.counts)
+
+    @property
+    def duration(self) -> float:
+        return self.num_samples / float(self.sample_rate)
+
+    def samples_per_peak(self, level: int) -> int:
+        return self.base_block * self.factor ** level
+
+    def level_for(self, start: float, end: float, width: int) -> int:
+        """Coarsest level that still gives at least `width` pairs between `start` and `end`."""
+        span = max(end - start, 0.0) * self.sample_rate
+        level = 0
+        for candidate in range(1, self.levels):
+            if span / self.samples_per_peak(candidate) < width:
+                break
+            level = candidate
+        while level + 1 < self.levels and span / self.samples_per_peak(level) > MAX_WINDOW_PEAKS:
+            level += 1
+        return level
+
+    def window(self, level: int, start: float = 0.0, end: Optional[float] = None) -> Tuple[int, array]:
+        """(index of the first pair, flat int8 [min, max, ...]) for level `level` over `[start, end)`."""
+        level = max(0, min(int(level), self.levels - 1))
+        spp = self.samples_per_peak(level)
+        count = self.counts[level]
+        first = max(0, min(count, int(start * self.sample_rate) // spp))
+        last = count if end is None else max(first, min(count, -(-int(end * self.sample_rate) // spp)))
+        last = min(last, first + MAX_WINDOW_PEAKS)
+        with open(self.path, 'rb') as fh:
+            fh.seek(self.offsets[level] + 2 * first)
+            data = array('b', fh.read(2 * (last - first)))
+        return first, data
@@ -1,54 +1,122 @@
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, jsonify, Response
-import importlib.util
-from threading import Thread
-from queue import Queue, Empty
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response
+import contextlib
+from threading import Lock, Thread
+from queue import Empty
 import uuid
 import json
+from urllib.parse import quote, urlencode
 from pathlib import Path
 import sys
 import os
+import time
 
 # Ensure project root is on sys.path so `python web/app.py` (run from project root)
 # can import top-level modules like `generate_subtitles`.
 BASE_DIR = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(BASE_DIR))
 
-from generate_subtitles import generate_subtitles, LANG_CODE_MAP
+from generate_subtitles import generate_subtitles, prewarm_models, extract_audio_ffmpeg, LANG_CODE_MAP, BACKEND_ORDER, backend_available
+from model_registry import registry as model_registry
+from job_scheduler import JobScheduler, QueueFull, SchedulerClosed
+from translation_memory import translation_memory
+from live_captions import LiveCaptionManager, SessionLimitReached
+from subtitle_io import FORMATS as SUBTITLE_FORMATS, read_srt, sibling_paths, write_subtitles
+from edit_journal import EditConflict, journals
+from subtitle_catalog import catalog, classify
+from waveform_peaks import PeakFile, ensure_peaks, peaks_path
+from media_server import audio_proxy, file_etag, proxy_codec, send_media
+from upload_store import ChecksumMismatch, UploadError, UploadManager
+from streaming_ingest import StreamingIngest
+import pipeline_metrics
+import quantization
+from pipeline_metrics import metrics
+from werkzeug.security import safe_join
 from pathlib import Path
-import re
-from datetime import timedelta, datetime
-import shutil
 
 app = Flask(__name__)
 MEDIA_DIR = BASE_DIR / 'media'
 MEDIA_DIR.mkdir(parents=True, exist_ok=True)
 
-MODEL_OPTIONS = ['whisper', 'wav2vec2', 'silero', 'nemo', 'vosk', 'all']
+MODEL_OPTIONS = BACKEND_ORDER + ['all']
 
-# In-memory job queues for streaming progress. Format: {job_id: Queue}
-job_queues = {}
+# Bounded worker pool for /generate jobs. Each job carries its own event queue that
+# /events/<job_id> streams to the browser.
+scheduler = JobScheduler(
+    workers=int(os.environ.get('SUBTITLE_WORKERS', '1')),
+    max_pending=int(os.environ.get('SUBTITLE_MAX_PENDING', '16')),
+    job_ttl=float(os.environ.get('SUBTITLE_JOB_TTL', '3600')),
+)
 
-def _run_job_background(job_id: str, video_path: str, model_choice: str, target_langs: list):
-    q = job_queues.get(job_id)
-    if q is None:
+# Chunked uploads (/upload_chunk), written in place into media/uploads/<id>.part.
+uploads = UploadManager(MEDIA_DIR)
+
+# Live captioning sessions (/live/...), each with its own streaming recognizer.
+live_captions = LiveCaptionManager(
+    max_sessions=int(os.environ.get('SUBTITLE_LIVE_MAX_SESSIONS', '4')),
+    output_dir=BASE_DIR / 'output' / 'live',
+    idle_timeout=float(os.environ.get('SUBTITLE_LIVE_IDLE_TIMEOUT', '60')),
+)
+
+
+def _prewarm_from_env():
+    # Comma-separated backends to load into the shared model registry at startup,
+    # e.g. SUBTITLE_PREWARM_MODELS=whisper,vosk
+    names = [n.strip().lower() for n in os.environ.get('SUBTITLE_PREWARM_MODELS', '').split(',') if n.strip()]
+    if not names:
         return
+    if 'all' in names:
+        names = [m for m in MODEL_OPTIONS if m != 'all']
 
-    def _put(msg_type: str, payload):
-        q.put({'type': msg_type, 'payload': payload})
+    def _log(msg):
+        print(msg)
 
-    try:
-        _put('progress', 'Job started')
-        # Call generate_subtitles with a progress callback that forwards messages
-        def cb(msg):
-            _put('progress', msg)
+    Thread(target=prewarm_models, args=(names,), kwargs={'progress_callback': _log}, daemon=True).start()
 
-        result = generate_subtitles(video_path, model_choice=model_choice, target_langs=target_langs, progress_callback=cb)
-        _put('done', result)
-    except Exception as exc:
-        _put('error', str(exc))
+
+# Prewarm when the app is set up, so gunicorn and `flask run` workers get warm models too.
+# `python app.py` runs under the debug reloader, whose watcher process imports this module as
+# __main__ but never serves; only its child (WERKZEUG_RUN_MAIN=true) should load models.
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    _prewarm_from_env()
+
+
+def _run_job_background(job, video_path: str, model_choice: str, target_langs: list, ingest=None, profile=False,
+                        preset=None):
+    # Call generate_subtitles with a progress callback that forwards messages
+    def cb(msg):
+        job.put('progress', msg)
+
+    # Newly decoded lines go out as typed 'segment' events while the backend is still running
+    def on_segments(payload):
+        job.meta.setdefault('time_to_first_segment', payload['elapsed'])
+        job.put('segment', payload)
+
+    # Stage timings (wall/CPU, memory, real-time factor) go out as typed 'span' events
+    def on_span(payload):
+        job.put('span', payload)
+
+    metrics.observe('subtitle_job_queue_wait_seconds', job.started_at - job.created_at)
+    outcome = 'error'
+    try:
+        with contextlib.ExitStack() as stack:
+            if profile:
+                path = BASE_DIR / 'output' / 'profiles' / job.id
+                stack.enter_context(pipeline_metrics.profiled(path))
+                job.meta['profile'] = os.path.relpath(str(path.with_suffix('.txt')), start=str(BASE_DIR))
+            result = generate_subtitles(video_path, model_choice=model_choice, target_langs=target_langs,
+                                        progress_callback=cb, cancel_event=job.cancel_event, segment_callback=on_segments,
+                                        span_callback=on_span, ingest=ingest, preset=preset)
+        job.meta['metrics'] = result['metrics'].get('spans')
+        outcome = 'done'
+        return result
+    except Exception:
+        if job.cancel_event.is_set():
+            outcome = 'cancelled'
+        raise
     finally:
-        # keep the queue around briefly; consumer will read final message and close
-        pass
+        metrics.inc('subtitle_jobs_total', outcome=outcome)
+        if ingest is not None:
+            ingest.close()
 
 
 @app.route('/', methods=['GET'])
@@ -56,30 +124,28 @@ def index():
     # Provide language choices as name:code mapping
     languages = list(LANG_CODE_MAP.items())
 
-    # Detect which model packages are installed so we can show availability in the UI
-    model_to_module = {
-        'whisper': 'whisper',
-        'wav2vec2': 'transformers',
-        'silero': 'torch',
-        'nemo': 'nemo',
-        'vosk': 'vosk',
-        'all': None,
-    }
-    models = []
-    for m in MODEL_OPTIONS:
-        mod = model_to_module.get(m)
-        available = True if mod is None else importlib.util.find_spec(mod) is not None
-        models.append({'name': m, 'available': available})
+    # Which backends are installed: a find_spec check per plugin, nothing is imported here
+    models = [{'name': m, 'available': m == 'all' or backend_available(m)} for m in MODEL_OPTIONS]
 
-    return render_template('index.html', models=models, languages=languages)
+    presets = [{'name': name, 'label': quantization.PRESET_LABELS[name]} for name in quantization.PRESETS]
+    return render_template('index.html', models=models, languages=languages, presets=presets,
+                           default_preset=quantization.default_preset())
 
 
 @app.route('/generate', methods=['POST'])
 def generate():
     # Support client-side chunked/resumable uploads: if client provides 'uploaded_filename',
     # use the already-uploaded file in MEDIA_DIR instead of expecting a multipart file here.
+    # An 'upload_id' whose chunks are still arriving starts the job right away: audio is
+    # decoded and transcribed from the part already received (see streaming_ingest).
     uploaded_filename = request.form.get('uploaded_filename')
-    if uploaded_filename:
+    session = uploads.get(request.form.get('upload_id') or '')
+    ingest = None
+    if session is not None and not session.complete:
+        ingest = StreamingIngest(session)
+        save_path = session.final_path
+        filename = session.filename
+    elif uploaded_filename:
         save_path = MEDIA_DIR / uploaded_filename
         if not save_path.exists():
             return jsonify({'error': 'uploaded file not found on server'}), 400
@@ -91,209 +157,402 @@ def generate():
         filename = uploaded.filename
         save_path = MEDIA_DIR / filename
         uploaded.save(str(save_path))
+        catalog.record(save_path)
 
     model_choice = request.form.get('model') or 'whisper'
     target_langs = request.form.getlist('languages') or []
+    profile = pipeline_metrics.profiling_requested(request.form.get('profile'))
+    preset = quantization.resolve_preset(request.form.get('preset'))
+    try:
+        priority = max(-10, min(10, int(request.form.get('priority') or 0)))
+    except ValueError:
+        priority = 0
 
-    # Create a background job and return job id immediately
-    job_id = uuid.uuid4().hex
-    q = Queue()
-    job_queues[job_id] = q
-
-    # start background worker thread
-    t = Thread(target=_run_job_background, args=(job_id, str(save_path), model_choice, target_langs), daemon=True)
-    t.start()
+    # Queue the job on the worker pool and return its id immediately
+    try:
+        job = scheduler.submit(
+            lambda j: _run_job_background(j, str(save_path), model_choice, target_langs, ingest, profile, preset),
+            priority=priority,
+            meta={'filename': filename, 'model': model_choice, 'preset': preset},
+        )
+    except QueueFull as exc:
+        resp = jsonify({'error': 'server busy, too many queued jobs', 'retry_after': round(exc.retry_after)})
+        resp.headers['Retry-After'] = str(max(1, int(exc.retry_after)))
+        return resp, 429
+    except SchedulerClosed:
+        return jsonify({'error': 'server is not accepting jobs'}), 503
 
-    return jsonify({'job_id': job_id})
+    return jsonify({'job_id': job.id, 'position': scheduler.position(job.id)})
 
 
 @app.route('/events/<job_id>')
 def events(job_id):
     # Server-Sent Events endpoint streaming progress for the given job
-    if job_id not in job_queues:
+    job = scheduler.get(job_id)
+    if job is None:
         return ('Job not found', 404)
 
-    q = job_queues[job_id]
-
     def gen():
-        try:
-            while True:
-                item = q.get()
-                if item is None:
-                    break
-                # Send event as JSON in data:
-                payload = json.dumps(item)
-                yield f'data: {payload}\n\n'
-                if item.get('type') in ('done', 'error'):
+        while True:
+            try:
+                item = job.events.get(timeout=15)
+            except Empty:
+                if job.finished and job.final_event is not None:
+                    # reconnecting after the job ended: replay the final state
+                    yield f'data: {json.dumps(job.final_event)}\n\n'
                     break
-        finally:
-            # cleanup queue
+                yield ': keepalive\n\n'
+                continue
+            # Send event as JSON in data:
+            payload = json.dumps(item)
+            yield f'data: {payload}\n\n'
+            if item.get('type') in ('done', 'error', 'cancelled'):
+                break
+
+    return Response(gen(), mimetype='text/event-stream')
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    info = job.to_dict()
+    info['position'] = scheduler.position(job_id)
+    return jsonify(info)
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+    if not scheduler.cancel(job_id):
+        return jsonify({'error': f'job already {job.state}'}), 409
+    return jsonify({'ok': True, 'state': job.state})
+
+
+@app.route('/api/job_stats')
+def api_job_stats():
+    return jsonify(scheduler.stats())
+
+
+@app.route('/api/model_stats')
+def api_model_stats():
+    return jsonify(model_registry.stats())
+
+
+@app.route('/api/translation_memory_stats')
+def api_translation_memory_stats():
+    return jsonify(translation_memory.stats())
+
+
+def _collect_app_metrics():
+    jobs = scheduler.stats()
+    yield 'subtitle_workers', 'gauge', 'Job worker threads.', {}, jobs['workers']
+    yield 'subtitle_jobs_running', 'gauge', 'Jobs currently running.', {}, jobs['running']
+    yield 'subtitle_jobs_pending', 'gauge', 'Jobs waiting for a worker.', {}, jobs['pending']
+    models = model_registry.stats()
+    yield 'subtitle_model_cache_hits_total', 'counter', 'Model registry lookups served warm.', {}, models['hits']
+    yield 'subtitle_model_cache_misses_total', 'counter', 'Model registry lookups that loaded a model.', {}, models['misses']
+    yield 'subtitle_model_bytes', 'gauge', 'Estimated memory of the warm models.', {}, models['total_bytes']
+    for backend, st in models['backends'].items():
+        yield 'subtitle_model_load_seconds_total', 'counter', 'Time spent loading models.', {'backend': backend}, st.get('load_seconds', 0.0)
+    yield 'subtitle_translation_memory_hits_total', 'counter', 'Lines served by the translation memory.', {}, translation_memory.hits
+    yield 'subtitle_translation_memory_misses_total', 'counter', 'Lines sent to the translation model.', {}, translation_memory.misses
+    yield 'subtitle_live_sessions', 'gauge', 'Open live caption sessions.', {}, live_captions.stats()['active']
+    yield 'subtitle_process_rss_bytes', 'gauge', 'Resident memory of the web process.', {}, pipeline_metrics.rss_bytes()
+    yield 'subtitle_process_max_rss_bytes', 'gauge', 'Peak resident memory of the web process.', {}, pipeline_metrics.max_rss_bytes()
+
+
+metrics.describe('subtitle_job_queue_wait_seconds', 'histogram', 'Time jobs spent queued before a worker picked them up.')
+metrics.describe('subtitle_jobs_total', 'counter', 'Finished jobs by outcome.')
+metrics.register_collector(_collect_app_metrics)
+
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Prometheus text exposition: stage spans from pipeline_metrics plus pool, model and cache gauges
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/live/sessions', methods=['POST'])
+def live_open():
+    data = request.get_json(silent=True) or {}
+    try:
+        sample_rate = int(data.get('sample_rate') or request.args.get('sample_rate') or 16000)
+    except ValueError:
+        return jsonify({'error': 'invalid sample_rate'}), 400
+    fmt = (data.get('format') or request.args.get('format') or 'pcm').lower()
+    try:
+        session = live_captions.open(sample_rate=sample_rate, fmt=fmt)
+    except SessionLimitReached as exc:
+        resp = jsonify({'error': 'too many live sessions', 'retry_after': round(exc.retry_after)})
+        resp.headers['Retry-After'] = str(max(1, int(exc.retry_after)))
+        return resp, 429
+    except ValueError as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        return jsonify({'error': f'recognizer unavailable: {exc}'}), 503
+    return jsonify({'session_id': session.id, 'sample_rate': session.sample_rate, 'format': session.format,
+                    'srt_path': os.path.relpath(str(session.srt_path), start=str(BASE_DIR))})
+
+
+@app.route('/live/<session_id>/audio', methods=['POST'])
+def live_audio(session_id):
+    # Body is the next piece of the stream (raw s16le PCM or Opus container bytes). A
+    # chunked request body is fed to the recognizer as it arrives.
+    session = live_captions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'session not found'}), 404
+    events = []
+    try:
+        while True:
+            block = request.stream.read(8192)
+            if not block:
+                break
+            events.extend(session.feed(block))
+    except RuntimeError as exc:
+        return jsonify({'error': str(exc)}), 409
+    return jsonify({'events': events})
+
+
+@app.route('/live/<session_id>/events')
+def live_events(session_id):
+    # SSE stream of the session's partial/final captions, for viewers other than the sender
+    session = live_captions.get(session_id)
+    if session is None:
+        return ('Session not found', 404)
+
+    def gen():
+        while True:
             try:
-                del job_queues[job_id]
-            except Exception:
-                pass
+                item = session.events.get(timeout=15)
+            except Empty:
+                if session.closed:
+                    break
+                yield ': keepalive\n\n'
+                continue
+            yield f'data: {json.dumps(item)}\n\n'
+            if item.get('type') == 'closed':
+                break
 
     return Response(gen(), mimetype='text/event-stream')
 
 
+@app.route('/live/<session_id>', methods=['GET', 'DELETE'])
+def live_session(session_id):
+    if request.method == 'DELETE':
+        events = live_captions.close(session_id)
+        if events is None:
+            return jsonify({'error': 'session not found'}), 404
+        return jsonify({'events': events})
+    session = live_captions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'session not found'}), 404
+    return jsonify(session.to_dict())
+
+
+@app.route('/api/live_stats')
+def api_live_stats():
+    return jsonify(live_captions.stats())
+
+
 @app.route('/upload_status')
 def upload_status():
     upload_id = request.args.get('upload_id')
     if not upload_id:
         return jsonify({'error': 'missing upload_id'}), 400
-    up_dir = MEDIA_DIR / 'uploads' / upload_id
-    if not up_dir.exists():
-        return jsonify({'received': []})
-    parts = []
-    for p in sorted(up_dir.iterdir()):
-        if p.name.startswith('chunk_'):
-            try:
-                idx = int(p.name.split('_',1)[1])
-                parts.append(idx)
-            except Exception:
-                continue
-    return jsonify({'received': parts})
+    session = uploads.get(upload_id)
+    if session is None:
+        return jsonify({'received': [], 'complete': False})
+    return jsonify(session.status())
+
+
+def _int_header(name, form_name=None):
+    value = request.headers.get(name) or (request.form.get(form_name) if form_name else None)
+    return int(value) if value not in (None, '') else None
 
 
 @app.route('/upload_chunk', methods=['POST'])
 def upload_chunk():
-    upload_id = request.headers.get('X-Upload-Id') or request.form.get('upload_id')
+    # Chunks may arrive in any order and in parallel; each one is written at its offset in
+    # a preallocated file (see upload_store). The body is either the raw chunk bytes or a
+    # multipart form with a 'chunk' file.
+    multipart = request.mimetype == 'multipart/form-data'
+    upload_id = request.headers.get('X-Upload-Id') or (request.form.get('upload_id') if multipart else None)
     if not upload_id:
         return jsonify({'error': 'missing upload_id header'}), 400
     try:
-        idx = int(request.headers.get('X-Chunk-Index') or request.form.get('index'))
-        total = int(request.headers.get('X-Total-Chunks') or request.form.get('total'))
-    except Exception:
+        idx = _int_header('X-Chunk-Index', 'index' if multipart else None)
+        total = _int_header('X-Total-Chunks', 'total' if multipart else None)
+        size = _int_header('X-File-Size')
+        chunk_size = _int_header('X-Chunk-Size')
+        if idx is None or total is None:
+            raise ValueError
+    except ValueError:
         return jsonify({'error': 'missing or invalid chunk metadata'}), 400
-    filename = request.headers.get('X-File-Name') or request.form.get('filename')
-    chunk = request.files.get('chunk')
-    if chunk is None:
-        return jsonify({'error': 'missing chunk file'}), 400
-    up_dir = MEDIA_DIR / 'uploads' / upload_id
-    up_dir.mkdir(parents=True, exist_ok=True)
-    chunk_name = f'chunk_{idx:06d}'
-    chunk_path = up_dir / chunk_name
-    chunk.save(str(chunk_path))
-    assembled = False
-    # If this is the last chunk, attempt to assemble
-    if idx == (total - 1):
-        final_path = MEDIA_DIR / filename
-        try:
-            with final_path.open('wb') as fw:
-                for i in range(total):
-                    part = up_dir / f'chunk_{i:06d}'
-                    if not part.exists():
-                        # missing part; abort assembly
-                        raise FileNotFoundError(f'chunk {i} missing')
-                    with part.open('rb') as fr:
-                        shutil.copyfileobj(fr, fw)
-            # cleanup
-            try:
-                shutil.rmtree(up_dir)
-            except Exception:
-                pass
-            assembled = True
-        except Exception as exc:
-            return jsonify({'error': f'assembly failed: {exc}'}), 500
-    return jsonify({'ok': True, 'assembled': assembled})
+    filename = request.headers.get('X-File-Name') or (request.form.get('filename') if multipart else None)
+    if multipart:
+        chunk = request.files.get('chunk')
+        if chunk is None:
+            return jsonify({'error': 'missing chunk file'}), 400
+        stream = chunk.stream
+    else:
+        stream = request.stream
+    try:
+        session = uploads.open(upload_id, filename, total, chunk_size=chunk_size, size=size)
+        assembled = session.write_chunk(idx, stream, sha256=request.headers.get('X-Chunk-Sha256'))
+    except ChecksumMismatch as exc:
+        return jsonify({'error': str(exc), 'retry': True}), 422
+    except UploadError as exc:
+        return jsonify({'error': str(exc)}), 400
+    if assembled:
+        uploads.forget(upload_id)
+        catalog.record(session.final_path)
+    return jsonify({'ok': True, 'assembled': assembled, 'filename': session.filename})
 
 
 @app.route('/files/<path:filename>')
 def files(filename):
-    # Serve files from project root (safe for local dev)
-    base = Path(__file__).resolve().parents[1]
-    return send_from_directory(str(base), filename, as_attachment=True)
-
-
-def _parse_srt(path: Path):
-    text = path.read_text(encoding='utf-8')
-    entries = re.split(r'\n\s*\n', text.strip())
-    segments = []
-    for ent in entries:
-        lines = ent.strip().splitlines()
-        if len(lines) < 2:
-            continue
-        # first line may be index, second time
-        time_line = None
-        if '-->' in lines[1]:
-            time_line = lines[1]
-            body = '\n'.join(lines[2:])
-        else:
-            # sometimes index line omitted
-            time_line = lines[0]
-            body = '\n'.join(lines[1:])
+    # Downloads from the project root (safe for local dev); ranges and revalidation work here too
+    full = safe_join(str(BASE_DIR), filename)
+    if full is None:
+        return jsonify({'error': 'file not found'}), 404
+    return send_media(request, Path(full), download=True)
+
+
+MEDIA_ROOTS = ('media', 'output')
+
+
+def media_url(rel: str, **params) -> str:
+    # ?v=<etag> makes the URL change with the file, so the response can be cached for good
+    query = {'v': file_etag((BASE_DIR / rel).stat()), **params}
+    return '/media/' + quote(rel) + '?' + urlencode(query)
+
+
+@app.route('/media/<path:filename>')
+def media(filename):
+    # Inline playback of videos, audio and outputs: Range/206, ETags, ?download=1, ?proxy=1
+    full = safe_join(str(BASE_DIR), filename)
+    if full is None or Path(filename).parts[0] not in MEDIA_ROOTS or not os.path.isfile(full):
+        return jsonify({'error': 'file not found'}), 404
+    full = Path(full)
+    codec = proxy_codec() if request.args.get('proxy') == '1' else None
+    version = request.args.get('v')
+    # a proxy URL is versioned by its source; the proxy itself may still be rebuilt, so it revalidates
+    immutable = not codec and version is not None and version == file_etag(full.stat())
+    if codec:
+        # proxies of source videos go to the video's audio folder, not into media/
+        target_dir = BASE_DIR / 'output' / full.stem / 'audio' if Path(filename).parts[0] == 'media' else None
         try:
-            start_s, end_s = [s.strip() for s in time_line.split('-->')]
-            def to_secs(ts):
-                # format 00:00:01,234
-                h,m,s = ts.strip().split(':')
-                s,ms = s.split(',') if ',' in s else (s, '0')
-                return int(h)*3600 + int(m)*60 + float(s) + float(ms)/1000.0
-            start = to_secs(start_s)
-            end = to_secs(end_s)
-            segments.append({'start': start, 'end': end, 'text': body.strip()})
-        except Exception:
-            continue
-    return segments
-
-
-def _format_srt_timestamp(seconds: float) -> str:
-    td = timedelta(seconds=seconds)
-    total_seconds = int(td.total_seconds())
-    ms = int((td.total_seconds() - total_seconds) * 1000)
-    h = total_seconds // 3600
-    m = (total_seconds % 3600) // 60
-    s = total_seconds % 60
-    return f"{h:02}:{m:02}:{s:02},{ms:03}"
-
-
-def _write_srt(path: Path, segments: list):
-    lines = []
-    for idx, seg in enumerate(segments, start=1):
-        start = seg.get('start')
-        end = seg.get('end')
-        # if string timestamps provided, keep them; else format
-        if isinstance(start, str):
-            start_ts = start
-        else:
-            start_ts = _format_srt_timestamp(float(start))
-        if isinstance(end, str):
-            end_ts = end
-        else:
-            end_ts = _format_srt_timestamp(float(end))
-        text = seg.get('text', '')
-        lines.append(str(idx))
-        lines.append(f"{start_ts} --> {end_ts}")
-        lines.append(text)
-        lines.append('')
-    path.write_text('\n'.join(lines).strip() + '\n', encoding='utf-8')
+            full = audio_proxy(full, codec, target_dir=target_dir)
+        except Exception as exc:
+            print(f'Warning: audio proxy failed, serving the original: {exc}')
+    return send_media(request, full, download=request.args.get('download') == '1', immutable=immutable)
 
 
 @app.route('/editor')
 def editor():
     # optional query param file path relative to project root
     srt = request.args.get('file')
-    # build list of available srt files under output/
-    files = []
-    out_dir = BASE_DIR / 'output'
-    for root, dirs, filenames in os.walk(out_dir):
-        for fn in filenames:
-            if fn.lower().endswith('.srt'):
-                rel = os.path.relpath(os.path.join(root, fn), start=str(BASE_DIR))
-                files.append(rel)
+    files = [item['path'] for item in catalog.query('srt', limit=200)['items']]
     return render_template('editor.html', srt=srt, srt_files=files)
 
 
+def _page_args():
+    return {'limit': request.args.get('limit', 200, type=int), 'offset': request.args.get('offset', 0, type=int)}
+
+
 @app.route('/api/srt_list')
 def api_srt_list():
-    out_dir = BASE_DIR / 'output'
-    files = []
-    for root, dirs, filenames in os.walk(out_dir):
-        for fn in filenames:
-            if fn.lower().endswith('.srt'):
-                rel = os.path.relpath(os.path.join(root, fn), start=str(BASE_DIR))
-                files.append(rel)
-    return jsonify({'files': files})
+    # paginated and filterable: ?video=&model=&lang=(code|none)&q=&limit=&offset=
+    page = catalog.query(request.args.get('kind', 'srt'), video=request.args.get('video'),
+                         model=request.args.get('model'), lang=request.args.get('lang'),
+                         q=request.args.get('q'), **_page_args())
+    page['files'] = [item['path'] for item in page['items']]
+    return jsonify(page)
+
+
+@app.route('/api/videos')
+def api_videos():
+    return jsonify(catalog.videos(q=request.args.get('q'), **_page_args()))
+
+
+@app.route('/api/catalog_stats')
+def api_catalog_stats():
+    return jsonify(catalog.stats())
+
+
+@app.route('/api/catalog/rescan', methods=['POST'])
+def api_catalog_rescan():
+    return jsonify(catalog.rescan())
+
+
+def _video_name(srt_path: Path):
+    # expect output/<video>/srt/<file>.srt
+    return srt_path.parent.parent.name if srt_path.parent.name == 'srt' else None
+
+
+# videos whose editor WAV is being written in the background, and those where that failed:
+# {video: (monotonic time, source mtime, error)}
+_editor_audio_pending = set()
+_editor_audio_failed = {}
+_editor_audio_lock = Lock()
+# a failed extraction is retried after this long, or as soon as the source file changes
+EDITOR_AUDIO_RETRY_S = 300.0
+
+
+def _source_mtime(source: Path):
+    try:
+        return source.stat().st_mtime
+    except OSError:
+        return None
+
+
+def _extract_editor_audio(video_name: str, source: Path, audio_dir: Path):
+    """Write the editor's WAV off the request thread.
+
+    Returns `(pending, error)`: whether it is (now) in progress, and why the last attempt
+    failed while that failure still stands.
+    """
+    mtime = _source_mtime(source)
+    with _editor_audio_lock:
+        failed = _editor_audio_failed.get(video_name)
+        if failed is not None:
+            failed_at, failed_mtime, error = failed
+            if failed_mtime == mtime and time.monotonic() - failed_at < EDITOR_AUDIO_RETRY_S:
+                return False, error
+            del _editor_audio_failed[video_name]
+        if video_name in _editor_audio_pending:
+            return True, None
+        _editor_audio_pending.add(video_name)
+
+    def _run():
+        try:
+            catalog.record(extract_audio_ffmpeg(source, audio_dir))
+        except Exception as exc:
+            print(f'Editor audio for {video_name} failed: {exc}')
+            with _editor_audio_lock:
+                _editor_audio_failed[video_name] = (time.monotonic(), mtime, str(exc))
+        finally:
+            with _editor_audio_lock:
+                _editor_audio_pending.discard(video_name)
+
+    Thread(target=_run, daemon=True).start()
+    return True, None
+
+
+def _srt_file(path: str):
+    """`path` as an SRT under `output/`, or None if it lies outside the project or is anything else."""
+    full = safe_join(str(BASE_DIR), path) if path else None
+    if full is None:
+        return None
+    rel = catalog.relative(full)
+    info = classify(rel) if rel else None
+    if info is None or info['kind'] != 'srt':
+        return None
+    return Path(full)
 
 
 @app.route('/api/segments')
@@ -301,48 +560,108 @@ def api_segments():
     path = request.args.get('path')
     if not path:
         return jsonify({'error': 'missing path'}), 400
-    full = BASE_DIR / path
-    if not full.exists():
+    full = _srt_file(path)
+    if full is None or not full.exists():
         return jsonify({'error': 'file not found'}), 404
-    segments = _parse_srt(full)
-    # try to find an audio file in sibling audio folder
-    audio_rel = None
-    try:
-        srt_parent = full.parent
-        # expect output/<video>/srt/<file>.srt -> audio in output/<video>/audio
-        grand = srt_parent.parent
-        audio_dir = grand / 'audio'
-        if audio_dir.exists():
-            matches = list(audio_dir.glob('*.wav'))
-            if matches:
-                audio_rel = os.path.relpath(str(matches[0]), start=str(BASE_DIR))
-    except Exception:
-        audio_rel = None
-    
-    # Try to find original video in media folder
+    rev, records = journals.get(full).current()
+    # the catalog knows the video's media and audio files
+    video_name = _video_name(full)
     video_rel = None
+    audio_rel = None
+    audio_pending = False
+    audio_error = None
     try:
-        media_dir = BASE_DIR / 'media'
-        if media_dir.exists():
-            # try to find a video that matches the srt stem first
-            stem = full.stem.rsplit('_', 1)[0] if '_' in full.stem else full.stem
-            for ext in ['.mp4', '.webm', '.mov', '.mkv', '.avi']:
-                candidate = media_dir / f"{stem}{ext}"
-                if candidate.exists():
-                    video_rel = os.path.relpath(str(candidate), start=str(BASE_DIR))
-                    break
+        if video_name:
+            video_rel = catalog.first('video', video=video_name)
+        if video_rel is None:
             # fallback: first available video
-            if video_rel is None:
-                for ext in ['*.mp4', '*.webm', '*.mov', '*.mkv', '*.avi']:
-                    matches = list(media_dir.glob(ext))
-                    if matches:
-                        video_rel = os.path.relpath(str(matches[0]), start=str(BASE_DIR))
-                        break
+            video_rel = catalog.first('video')
     except Exception:
         video_rel = None
-    
-    duration = segments[-1]['end'] if segments else 0
-    return jsonify({'segments': segments, 'audio': audio_rel, 'video': video_rel, 'duration': duration})
+    try:
+        if video_name:
+            audio_rel = catalog.first('audio', video=video_name)
+            if audio_rel is None and proxy_codec() and catalog.first('video', video=video_name):
+                # the proxy is transcoded straight from the video; no need for a full WAV
+                audio_rel = catalog.first('video', video=video_name)
+            elif audio_rel is None:
+                # in-memory extraction skips the WAV; write it the first time the editor needs it,
+                # in the background (minutes for a long video) while the editor polls for it
+                source = catalog.first('video', video=video_name)
+                if source is not None:
+                    audio_pending, audio_error = _extract_editor_audio(video_name, BASE_DIR / source, full.parent.parent / 'audio')
+    except Exception:
+        audio_rel = None
+
+    duration = records[-1]['end'] if records else 0.0
+    urls = {}
+    try:
+        if video_rel:
+            urls['video_url'] = media_url(video_rel)
+        if audio_rel:
+            urls['audio_url'] = media_url(audio_rel, proxy=1) if proxy_codec() else media_url(audio_rel)
+    except OSError:
+        pass
+    return jsonify({'segments': records, 'rev': rev, 'audio': audio_rel, 'audio_pending': audio_pending,
+                    'audio_error': audio_error, 'video': video_rel, 'duration': duration, **urls})
+
+
+@app.route('/api/waveform')
+def api_waveform():
+    # min/max peaks of one zoom level inside [start, end): ?path=<srt>&start=&end=&width=<pixels> (or &level=)
+    path = request.args.get('path')
+    if not path:
+        return jsonify({'error': 'missing path'}), 400
+    full = BASE_DIR / path
+    video_name = _video_name(full)
+    if not full.exists() or not video_name:
+        return jsonify({'error': 'file not found'}), 404
+    sidecar = peaks_path(full.parent.parent / 'audio', video_name)
+    try:
+        if not sidecar.exists():
+            # jobs served from the result cache never extracted audio; build from the editor's WAV
+            wav = catalog.first('audio', video=video_name)
+            if wav is None:
+                return jsonify({'error': 'no waveform for this file'}), 404
+            ensure_peaks(BASE_DIR / wav, sidecar)
+        peaks = PeakFile(sidecar)
+    except Exception as exc:
+        return jsonify({'error': f'waveform unavailable: {exc}'}), 500
+    start = max(0.0, request.args.get('start', 0.0, type=float))
+    end = request.args.get('end', peaks.duration, type=float)
+    level = request.args.get('level', type=int)
+    if level is None:
+        level = peaks.level_for(start, end, max(1, request.args.get('width', 1000, type=int)))
+    level = max(0, min(level, peaks.levels - 1))
+    first, data = peaks.window(level, start, end)
+    seconds_per_peak = peaks.samples_per_peak(level) / float(peaks.sample_rate)
+    info = {'level': level, 'levels': peaks.levels, 'seconds_per_peak': seconds_per_peak,
+            'start': first * seconds_per_peak, 'count': len(data) // 2, 'duration': peaks.duration}
+    if request.args.get('format') == 'binary':
+        # raw int8 (min, max) pairs; the rest travels in headers
+        resp = Response(data.tobytes(), mimetype='application/octet-stream')
+        for key, value in info.items():
+            resp.headers[f'X-Waveform-{key.replace("_", "-").title()}'] = str(value)
+        return resp
+    return jsonify({**info, 'peaks': data.tolist()})
+
+
+@app.route('/api/export')
+def api_export():
+    # Download an SRT converted to another format (srt, vtt or json)
+    path = request.args.get('path')
+    fmt = (request.args.get('format') or 'vtt').lower()
+    if not path:
+        return jsonify({'error': 'missing path'}), 400
+    if fmt not in SUBTITLE_FORMATS:
+        return jsonify({'error': f'unsupported format: {fmt}'}), 400
+    full = _srt_file(path)
+    if full is None or not full.exists():
+        return jsonify({'error': 'file not found'}), 404
+    target = sibling_paths(full, [fmt])[fmt]
+    if fmt != 'srt' and (not target.exists() or target.stat().st_mtime < full.stat().st_mtime):
+        write_subtitles(read_srt(full), {fmt: target})
+    return send_media(request, target, download=True)
 
 
 @app.route('/api/backups')
@@ -350,71 +669,89 @@ def api_backups():
     path = request.args.get('path')
     if not path:
         return jsonify({'error': 'missing path'}), 400
-    full = BASE_DIR / path
-    if not full.exists():
+    full = _srt_file(path)
+    if full is None or not full.exists():
         return jsonify({'error': 'file not found'}), 404
-    # list backups in same directory named like <orig>.bak.*
-    base = full.parent
-    prefix = full.name + '.bak.'
-    backups = []
-    for fn in sorted(os.listdir(base), reverse=True):
-        if fn.startswith(prefix):
-            backups.append(fn)
-    return jsonify({'backups': backups})
+    journal = journals.get(full)
+    revisions = journal.history()
+    # full copies from before the edit journal existed (<orig>.bak.*) can still be restored
+    rel = catalog.relative(full)
+    page = catalog.query('backup', source=rel, limit=200, newest_first=True) if rel else {'items': []}
+    backups = [Path(item['path']).name for item in page['items']]
+    return jsonify({'rev': journal.rev, 'revisions': revisions, 'backups': backups})
 
 
 @app.route('/api/restore', methods=['POST'])
 def api_restore():
     data = request.get_json()
     path = data.get('path')
+    rev = data.get('rev')
     backup = data.get('backup')
-    if not path or not backup:
+    if not path or (rev is None and not backup):
         return jsonify({'error': 'missing fields'}), 400
-    full = BASE_DIR / path
-    bak = full.parent / backup
-    if not full.exists() or not bak.exists():
+    full = _srt_file(path)
+    if full is None or not full.exists():
         return jsonify({'error': 'file not found'}), 404
+    journal = journals.get(full)
     try:
-        # create a safety copy of current before restore
-        try:
-            safename = f"{full.name}.bak.before_restore.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            shutil.copy2(str(full), str(full.parent / safename))
-        except Exception:
-            pass
-        shutil.copy2(str(bak), str(full))
-        return jsonify({'ok': True})
+        if rev is not None:
+            result = journal.restore(rev)
+        else:
+            bak = full.parent / Path(backup).name
+            if not bak.exists():
+                return jsonify({'error': 'file not found'}), 404
+            result = journal.restore_segments(read_srt(bak), source=bak.name)
+        return jsonify({'ok': True, 'rev': result['rev']})
+    except (KeyError, ValueError):
+        return jsonify({'error': f'revision {rev} is no longer in the history'}), 404
     except Exception as exc:
         return jsonify({'error': str(exc)}), 500
 
 
+def _conflict_response(exc: EditConflict):
+    return jsonify({'error': str(exc), 'conflict': True, 'rev': exc.rev, 'ids': exc.ids}), 409
+
+
+@app.route('/api/patch_segments', methods=['POST'])
+def api_patch_segments():
+    # only the changed cues: {path, base_rev, ops: [{op: update|insert|delete, ...}]} (see edit_journal)
+    data = request.get_json()
+    path = data.get('path')
+    ops = data.get('ops')
+    if not path or not isinstance(ops, list):
+        return jsonify({'error': 'missing fields'}), 400
+    full = _srt_file(path)
+    if full is None or not full.exists():
+        return jsonify({'error': 'file not found'}), 404
+    try:
+        result = journals.get(full).patch(ops, data.get('base_rev'))
+    except EditConflict as exc:
+        return _conflict_response(exc)
+    except (ValueError, TypeError) as exc:
+        return jsonify({'error': str(exc)}), 400
+    except Exception as exc:
+        return jsonify({'error': str(exc)}), 500
+    return jsonify({'ok': True, **result})
+
+
 @app.route('/api/save_segments', methods=['POST'])
 def api_save_segments():
+    # whole-list save; the journal only records the cues that differ from the current file
     data = request.get_json()
     path = data.get('path')
     segments = data.get('segments')
     if not path or segments is None:
         return jsonify({'error': 'missing fields'}), 400
-    full = BASE_DIR / path
-    if not full.exists():
+    full = _srt_file(path)
+    if full is None or not full.exists():
         return jsonify({'error': 'file not found'}), 404
-    # write srt
     try:
-        # create a timestamped backup before overwriting
-        try:
-            bak_name = f"{full.name}.bak.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            bak_path = full.parent / bak_name
-            shutil.copy2(str(full), str(bak_path))
-        except Exception as e:
-            # if backup fails, log but continue
-            print(f"Warning: failed to create backup: {e}")
-        # convert segments start/end strings if necessary
-        cleaned = []
-        for s in segments:
-            cleaned.append({'start': s['start'], 'end': s['end'], 'text': s.get('text', '')})
-        _write_srt(full, cleaned)
-        return jsonify({'ok': True})
+        result = journals.get(full).save(segments, data.get('base_rev'))
+    except EditConflict as exc:
+        return _conflict_response(exc)
     except Exception as exc:
         return jsonify({'error': str(exc)}), 500
+    return jsonify({'ok': True, **result})
 
 
 if __name__ == '__main__':
@@ -436,6 +436,9 @@ document.addEventListener('DOMContentLoaded', function(){
   const minimalView = document.getElementById('minimalView');
   const fullCard = document.getElementById('fullCard');
   const uploadedFilenameInput = document.getElementById('uploaded_filename');
+  // set while a chunked upload is in flight, so generation can start before it finishes
+  const uploadIdInput = document.getElementById('upload_id');
+  let uploadingFilename = '';
   const videoPlayerMain = document.getElementById('videoPlayerMain');
   const videoPlayerContainer = document.getElementById('videoPlayerContainer');
   const spinnerWrap = document.getElementById('spinnerWrap');
@@ -450,7 +453,7 @@ document.addEventListener('DOMContentLoaded', function(){
       submitBtn.addEventListener('click', () => {
         try{
           console.log('submitBtn clicked', { disabled: submitBtn.disabled, uploaded_filename: (uploadedFilenameInput ? uploadedFilenameInput.value : null) });
-          if(!uploadedFilenameInput || !uploadedFilenameInput.value){
+          if((!uploadedFilenameInput || !uploadedFilenameInput.value) && !(uploadIdInput && uploadIdInput.value)){
             appendLog('Please upload a video before generating. Click the Upload button or drag a file onto the page.');
           }
         }catch(e){ console.warn('submitBtn click handler failed', e); }
@@ -511,6 +514,7 @@ document.addEventListener('DOMContentLoaded', function(){
 
     // Reset previous state
     uploadedFilenameInput.value = '';
+    if(uploadIdInput) uploadIdInput.value = '';
 
     // Local preview
     if(videoPlayerMain) {
@@ -522,10 +526,13 @@ document.addEventListener('DOMContentLoaded', function(){
     }
 
     const CHUNK_SIZE = 5 * 1024 * 1024;
-    const total = Math.ceil(file.size / CHUNK_SIZE);
-    const uploadKey = 'upload-id:' + file.name;
+    const PARALLEL_CHUNKS = 4;
+    const total = Math.max(1, Math.ceil(file.size / CHUNK_SIZE));
+    const uploadKey = 'upload-id:' + file.name + ':' + file.size;
     let uploadId = localStorage.getItem(uploadKey) || crypto.randomUUID();
     localStorage.setItem(uploadKey, uploadId);
+    if(uploadIdInput) uploadIdInput.value = uploadId;
+    uploadingFilename = file.name;
 
     // Ask server which chunks it already has (resume support)
     let received = [];
@@ -539,49 +546,69 @@ document.addEventListener('DOMContentLoaded', function(){
       console.warn('Upload status check failed; continuing without resume', e);
     }
 
-    let uploadedChunks = received.length;
-    let assembled = false;
-    for(let i = 0; i < total; i++) {
-      if(received.includes(i)) continue; // already on server
+    async function sha256Hex(buf) {
+      // crypto.subtle only exists on secure origins; the server then skips verification
+      if(!(window.crypto && crypto.subtle)) return null;
+      const digest = await crypto.subtle.digest('SHA-256', buf);
+      return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
 
+    async function sendChunk(i) {
       const start = i * CHUNK_SIZE;
       const end = Math.min((i + 1) * CHUNK_SIZE, file.size);
-      const chunk = file.slice(start, end);
-      const formData = new FormData();
-      formData.append('chunk', chunk, `${file.name}.part${i}`);
-      formData.append('index', i);
-      formData.append('total', total);
-      formData.append('upload_id', uploadId);
-      formData.append('filename', file.name);
-
-      try {
-        const res = await fetch(`${API_BASE_URL}/upload_chunk`, {
-          method: 'POST',
-          headers: {
-            'X-Upload-Id': uploadId,
-            'X-Chunk-Index': i,
-            'X-Total-Chunks': total,
-            'X-File-Name': file.name
-          },
-          body: formData
-        });
-        if(!res.ok) throw new Error('Chunk upload failed');
+      const body = await file.slice(start, end).arrayBuffer();
+      const headers = {
+        'Content-Type': 'application/octet-stream',
+        'X-Upload-Id': uploadId,
+        'X-Chunk-Index': i,
+        'X-Total-Chunks': total,
+        'X-Chunk-Size': CHUNK_SIZE,
+        'X-File-Size': file.size,
+        'X-File-Name': file.name
+      };
+      const digest = await sha256Hex(body);
+      if(digest) headers['X-Chunk-Sha256'] = digest;
+      for(let attempt = 0; ; attempt++) {
+        const res = await fetch(`${API_BASE_URL}/upload_chunk`, { method: 'POST', headers, body });
         const j = await res.json().catch(() => ({}));
-        uploadedChunks++;
-        assembled = assembled || !!j.assembled;
-      } catch(e) {
-        console.error('Upload error:', e);
-        break;
+        if(res.ok) return !!j.assembled;
+        // 422 = checksum mismatch; anything else is retried the same way a couple of times
+        if(attempt >= 2) throw new Error(j.error || 'Chunk upload failed');
       }
     }
 
-    // The server assembles on the final chunk, so mark assembled if all parts arrived
-    if(uploadedChunks === total) assembled = true;
+    // Chunks go out PARALLEL_CHUNKS at a time, in any order; the server writes each at its offset
+    const pending = [];
+    for(let i = 0; i < total; i++) if(!received.includes(i)) pending.push(i);
+    let assembled = false;
+    let failed = false;
+    async function worker() {
+      while(pending.length && !failed) {
+        const i = pending.shift();
+        try {
+          assembled = (await sendChunk(i)) || assembled;
+        } catch(e) {
+          console.error('Upload error:', e);
+          failed = true;
+        }
+      }
+    }
+    await Promise.all(Array.from({ length: Math.min(PARALLEL_CHUNKS, pending.length) }, worker));
+    if(!pending.length && !failed && !assembled) {
+      // every chunk was already on the server (resumed upload); confirm it completed
+      try {
+        const statusResp = await fetch(`${API_BASE_URL}/upload_status?upload_id=${encodeURIComponent(uploadId)}`);
+        const statusJson = await statusResp.json();
+        assembled = !!statusJson.complete || received.length === total;
+      } catch(e) {}
+    }
+    if(assembled) localStorage.removeItem(uploadKey);
 
+    if(uploadIdInput && uploadIdInput.value === uploadId) uploadIdInput.value = '';
     if(assembled) {
       uploadedFilenameInput.value = file.name;
       if(videoPlayerMain){
-        videoPlayerMain.src = `${API_BASE_URL}/files/media/${file.name}`;
+        videoPlayerMain.src = `${API_BASE_URL}/media/media/${encodeURIComponent(file.name)}`;
         try{ videoPlayerMain.load(); }catch(e){}
       }
     } else {
@@ -775,16 +802,66 @@ document.addEventListener('DOMContentLoaded', function(){
     if(currentEventSource){ currentEventSource.close(); currentEventSource = null; }
   }
 
+  // segments streamed by the backend while it is still transcribing, keyed by model
+  let streamedSegments = {};
+  let liveModel = null;
+
+  function formatClock(seconds){
+    const s = Math.max(0, Math.floor(seconds || 0));
+    const m = Math.floor(s / 60);
+    return `${String(m).padStart(2,'0')}:${String(s % 60).padStart(2,'0')}`;
+  }
+
+  function handleSegments(payload){
+    if(!payload || !Array.isArray(payload.segments)) return;
+    const model = payload.model || 'model';
+    const list = streamedSegments[model] || (streamedSegments[model] = []);
+    payload.segments.forEach((seg, i) => { list[(payload.index || 0) + i] = seg; });
+    if(liveModel === null) liveModel = model;
+    if(model !== liveModel) return;
+    payload.segments.forEach(seg => appendLog(`[${formatClock(seg.start)}] ${seg.text}`));
+    setStatus(`Transcribing... ${list.length} lines`);
+    updateProgressStep('transcribing');
+    // show the progressive transcript on the preview video
+    interimSegments = list.filter(Boolean);
+    updateMainVideoSubtitle();
+  }
+
+  // Stage timings; the small bookkeeping spans are left out of the log
+  const LOGGED_SPANS = ['extract', 'model_load', 'asr', 'translate', 'job'];
+  function handleSpan(payload){
+    if(!payload || !LOGGED_SPANS.includes(payload.stage)) return;
+    const who = payload.backend ? ` (${payload.backend})` : (payload.lang ? ` (${payload.lang})` : '');
+    const parts = [`${payload.wall_s.toFixed(1)}s`];
+    if(payload.rtf != null) parts.push(`RTF ${payload.rtf.toFixed(2)}`);
+    if(payload.max_rss_mb != null) parts.push(`peak ${Math.round(payload.max_rss_mb)} MB`);
+    if(payload.outcome && payload.outcome !== 'ok') parts.push(payload.outcome);
+    appendLog(`⏱ ${payload.stage}${who}: ${parts.join(', ')}`);
+  }
+
+  function handleQueued(payload){
+    if(!payload) return;
+    const eta = payload.eta ? ` (~${Math.round(payload.eta)}s)` : '';
+    setStatus(`Queued: position ${payload.position}${eta}`);
+    appendLog(`Waiting in queue, position ${payload.position}${eta}`);
+  }
+
   function startProgressStream(jobId){
     if(currentEventSource){ currentEventSource.close(); }
     currentEventSource = new EventSource(`${API_BASE_URL}/events/${jobId}`);
+    streamedSegments = {};
+    liveModel = null;
     currentEventSource.onmessage = ev => {
       let data;
       try { data = JSON.parse(ev.data); } catch(e){ return; }
       if(!data) return;
       if(data.type === 'progress') handleProgressMessage(data.payload);
+      else if(data.type === 'segment') handleSegments(data.payload);
+      else if(data.type === 'span') handleSpan(data.payload);
+      else if(data.type === 'queued') handleQueued(data.payload);
       else if(data.type === 'done') handleDone(data.payload);
       else if(data.type === 'error') handleError(data.payload);
+      else if(data.type === 'cancelled') handleError(data.payload || 'Job cancelled');
     };
     currentEventSource.onerror = () => {
       appendLog('Connection lost. You may need to retry.');
@@ -798,7 +875,7 @@ document.addEventListener('DOMContentLoaded', function(){
   if(form) {
     form.addEventListener('submit', async ev => {
       ev.preventDefault();
-      if(!uploadedFilenameInput.value){
+      if(!uploadedFilenameInput.value && !(uploadIdInput && uploadIdInput.value)){
         appendLog('Please upload a video before generating.');
         return;
       }
@@ -817,11 +894,18 @@ document.addEventListener('DOMContentLoaded', function(){
       const fd = new FormData();
       const modelInput = form.querySelector('input[name="model"]');
       fd.append('model', modelInput ? modelInput.value : 'whisper');
+      const presetSelect = form.querySelector('select[name="preset"]');
+      if(presetSelect) fd.append('preset', presetSelect.value);
       // If the resumable upload assembled file on the server, send its name.
       // Otherwise, if the user selected a local file but didn't finish chunked upload,
       // include the file directly so the server can receive it in this request.
       if(uploadedFilenameInput && uploadedFilenameInput.value){
         fd.append('uploaded_filename', uploadedFilenameInput.value);
+      } else if(uploadIdInput && uploadIdInput.value){
+        // still uploading: the server transcribes the part it already has
+        fd.append('upload_id', uploadIdInput.value);
+        fd.append('uploaded_filename', uploadingFilename);
+        appendLog('Upload still in progress; transcription starts on the part already received.');
       } else if(videoFileInput && videoFileInput.files && videoFileInput.files.length){
         // Attach the raw file so the server will receive and process it immediately.
         fd.append('video', videoFileInput.files[0]);
@@ -60,6 +60,7 @@ document.addEventListener('DOMContentLoaded', function(){
   const saveBtn = document.getElementById('saveBtn');
   let cachedList = [];
   let nativeCaptionTrack = null;
+  let loadedPath = null;
 
   // Fetch list of available srt files
   async function fetchSrtList(){
@@ -92,26 +93,54 @@ document.addEventListener('DOMContentLoaded', function(){
       }
     }
     if(!path) return;
+    loadedPath = path;
     const resp = await fetch('/api/segments?path=' + encodeURIComponent(path));
     if(!resp.ok){ alert('Failed to load segments'); return; }
     const j = await resp.json();
     currentSegments = j.segments || [];
+    currentRev = j.rev || 0;
+    savedSegments = JSON.parse(JSON.stringify(currentSegments));
     // initialize undo stack with original state
     undoStack.length = 0; pushUndo();
     duration = j.duration || (currentSegments.length? currentSegments[currentSegments.length-1].end : 0);
     if(j.audio) {
-      audio.src = '/files/' + encodeURIComponent(j.audio);
+      audio.src = j.audio_url || ('/files/' + encodeURIComponent(j.audio));
       audio.style.display = 'block';
+    } else if(j.audio_pending) {
+      waitForAudio(path);
+    } else if(j.audio_error) {
+      alert('Audio unavailable: ' + j.audio_error);
     }
     if(videoPlayerMain) {
       if(j.video) {
-        videoPlayerMain.src = '/files/' + encodeURIComponent(j.video);
+        videoPlayerMain.src = j.video_url || ('/files/' + encodeURIComponent(j.video));
       }
       try{ videoPlayerMain.load(); }catch(e){}
       populateNativeCaptions(currentSegments);
     }
     renderTimeline(); renderSegmentsList();
     if(videoPlayerMain) updateVideoSubtitle();
+    loadWaveform(path);
+  }
+
+  // the server writes the WAV in the background the first time; poll until it is there
+  function waitForAudio(forPath){
+    setTimeout(async () => {
+      if(forPath !== loadedPath) return;
+      try{
+        const resp = await fetch('/api/segments?path=' + encodeURIComponent(forPath));
+        const j = resp.ok ? await resp.json() : null;
+        if(!j || forPath !== loadedPath) return;
+        if(j.audio){
+          audio.src = j.audio_url || ('/files/' + encodeURIComponent(j.audio));
+          audio.style.display = 'block';
+        } else if(j.audio_pending) {
+          waitForAudio(forPath);
+        } else if(j.audio_error) {
+          alert('Audio unavailable: ' + j.audio_error);
+        }
+      }catch(e){}
+    }, 3000);
   }
 
   function toSeconds(ts){
@@ -124,6 +153,8 @@ document.addEventListener('DOMContentLoaded', function(){
   }
 
   let currentSegments = [];
+  let savedSegments = []; // as last loaded/saved, to send only what changed
+  let currentRev = 0;
   let duration = 0;
   const undoStack = [];
 
@@ -200,8 +231,40 @@ document.addEventListener('DOMContentLoaded', function(){
     try{ undoStack.push(JSON.parse(JSON.stringify(currentSegments))); if(undoStack.length>50) undoStack.shift(); }catch(e){}
   }
 
+  // waveform peaks for the timeline background, one request sized to the timeline's pixel width
+  let waveform = null;
+  async function loadWaveform(path){
+    waveform = null;
+    const width = Math.max(200, Math.round((timeline.clientWidth || 800) * (window.devicePixelRatio || 1)));
+    try{
+      const resp = await fetch('/api/waveform?path=' + encodeURIComponent(path) + '&width=' + width);
+      if(resp.ok) waveform = await resp.json();
+    }catch(e){}
+    if(waveform) renderTimeline();
+  }
+
+  function drawWaveform(){
+    if(!waveform || !duration) return;
+    const dpr = window.devicePixelRatio || 1;
+    const canvas = document.createElement('canvas'); canvas.className = 'waveform';
+    canvas.width = Math.max(1, Math.round(timeline.clientWidth * dpr));
+    canvas.height = Math.max(1, Math.round(timeline.clientHeight * dpr));
+    const ctx = canvas.getContext('2d');
+    ctx.fillStyle = 'rgba(255,255,255,0.28)';
+    const peaks = waveform.peaks, step = waveform.seconds_per_peak, mid = canvas.height / 2, scale = mid / 128;
+    const pxPerSecond = canvas.width / duration;
+    for(let i = 0; i < peaks.length / 2; i++){
+      const x = (waveform.start + i * step) * pxPerSecond;
+      if(x > canvas.width) break;
+      const lo = peaks[2*i], hi = peaks[2*i+1];
+      ctx.fillRect(x, mid - (hi + 1) * scale, Math.max(1, step * pxPerSecond), Math.max(1, (hi - lo + 1) * scale));
+    }
+    timeline.appendChild(canvas);
+  }
+
   function renderTimeline(){
     timeline.innerHTML = '';
+    drawWaveform();
     assignColors();
     currentSegments.forEach((seg, idx)=>{
       const left = (seg.start / duration) * 100;
@@ -449,6 +512,30 @@ document.addEventListener('DOMContentLoaded', function(){
     await loadSelectedSrt();
   });
 
+  // only changed cues are sent: updates by id, inserts anchored after the previous cue, deletes by id
+  function buildPatch(segs){
+    const saved = new Map(savedSegments.map(s=>[s.id, s]));
+    const ops = []; const kept = new Set(); const inserted = [];
+    let prev = null;
+    segs.forEach((seg, i)=>{
+      const old = seg.id != null ? saved.get(seg.id) : null;
+      if(old){
+        const op = {op: 'update', id: seg.id};
+        if(Math.abs(old.start - seg.start) > 0.0005) op.start = seg.start;
+        if(Math.abs(old.end - seg.end) > 0.0005) op.end = seg.end;
+        if(old.text !== seg.text) op.text = seg.text;
+        if(Object.keys(op).length > 2) ops.push(op);
+        kept.add(seg.id); prev = seg.id;
+      } else {
+        const tmp = 'n' + i;
+        ops.push({op: 'insert', tmp: tmp, after: prev, start: seg.start, end: seg.end, text: seg.text});
+        inserted.push([i, tmp]); prev = tmp;
+      }
+    });
+    savedSegments.forEach(s=>{ if(!kept.has(s.id)) ops.push({op: 'delete', id: s.id}); });
+    return {ops, inserted};
+  }
+
   saveBtn.addEventListener('click', async ()=>{
     const path = srtSelect.value;
     if(!path) return;
@@ -456,15 +543,48 @@ document.addEventListener('DOMContentLoaded', function(){
     const rows = document.querySelectorAll('.segment-row');
     const out = [];
     rows.forEach((r, idx)=>{
-      const start = r.querySelector('input:nth-child(1)').value;
-      const end = r.querySelector('input:nth-child(2)').value;
-      const text = r.querySelector('textarea').value;
-      out.push({start: start, end: end, text: text});
+      const start = toSeconds(r.querySelector('input:nth-child(1)').value);
+      const end = toSeconds(r.querySelector('input:nth-child(2)').value);
+      const text = r.querySelector('textarea').value.trim();
+      const seg = currentSegments[idx] || {};
+      out.push({id: seg.id, start: start, end: end, text: text});
     });
-    const resp = await fetch('/api/save_segments', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({path: path, segments: out})});
-    if(resp.ok){ alert('Saved'); } else { alert('Save failed'); }
+    const patch = buildPatch(out);
+    if(!patch.ops.length){ alert('Nothing to save'); return; }
+    const resp = await fetch('/api/patch_segments', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({path: path, base_rev: currentRev, ops: patch.ops})});
+    const j = await resp.json().catch(()=>({}));
+    if(resp.status === 409){
+      if(confirm('This file was changed elsewhere (now revision ' + j.rev + ') and your edits overlap. Reload it? Unsaved edits will be lost.')) await loadSelectedSrt();
+      return;
+    }
+    if(!resp.ok){ alert('Save failed' + (j.error ? ': ' + j.error : '')); return; }
+    patch.inserted.forEach(([i, tmp])=>{ out[i].id = j.assigned[tmp]; if(currentSegments[i]) currentSegments[i].id = out[i].id; });
+    currentRev = j.rev;
+    savedSegments = JSON.parse(JSON.stringify(out));
+    alert('Saved (revision ' + currentRev + ')');
   });
 
+  const restoreBtn = document.getElementById('restoreBtn');
+  if(restoreBtn){ restoreBtn.addEventListener('click', async ()=>{
+    const path = srtSelect.value;
+    if(!path) return;
+    const resp = await fetch('/api/backups?path=' + encodeURIComponent(path));
+    if(!resp.ok){ alert('Failed to load history'); return; }
+    const j = await resp.json();
+    const lines = (j.revisions || []).slice(0, 20).map(r=>{
+      const when = new Date(r.ts * 1000).toLocaleString();
+      const what = r.cues != null ? r.cues + ' cues' : [r.updated && r.updated + ' changed', r.inserted && r.inserted + ' added', r.deleted && r.deleted + ' removed'].filter(Boolean).join(', ');
+      return 'r' + r.rev + '  ' + when + '  ' + r.kind + (what ? ' (' + what + ')' : '');
+    });
+    const answer = prompt('Current revision: ' + j.rev + '\n' + lines.join('\n') + '\n\nRevision to restore:');
+    if(answer === null || answer.trim() === '') return;
+    const rev = parseInt(answer.replace(/^r/i, ''), 10);
+    if(isNaN(rev)){ alert('Not a revision number'); return; }
+    const r2 = await fetch('/api/restore', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({path: path, rev: rev})});
+    if(!r2.ok){ alert('Restore failed'); return; }
+    await loadSelectedSrt();
+  }); }
+
   // Undo button
   const undoBtn = document.getElementById('undoBtn');
   if(undoBtn){ undoBtn.addEventListener('click', ()=>{ if(undoStack.length>1){ undoStack.pop(); const prev = undoStack[undoStack.length-1]; currentSegments = JSON.parse(JSON.stringify(prev)); renderTimeline(); renderSegmentsList(); } else { alert('Nothing to undo'); } }); }